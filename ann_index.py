@@ -0,0 +1,215 @@
+import os
+import threading
+import weakref
+from cache_utils import diff_songs, splitmix64
+
+def default_probes():
+    """近似检索时探查的簇数，可通过 LYRICS_ANN_PROBES 设置"""
+    return int(os.environ.get('LYRICS_ANN_PROBES', 16))
+
+class SparseProjection:
+    """稀疏随机投影：把 TF-IDF 行降到 dim 维
+    - 每个词按哈希映射到 density 个维度，符号随机，无需保存投影矩阵
+    - 词表增长时新词的投影由列号确定，已有词不变
+    """
+
+    def __init__(self, dim=128, density=4, seed=0):
+        self.dim = dim
+        self.density = density
+        self.seed = seed
+        self._matrix = None
+
+    def matrix(self, n_terms):
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        if self._matrix is None or self._matrix.shape[0] != n_terms:
+            columns = np.repeat(np.arange(n_terms, dtype=np.uint64), self.density)
+            salt = np.tile(np.arange(self.density, dtype=np.uint64), n_terms)
+            hashes = splitmix64(columns * np.uint64(self.density) + salt + np.uint64(self.seed << 32))
+            dims = (hashes % np.uint64(self.dim)).astype(np.int64)
+            signs = np.where(hashes >> np.uint64(63), 1.0, -1.0).astype(np.float32) / np.sqrt(self.density)
+            self._matrix = csr_matrix((signs, (columns.astype(np.int64), dims)), shape=(n_terms, self.dim))
+        return self._matrix
+
+    def transform(self, matrix):
+        """返回 float32 稠密降维向量（行数 × dim）"""
+        import numpy as np
+
+        return np.asarray((matrix @ self.matrix(matrix.shape[1])).todense(), dtype=np.float32)
+
+class IVFIndex:
+    """基于倒排聚类（IVF）的近似最近邻索引
+    - 歌词先由 SimilarityIndex 得到 TF-IDF 行，再随机投影降维并归一化；
+      传入 EmbeddingIndex 时直接使用共享的歌词向量，不再投影
+    - 用球面 k-means 把降维向量分成约 sqrt(歌曲数) 个簇，每首歌只记录所属簇
+    - 查询时只探查与查询向量最接近的 probes 个簇，候选集再用精确余弦相似度重排
+    - probes 越大召回率越高、查询越慢
+    - 与歌曲库增量同步：新歌曲归入最近的簇，删除的歌曲先标记；歌曲数比上次聚类时翻倍后重新聚类
+    """
+
+    def __init__(self, index=None, dim=256, probes=None, n_clusters=None, sample_size=65536, seed=0):
+        import numpy as np
+        from similarity_index import SimilarityIndex
+
+        self.index = index if index is not None else SimilarityIndex()
+        self.probes = default_probes() if probes is None else probes
+        self.n_clusters = n_clusters
+        self.sample_size = sample_size
+        self.seed = seed
+        self.projection = SparseProjection(dim, seed=seed)
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self._fitted_size = 0
+        self._known = {}       # 歌曲id -> (歌词,)
+        self._ids = []         # 行号 -> 歌曲id
+        self._rows = {}        # 歌曲id -> 行号
+        self._clusters = np.zeros(0, dtype=np.int32)  # 行号 -> 簇编号
+        self._alive = np.zeros(0, dtype=bool)
+        self._members = None   # (按簇排序的行号, 每个簇的起始位置)
+        self._version = None   # 上次同步时相似度索引的版本
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def embed(self, matrix):
+        """TF-IDF 行降维并做L2归一化；稠密的行（已是歌词向量）只做归一化"""
+        import numpy as np
+        from scipy.sparse import issparse
+
+        embeddings = self.projection.transform(matrix) if issparse(matrix) else np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return embeddings / norms
+
+    def _fit(self, matrix, rows, iterations=10):
+        """在抽样的歌曲（matrix 中 rows 行）上做球面 k-means，得到簇中心"""
+        import numpy as np
+
+        rng = np.random.default_rng(self.seed)
+        n_rows = len(rows)
+        n_clusters = self.n_clusters or max(1, int(np.sqrt(n_rows)))
+        n_clusters = min(n_clusters, n_rows)
+        sample = np.sort(rng.choice(n_rows, min(n_rows, max(self.sample_size, n_clusters)), replace=False))
+        embeddings = self.embed(matrix[rows[sample]])
+        centroids = embeddings[rng.choice(len(sample), n_clusters, replace=False)]
+        for _ in range(iterations):
+            labels = (embeddings @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, embeddings)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # 空簇保留原中心
+            centroids = np.where(empty[:, None], centroids, sums / np.where(norms == 0, 1, norms))
+        self.centroids = centroids.astype(np.float32)
+        self._fitted_size = n_rows
+
+    def _assign(self, matrix, rows, chunk_size=8192):
+        """把 matrix 中 rows 行分到最近的簇，按块取行，不复制整个矩阵"""
+        import numpy as np
+
+        labels = [np.zeros(0, dtype=np.int32)]
+        for start in range(0, len(rows), chunk_size):
+            embeddings = self.embed(matrix[rows[start:start + chunk_size]])
+            labels.append((embeddings @ self.centroids.T).argmax(axis=1).astype(np.int32))
+        return np.concatenate(labels)
+
+    def sync(self, songs):
+        """与歌曲库同步（同时同步底层的 SimilarityIndex）"""
+        import numpy as np
+
+        version = self.index.sync(songs).version
+        if version == self._version:
+            # 相似度索引的内容摘要未变，歌曲库没有变化，不必再逐首比较
+            return self
+        changed, removed = diff_songs(self._known, songs)
+        self._version = version
+        if not changed and not removed:
+            return self
+        with self._lock:
+            for song_id in removed + [song['id'] for song in changed]:
+                row = self._rows.pop(song_id, None)
+                self._known.pop(song_id, None)
+                if row is not None:
+                    self._alive[row] = False
+            for song in changed:
+                self._known[song['id']] = (song['lyric'],)
+            matrix = self.index.matrix
+            if len(self._known) > 2 * self._fitted_size:
+                # 歌曲库规模翻倍，在全部歌曲上重新聚类
+                self._ids = list(self._known)
+                rows = self.index.rows(self._ids)
+                self._fit(matrix, rows)
+                self._clusters = self._assign(matrix, rows)
+                self._alive = np.ones(len(self._ids), dtype=bool)
+            else:
+                new_ids = [song['id'] for song in changed]
+                self._ids.extend(new_ids)
+                self._clusters = np.concatenate([self._clusters, self._assign(matrix, self.index.rows(new_ids))])
+                self._alive = np.concatenate([self._alive, np.ones(len(new_ids), dtype=bool)])
+                if len(self._ids) > 2 * len(self._known) + 1024:
+                    self._compact()
+            self._rows = {self._ids[i]: i for i in np.flatnonzero(self._alive).tolist()}
+            self._members = None
+        return self
+
+    def _compact(self):
+        import numpy as np
+
+        keep = np.flatnonzero(self._alive)
+        self._ids = [self._ids[i] for i in keep]
+        self._clusters = self._clusters[keep]
+        self._alive = np.ones(len(keep), dtype=bool)
+
+    def _cluster_members(self):
+        import numpy as np
+
+        if self._members is None:
+            order = np.argsort(self._clusters, kind='stable')
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(self._clusters, minlength=len(self.centroids)))])
+            self._members = (order, offsets)
+        return self._members
+
+    def candidates(self, vector, probes=None):
+        """
+        返回查询向量（1×词表大小的 TF-IDF 稀疏矩阵，或 1×dim 的歌词向量）的候选歌曲id列表
+
+        参数:
+        - probes: 探查的簇数，默认取实例设置
+        """
+        import numpy as np
+
+        probes = self.probes if probes is None else probes
+        with self._lock:
+            if not len(self.centroids) or not self._rows:
+                return []
+            similarity = (self.embed(vector) @ self.centroids.T)[0]
+            probes = min(max(probes, 1), len(similarity))
+            nearest = np.argpartition(-similarity, probes - 1)[:probes]
+            order, offsets = self._cluster_members()
+            rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in nearest.tolist()])
+            rows = np.sort(rows[self._alive[rows]])
+            return [self._ids[row] for row in rows.tolist()]
+
+    def search(self, song=None, text=None, top_k=10, probes=None, exclude=None):
+        """返回近似 top-k 相似歌曲 [(歌曲id, 余弦相似度), ...]，exclude 为需要排除的歌曲id"""
+        import numpy as np
+
+        vector = self.index.vector(song, text)
+        candidate_ids = [song_id for song_id in self.candidates(vector, probes) if song_id != exclude]
+        if not candidate_ids:
+            return []
+        scores = self.index.scores(song, text, rows=self.index.rows(candidate_ids))
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        return [(candidate_ids[i], float(scores[i])) for i in order]
+
+_ann_indexes = weakref.WeakKeyDictionary()
+_ann_lock = threading.Lock()
+
+def get_ann_index(index, **params):
+    """获取与某个 SimilarityIndex 绑定的近似最近邻索引，每个相似度索引只建立一次"""
+    with _ann_lock:
+        ann = _ann_indexes.get(index)
+        if ann is None:
+            ann = _ann_indexes[index] = IVFIndex(index, **params)
+        return ann
@@ -1,55 +1,379 @@
-from collections import defaultdict, Counter
-from style_classifier import classify_style, load_style_dict
-from lyrics_analyzer import extract_keywords
+import threading
+from collections import Counter
+from cache_utils import diff_songs
+from song_library import library_version
+from style_classifier import load_style_dict, style_model_version
+from style_store import get_style_store
+from lyrics_analyzer import KeywordEngine
+from token_cache import get_token_cache
+
+def summarize_artist(style_sum, total_songs, keyword_counter, style_dict):
+    """
+    根据歌手的风格分布之和、歌曲数和关键词计数得到统计结果
+
+    参数:
+    - style_sum: 该歌手所有歌曲风格分布之和，顺序与风格词典一致
+    - total_songs: 有效歌曲数
+    - keyword_counter: 关键词计数
+    - style_dict: 风格词典
+    """
+    from statistics import stdev
+
+    # 计算歌手整体风格分布：基于每首歌风格分布的平均值
+    style_proportions = {style: 0 for style in style_dict}
+    if total_songs > 0:
+        for style, value in zip(style_dict, style_sum):
+            style_proportions[style] = round(float(value) / total_songs * 100, 2)
+
+    # 计算主要风格和次要风格
+    sorted_styles = sorted(style_proportions.items(), key=lambda x: x[1], reverse=True)
+    primary_style = sorted_styles[0][0] if sorted_styles and sorted_styles[0][1] > 0 else "未知"
+    secondary_style = sorted_styles[1][0] if len(sorted_styles) > 1 and sorted_styles[1][1] > 0 else "无"
+
+    # 计算风格多样性指标（基于风格分布的标准差）
+    diversity = 0
+    if total_songs > 1:
+        style_values = [style_proportions[style] for style in style_dict if style_proportions[style] > 0]
+        diversity = round(stdev(style_values) if len(style_values) > 1 else 0, 2)
+
+    return {
+        'style_distribution': style_proportions,
+        'primary_style': primary_style,
+        'secondary_style': secondary_style,
+        'style_diversity': diversity,
+        'top_keywords': keyword_counter.most_common(20)
+    }
+
+def artist_keyword_counters(engine, song_ids, codes, n_artists, top_k=10, most_common=20):
+    """
+    每首歌取前 top_k 个关键词，按歌手计数
+
+    参数:
+    - engine: 已加入这些歌曲的关键词引擎
+    - song_ids: 歌曲id列表
+    - codes: 每首歌所属歌手的编号数组
+    - n_artists: 歌手数
+    - most_common: 每位歌手只保留计数最多的前若干个关键词
+
+    返回每位歌手的关键词计数 [Counter, ...]。关键词选取和 (歌手, 词) 分组计数都一次向量化完成；
+    同计数的词按首次出现的先后排列，most_common 的结果与逐首 Counter.update 一致
+    """
+    import numpy as np
+
+    positions, terms = engine.top_keyword_ids(song_ids, top_k)
+    counters = [Counter() for _ in range(n_artists)]
+    if not len(terms):
+        return counters
+    owners = np.asarray(codes, dtype=np.int64)[positions]
+    width = int(terms.max()) + 1
+    keys, first, counts = np.unique(owners * width + terms, return_index=True, return_counts=True)
+    artists = keys // width
+    order = np.lexsort((first, -counts, artists))
+    # 每位歌手内的名次，只保留前 most_common 个
+    sorted_artists = artists[order]
+    within = np.arange(len(order)) - np.searchsorted(sorted_artists, sorted_artists)
+    keep = order[within < most_common]
+    cache = get_token_cache()
+    for key, count in zip(keys[keep].tolist(), counts[keep].tolist()):
+        counters[key // width][cache.word(key % width)] = count
+    return counters
+
+def _artist_songs(artist_lyrics_dict):
+    """返回 (歌手列表, 有效歌曲列表（id为序号）, 每首歌所属歌手的编号数组)"""
+    import numpy as np
+
+    artists = list(artist_lyrics_dict)
+    songs = []
+    codes = []
+    for code, artist in enumerate(artists):
+        for lyrics in artist_lyrics_dict[artist]:
+            if lyrics.strip():  # 确保歌词不为空
+                songs.append({'id': len(songs), 'lyric': lyrics})
+                codes.append(code)
+    return artists, songs, np.asarray(codes, dtype=np.int64)
+
+def _statistics(artist_lyrics_dict, style_dict, engine, workers=None):
+    """
+    风格分布从风格得分库批量读取并按歌手求和，关键词由 engine 统一计算后按歌手向量化计数
+
+    engine 为 KeywordEngine：全量计算时在这些歌曲上拟合，分片计算时为固定了全语料IDF的引擎
+    """
+    import numpy as np
+
+    artists, songs, codes = _artist_songs(artist_lyrics_dict)
+    texts = [song['lyric'] for song in songs]
+
+    # 所有歌曲的风格分布一次性批量读取，按歌手分组求和
+    _, distributions = get_style_store().lookup(texts, style_dict)
+    style_sums = np.zeros((len(artists), len(style_dict)))
+    np.add.at(style_sums, codes, distributions)
+    song_counts = np.bincount(codes, minlength=len(artists))
+
+    engine.sync(songs, workers)
+    keywords = artist_keyword_counters(engine, [song['id'] for song in songs], codes, len(artists))
+    return {artist: summarize_artist(style_sums[code], int(song_counts[code]), keywords[code], style_dict)
+            for code, artist in enumerate(artists)}
 
 # 歌手倾向统计
-def artist_statistics(artist_lyrics_dict, style_dict):
+def artist_statistics(artist_lyrics_dict, style_dict, workers=None):
     """
     artist_lyrics_dict: {artist: [歌词1, 歌词2, ...]}
     style_dict: 风格词典
+    workers: 批量分词的进程数，默认取 LYRICS_SEG_WORKERS
     返回：每位歌手的风格分布和关键词分布
     """
-    from collections import Counter
-    from statistics import mean, stdev
-    
-    artist_stats = {}
-    for artist, lyrics_list in artist_lyrics_dict.items():
-        all_keywords = []
-        song_styles = []
-        style_distributions = []
-        for lyrics in lyrics_list:
-            if lyrics.strip():  # 确保歌词不为空
-                main_style, style_count = classify_style(lyrics, style_dict)
-                song_styles.append(main_style)  # 记录每首歌的主要风格
-                style_distributions.append(style_count)  # 记录每首歌的风格分布
-                # 提取关键词
-                keywords = extract_keywords([lyrics], top_k=10)[0]
-                all_keywords.extend(keywords)
-        keyword_counter = Counter(all_keywords)
-        
-        # 计算歌手整体风格分布：基于每首歌风格分布的平均值
-        style_proportions = {style: 0 for style in style_dict}
-        total_songs = len(style_distributions)
-        if total_songs > 0:
-            for style in style_dict:
-                style_proportions[style] = round(mean(dist[style] for dist in style_distributions) * 100, 2)
-        
-        # 计算主要风格和次要风格
-        sorted_styles = sorted(style_proportions.items(), key=lambda x: x[1], reverse=True)
-        primary_style = sorted_styles[0][0] if sorted_styles and sorted_styles[0][1] > 0 else "未知"
-        secondary_style = sorted_styles[1][0] if len(sorted_styles) > 1 and sorted_styles[1][1] > 0 else "无"
-        
-        # 计算风格多样性指标（基于风格分布的标准差）
-        diversity = 0
-        if total_songs > 1:
-            style_values = [style_proportions[style] for style in style_dict if style_proportions[style] > 0]
-            diversity = round(stdev(style_values) if len(style_values) > 1 else 0, 2)
-        
-        artist_stats[artist] = {
-            'style_distribution': style_proportions,
-            'primary_style': primary_style,
-            'secondary_style': secondary_style,
-            'style_diversity': diversity,
-            'top_keywords': keyword_counter.most_common(20)
-        }
-    return artist_stats
\ No newline at end of file
+    return _statistics(artist_lyrics_dict, style_dict, KeywordEngine(), workers)
+
+def shard_artists(artist_lyrics_dict, n_shards):
+    """
+    按歌词总长度把歌手分成至多 n_shards 组，返回 [[歌手, ...], ...]
+
+    采用最长处理时间优先的贪心分配：歌手按歌词总长度从大到小，依次放入当前负载最小的组，
+    避免少数作品很多的歌手集中在同一组。
+    """
+    import heapq
+
+    lengths = {artist: sum(len(lyrics) for lyrics in lyrics_list)
+               for artist, lyrics_list in artist_lyrics_dict.items()}
+    shards = [[] for _ in range(max(n_shards, 1))]
+    loads = [(0, i) for i in range(len(shards))]
+    for artist in sorted(lengths, key=lengths.get, reverse=True):
+        load, i = heapq.heappop(loads)
+        shards[i].append(artist)
+        heapq.heappush(loads, (load + lengths[artist], i))
+    return [shard for shard in shards if shard]
+
+# 统计进程池中每个子进程自己的 (关键词引擎, 风格词典)，由进程池的 initializer 设置
+_worker_state = None
+
+def _init_statistics_worker(corpus_df, style_dict):
+    global _worker_state
+    from startup import load_jieba
+
+    load_jieba().initialize()
+    _worker_state = (KeywordEngine(corpus_df), style_dict)
+
+def _statistics_shard(shard):
+    engine, style_dict = _worker_state
+    result = _statistics(dict(shard), style_dict, engine, workers=1)
+    # 进程池结束子进程时不执行 atexit，新分类的风格得分在每个分片后写回
+    get_style_store().flush()
+    return result
+
+def parallel_artist_statistics(artist_lyrics_dict, style_dict, workers=None, progress=None, shards_per_worker=4):
+    """
+    多进程计算歌手倾向统计，结果与 artist_statistics 完全一致，适合夜间全量重建
+
+    参数:
+    - artist_lyrics_dict: {artist: [歌词1, 歌词2, ...]}
+    - style_dict: 风格词典
+    - workers: 进程数，默认取 LYRICS_SEG_WORKERS 或CPU核数
+    - progress: 进度回调 progress(已完成歌手数, 歌手总数)
+    - shards_per_worker: 每个进程分到的分片数，分片越多负载越均衡、进度越细
+
+    关键词的IDF在全部歌曲上只拟合一次（分词本身多进程进行），经进程池的 initializer 传给各子进程；
+    歌手按歌词总长度均衡分片，每个分片的风格分布和关键词汇总都在子进程中完成。
+    子进程用 forkserver（不支持时用 spawn）启动。进程数为1时退化为单进程。
+    """
+    import multiprocessing
+    from token_cache import default_workers
+
+    workers = default_workers() if workers is None else workers
+    total = len(artist_lyrics_dict)
+    if workers <= 1 or total <= 1:
+        result = artist_statistics(artist_lyrics_dict, style_dict, workers)
+        if progress:
+            progress(total, total)
+        return result
+
+    _, songs, _ = _artist_songs(artist_lyrics_dict)
+    corpus_df = KeywordEngine().sync(songs, workers).corpus_df()
+    # 子进程从磁盘读取风格得分库，先写回本进程中尚未写盘的结果
+    get_style_store().flush()
+
+    shards = shard_artists(artist_lyrics_dict, workers * shards_per_worker)
+    tasks = [[(artist, artist_lyrics_dict[artist]) for artist in shard] for shard in shards]
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    result = {}
+    with multiprocessing.get_context(method).Pool(min(workers, len(tasks)), initializer=_init_statistics_worker,
+                                                  initargs=(corpus_df, style_dict)) as pool:
+        for partial in pool.imap_unordered(_statistics_shard, tasks):
+            result.update(partial)
+            if progress:
+                progress(len(result), total)
+    # 按输入顺序返回
+    return {artist: result[artist] for artist in artist_lyrics_dict}
+
+class ArtistStatsAggregator:
+    """增量维护的歌手倾向统计
+    - 每位歌手保存风格分布之和和有效歌曲数，关键词引擎随歌曲增量更新
+    - 新增、修改、删除歌曲时只更新该歌曲所属歌手的汇总值和引擎中的该歌曲
+    - 风格占比、主次风格和多样性在读取时由汇总值推导
+    - 关键词在读取时按当前语料的IDF选取（与 artist_statistics 一致），语料不变时复用上次的结果
+    - 风格词典变化时只从风格得分库重新读取分布，关键词不受影响
+    """
+
+    def __init__(self, style_dict=None):
+        self.style_dict = style_dict if style_dict is not None else load_style_dict()
+        self._style_version = style_model_version(self.style_dict)
+        self._songs = {}       # 歌曲id -> (歌手, 风格分布或None)
+        self._known = {}       # 歌曲id -> (歌手, 歌词)，用于 sync 判断是否修改
+        self._synced = None    # 上次同步时歌曲库的版本号
+        self._members = {}     # 歌手 -> {有效歌曲id: None}
+        self._order = {}       # 歌曲id -> 上次同步时在歌曲库中的位置，关键词计数按此顺序累加
+        self._style_sums = {}  # 歌手 -> 风格分布之和
+        self._counts = Counter()       # 歌手 -> 有效歌曲数
+        self._song_counts = Counter()  # 歌手 -> 歌曲数（含空歌词）
+        self._keywords = {}    # 歌手 -> 关键词计数，语料变化时清空
+        self._engine = KeywordEngine()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._songs)
+
+    def _distributions(self, lyrics_list):
+        import numpy as np
+
+        if not lyrics_list:
+            return np.zeros((0, len(self.style_dict)))
+        return get_style_store().lookup(lyrics_list, self.style_dict)[1]
+
+    def add(self, song_id, artist, lyric, distribution=None):
+        """新增或更新一首歌，distribution 为已批量查询好的风格分布（可选）"""
+        lyric = lyric or ''
+        valid = bool(lyric.strip())
+        if valid:
+            if distribution is None:
+                distribution = self._distributions([lyric])[0]
+            self._engine.add(song_id, lyric)
+        else:
+            distribution = None
+            self._engine.remove(song_id)
+        with self._lock:
+            self._remove(song_id)
+            self._synced = None
+            self._songs[song_id] = (artist, distribution)
+            self._known[song_id] = (artist, lyric)
+            self._song_counts[artist] += 1
+            self._members.setdefault(artist, {})
+            if valid:
+                self._members[artist][song_id] = None
+                self._style_sums[artist] = self._style_sums.get(artist, 0) + distribution
+                self._counts[artist] += 1
+            # 语料变化后IDF随之变化，所有歌手的关键词都需要重新选取
+            self._keywords = {}
+
+    def remove(self, song_id):
+        self._engine.remove(song_id)
+        with self._lock:
+            self._remove(song_id)
+            self._synced = None
+            self._keywords = {}
+
+    def _remove(self, song_id):
+        entry = self._songs.pop(song_id, None)
+        self._known.pop(song_id, None)
+        if entry is None:
+            return
+        artist, distribution = entry
+        self._members[artist].pop(song_id, None)
+        if distribution is not None:
+            self._style_sums[artist] = self._style_sums[artist] - distribution
+            self._counts[artist] -= 1
+        self._song_counts[artist] -= 1
+        if self._song_counts[artist] <= 0:
+            # 歌手的歌曲已全部删除
+            for table in (self._style_sums, self._counts, self._song_counts, self._members):
+                table.pop(artist, None)
+
+    def _restyle(self):
+        """风格词典变化后，按新词典重新汇总所有歌曲的风格分布"""
+        import numpy as np
+
+        with self._lock:
+            song_ids = [song_id for song_id, entry in self._songs.items() if entry[1] is not None]
+            lyrics_list = [self._known[song_id][1] for song_id in song_ids]
+        distributions = self._distributions(lyrics_list)
+        with self._lock:
+            self._style_sums = {}
+            for song_id, distribution in zip(song_ids, distributions):
+                artist = self._songs[song_id][0]
+                self._songs[song_id] = (artist, distribution)
+                self._style_sums[artist] = self._style_sums.get(artist, np.zeros(len(distribution))) + distribution
+
+    def sync(self, songs, style_dict=None, workers=None):
+        """
+        与歌曲库同步，只处理新增、修改和删除的歌曲
+
+        参数:
+        - songs: [{'id', 'artist', 'lyric'}, ...]
+        - style_dict: 风格词典，默认读取当前风格词典（文件修改后自动生效）
+        - workers: 新歌词批量分词的进程数
+        """
+        from token_cache import warm_tokens
+
+        style_dict = style_dict if style_dict is not None else load_style_dict()
+        version = style_model_version(style_dict)
+        if version != self._style_version:
+            self.style_dict = style_dict
+            self._style_version = version
+            self._restyle()
+
+        version = library_version(songs)
+        if version is not None and version == self._synced:
+            # 歌曲库自上次同步后没有修改，不必逐首比较
+            return self
+        changed, removed = diff_songs(self._known, songs, fields=('artist', 'lyric'))
+        if not changed and not removed:
+            self._synced = version
+            return self
+        for song_id in removed:
+            self.remove(song_id)
+        valid = [song for song in changed if (song['lyric'] or '').strip()]
+        # 新歌词的风格分布一次性批量查询，分词也先批量完成
+        distributions = self._distributions([song['lyric'] for song in valid])
+        warm_tokens([song['lyric'].lower() for song in valid], workers)
+        by_id = {song['id']: row for song, row in zip(valid, distributions)}
+        for song in changed:
+            self.add(song['id'], song['artist'], song['lyric'], by_id.get(song['id']))
+        with self._lock:
+            self._order = {song['id']: i for i, song in enumerate(songs)}
+        self._synced = version
+        return self
+
+    def artists(self):
+        return list(self._song_counts)
+
+    def _select_keywords(self, artists):
+        """按当前语料的IDF一次选出这些歌手所有歌曲的关键词并计数，写入 self._keywords"""
+        import numpy as np
+
+        song_ids = []
+        codes = []
+        for code, artist in enumerate(artists):
+            # 同计数的关键词按首次出现的先后排列，歌曲按歌曲库中的顺序累加
+            members = sorted(self._members.get(artist, ()),
+                             key=lambda song_id: self._order.get(song_id, len(self._order)))
+            song_ids.extend(members)
+            codes.extend([code] * len(members))
+        counters = artist_keyword_counters(self._engine, song_ids, np.asarray(codes, dtype=np.int64), len(artists))
+        self._keywords.update(zip(artists, counters))
+
+    def statistics(self, artist):
+        """返回单个歌手的统计结果，格式与 artist_statistics 中的每一项一致"""
+        import numpy as np
+
+        with self._lock:
+            if artist not in self._keywords:
+                self._select_keywords([artist])
+            style_sum = self._style_sums.get(artist)
+            if style_sum is None:
+                style_sum = np.zeros(len(self.style_dict))
+            return summarize_artist(style_sum, self._counts.get(artist, 0), self._keywords[artist], self.style_dict)
+
+    def all_statistics(self):
+        """返回所有歌手的统计结果，格式与 artist_statistics 一致"""
+        artists = self.artists()
+        with self._lock:
+            self._select_keywords([artist for artist in artists if artist not in self._keywords])
+        return {artist: self.statistics(artist) for artist in artists}
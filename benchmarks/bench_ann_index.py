@@ -0,0 +1,90 @@
+"""
+近似最近邻基准测试：比较精确相似歌曲查询与 IVF 近似查询在不同 probes 下的延迟和召回率
+
+用法:
+    python benchmarks/bench_ann_index.py [歌词JSON文件] [--songs N] [--queries Q] [--k K] [--probes 1 2 4 8 16 32]
+
+JSON文件格式与数据导出一致：[{"id": ..., "artist": ..., "title": ..., "lyric": ...}, ...]
+不提供文件时，按主题从词表中随机抽词生成歌词（同一主题的歌曲彼此相似）。
+召回率为近似结果中出现在精确 top-k 里的比例。每次查询的延迟是 get_similar_songs 的端到端耗时：
+歌曲库与页面中一样是 SongLibrary，歌曲库未修改时同步检查为 O(1)；
+加 --plain-list 时改用普通列表，每次查询都要逐首比较歌曲库，可用来对比同步检查本身的开销。
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import get_ann_index
+from recommender import get_similar_songs
+from similarity_index import SimilarityIndex
+from song_library import SongLibrary
+
+SYLLABLES = "天空海风雨夜城心梦光路花雪星月爱恋歌泪笑远方年少时间自由青春孤独温柔回忆等待离别"
+
+def synthetic_songs(n_songs, n_topics=200, vocabulary_size=20000, seed=42):
+    rng = random.Random(seed)
+    vocabulary = list({''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+                       for _ in range(vocabulary_size)})
+    # 每个主题偏好词表中的一小部分词
+    topics = [rng.sample(vocabulary, 60) for _ in range(n_topics)]
+    songs = []
+    for i in range(n_songs):
+        topic = topics[rng.randrange(n_topics)]
+        words = [rng.choice(topic) if rng.random() < 0.4 else rng.choice(vocabulary)
+                 for _ in range(rng.randint(60, 200))]
+        songs.append({'id': i, 'artist': f'歌手{i % 500}', 'title': f'歌曲{i}', 'lyric': ' '.join(words)})
+    return songs
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF 近似最近邻基准测试")
+    parser.add_argument('lyrics_file', nargs='?', help="歌词JSON文件（需包含 id）")
+    parser.add_argument('--songs', type=int, default=20000, help="随机生成的歌曲数量")
+    parser.add_argument('--queries', type=int, default=200, help="查询的基准歌曲数量")
+    parser.add_argument('--k', type=int, default=10, help="每次查询的推荐数量")
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64], help="要比较的 probes")
+    parser.add_argument('--plain-list', action='store_true', help="歌曲库用普通列表（每次查询逐首比较）")
+    args = parser.parse_args()
+
+    if args.lyrics_file:
+        with open(args.lyrics_file, 'r', encoding='utf-8') as f:
+            songs = json.load(f)
+    else:
+        songs = synthetic_songs(args.songs)
+    if not args.plain_list:
+        songs = SongLibrary(songs)
+    queries = random.Random(0).sample(songs, min(args.queries, len(songs)))
+
+    index = SimilarityIndex()
+    _, index_time = timed(lambda: index.sync(songs))
+    ann, ann_time = timed(lambda: get_ann_index(index).sync(songs))
+    print(f"歌曲数：{len(songs)}，词表：{len(index.vocabulary)}，簇数：{len(ann.centroids)}")
+    print(f"建立相似度索引 {index_time:8.2f} s | IVF 聚类 {ann_time:8.2f} s")
+
+    def run(**params):
+        return timed(lambda: [
+            [song_id for song_id, _ in get_similar_songs(song, songs, args.k, consider_style=False, index=index,
+                                                         return_scores=True, **params)]
+            for song in queries
+        ])
+
+    exact, exact_time = run()
+    print(f"[精确      ] 每次查询 {exact_time / len(queries) * 1000:8.2f} ms")
+    for probes in args.probes:
+        approximate, approximate_time = run(exact=False, probes=probes)
+        recall = sum(len(set(a) & set(e)) for a, e in zip(approximate, exact)) / max(
+            sum(len(e) for e in exact), 1)
+        print(f"[probes={probes:4d}] 每次查询 {approximate_time / len(queries) * 1000:8.2f} ms "
+              f"| 加速 {exact_time / max(approximate_time, 1e-9):6.2f}x | 召回率 {recall * 100:6.2f}%")
+
+if __name__ == '__main__':
+    main()
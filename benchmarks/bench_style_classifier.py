@@ -0,0 +1,86 @@
+"""
+风格分类基准测试：比较 TF-IDF 模式与词典自动机模式的速度和主风格一致率
+
+用法:
+    python benchmarks/bench_style_classifier.py [歌词JSON文件] [--songs N]
+
+JSON文件格式与数据导出一致：[{"artist": ..., "title": ..., "lyric": ...}, ...]
+不提供文件时，用风格词典中的词和常见字随机拼接生成歌词。
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from style_classifier import load_style_dict, get_style_model, classify_style
+from lyrics_analyzer import clean_lyrics
+
+FILLER = "的了是在不有这个们来到时大地为子中你说生国年着就那和要她出也得里后自以会"
+
+def synthetic_songs(style_dict, n_songs, seed=42):
+    rng = random.Random(seed)
+    styles = list(style_dict.values())
+    songs = []
+    for i in range(n_songs):
+        # 每首歌偏向一个风格，混入其他风格的词和无关字
+        favourite = styles[i % len(styles)]
+        lines = []
+        for _ in range(rng.randint(8, 24)):
+            parts = []
+            for _ in range(rng.randint(2, 5)):
+                roll = rng.random()
+                if roll < 0.35:
+                    parts.append(rng.choice(favourite))
+                elif roll < 0.5:
+                    parts.append(rng.choice(rng.choice(styles)))
+                else:
+                    parts.append(''.join(rng.choice(FILLER) for _ in range(rng.randint(1, 4))))
+            lines.append(''.join(parts))
+        songs.append({'artist': f'歌手{i % 50}', 'title': f'歌曲{i}', 'lyric': '\n'.join(lines)})
+    return songs
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="风格分类模式基准测试")
+    parser.add_argument('lyrics_file', nargs='?', help="歌词JSON文件")
+    parser.add_argument('--songs', type=int, default=2000, help="随机生成的歌曲数量")
+    parser.add_argument('--baseline', type=int, default=200, help="逐首调用 classify_style 的歌曲数量")
+    args = parser.parse_args()
+
+    style_dict = load_style_dict()
+    if args.lyrics_file:
+        with open(args.lyrics_file, 'r', encoding='utf-8') as f:
+            songs = json.load(f)
+    else:
+        songs = synthetic_songs(style_dict, args.songs)
+    texts = [clean_lyrics(song['lyric'], song.get('artist')) for song in songs]
+    print(f"歌曲数：{len(texts)}，平均长度：{sum(map(len, texts)) / max(len(texts), 1):.0f} 字")
+
+    results = {}
+    for mode in ('tfidf', 'automaton'):
+        _, compile_time = timed(lambda: get_style_model(style_dict, mode))
+        model = get_style_model(style_dict, mode)
+        (main_idx, _), run_time = timed(lambda: model.distributions(texts))
+        results[mode] = main_idx
+        print(f"[{mode:9s}] 编译 {compile_time * 1000:8.2f} ms | 批量分类 {run_time * 1000:8.2f} ms "
+              f"| 每首 {run_time / max(len(texts), 1) * 1e6:8.1f} µs")
+
+    # 逐首调用接口的开销，用于和页面中的循环调用对比
+    sample = texts[:args.baseline]
+    for mode in ('tfidf', 'automaton'):
+        _, run_time = timed(lambda: [classify_style(text, style_dict, mode=mode) for text in sample])
+        print(f"[{mode:9s}] 逐首 classify_style {len(sample)} 首：{run_time * 1000:8.2f} ms")
+
+    agreement = (results['tfidf'] == results['automaton']).mean() if len(texts) else 0
+    print(f"主风格一致率：{agreement * 100:.1f}%")
+
+if __name__ == '__main__':
+    main()
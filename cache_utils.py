@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import tempfile
+
+# 磁盘缓存目录，可通过环境变量 LYRICS_CACHE_DIR 修改
+CACHE_DIR = os.environ.get('LYRICS_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+def cache_path(name):
+    """返回缓存目录下的文件路径，必要时创建缓存目录"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+# 计算歌词内容哈希，作为内容寻址缓存的键
+def lyric_hash(text):
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+def splitmix64(x):
+    """对 uint64 数组逐元素做 SplitMix64 混合，得到分布均匀的64位哈希值"""
+    import numpy as np
+
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def load_json(path, default=None):
+    """读取JSON缓存文件，文件不存在或损坏时返回默认值"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        print(f"读取缓存文件失败：{path} - {e}")
+        return default
+
+def save_json(path, data):
+    """原子写入JSON缓存文件，避免多个进程同时写入时读到半截文件"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def diff_songs(known, songs, fields=('lyric',)):
+    """
+    对比索引中已记录的歌曲与当前歌曲库，用于增量维护各类索引
+
+    参数:
+    - known: 索引中记录的 {歌曲id: 字段值元组}
+    - songs: 当前歌曲字典列表
+    - fields: 参与比较的字段，任一字段变化即视为修改
+
+    返回:
+    (changed, removed)
+    - changed: 新增或修改过的歌曲列表
+    - removed: 已从歌曲库删除的歌曲id列表
+    """
+    changed = []
+    seen = set()
+    for song in songs:
+        song_id = song['id']
+        seen.add(song_id)
+        # 未修改的歌曲字段通常是同一个字符串对象，比较时直接命中身份判断
+        if known.get(song_id) != tuple(song.get(field) for field in fields):
+            changed.append(song)
+    removed = [song_id for song_id in known if song_id not in seen]
+    return changed, removed
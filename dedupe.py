@@ -0,0 +1,211 @@
+import os
+import hashlib
+import threading
+from cache_utils import diff_songs, splitmix64
+from song_library import library_version
+from lyrics_analyzer import iter_clean_lyrics
+from search_index import search_terms
+from token_cache import warm_tokens
+
+DUPLICATE_POLICIES = ('flag', 'skip', 'merge')
+
+def default_threshold():
+    """重复判定的相似度阈值（估计的 Jaccard 相似度），可通过 LYRICS_DEDUPE_THRESHOLD 设置"""
+    return float(os.environ.get('LYRICS_DEDUPE_THRESHOLD', 0.8))
+
+# add/query 未传入签名时的占位值（签名本身可能是 None）
+_NO_SIGNATURE = object()
+
+def _dedupe_text(lyric):
+    # 去掉时间编码、制作信息行和标点，重新上传的LRC与纯文本歌词得到相同的文本
+    return next(iter_clean_lyrics([lyric]), '').lower()
+
+def dedupe_texts(lyrics):
+    """重复检测实际分词的文本，批量导入前与其他歌词文本一起并行预热分词缓存"""
+    return [_dedupe_text(lyric) for lyric in lyrics]
+
+def shingles(lyric, size=3):
+    """歌词清洗、jieba分词后相邻 size 个词组成的词组集合；词数不足时整首作为一个词组"""
+    terms = search_terms(_dedupe_text(lyric))
+    if not terms:
+        return set()
+    if len(terms) <= size:
+        return {'\x00'.join(terms)}
+    return {'\x00'.join(terms[i:i + size]) for i in range(len(terms) - size + 1)}
+
+def _lsh_params(threshold, num_perm):
+    """
+    选择 LSH 分段数 bands 和每段行数 rows（bands * rows <= num_perm）
+
+    在相似度 [0, 1] 上数值积分，使阈值以下被选为候选的概率与阈值以上漏选的概率之和最小
+    """
+    import numpy as np
+
+    grid = np.linspace(0, 1, 201)
+    best, best_error = (1, num_perm), None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        probability = 1 - (1 - grid ** rows) ** bands
+        error = np.where(grid < threshold, probability, 1 - probability).mean()
+        if best_error is None or error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+class MinHashIndex:
+    """基于 MinHash 签名和 LSH 分段的近似重复歌词检测
+    - 每首歌的 jieba 词组集合压缩成 num_perm 个最小哈希值，签名相同位置的比例估计 Jaccard 相似度
+    - 签名切成 bands 段，每段一个哈希桶；只有至少一段完全相同的歌曲才作为候选，
+      插入和查询只访问 bands 个桶，与歌曲库大小无关
+    - 候选再用签名估计的相似度按 threshold 过滤
+    """
+
+    def __init__(self, threshold=None, num_perm=128, shingle_size=3, seed=0):
+        import numpy as np
+
+        self.threshold = default_threshold() if threshold is None else threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _lsh_params(self.threshold, num_perm)
+        self._seeds = np.random.default_rng(seed).integers(
+            0, 2 ** 63, size=(num_perm, 1), dtype=np.int64).astype(np.uint64)
+        self._signatures = {}  # 歌曲id -> 签名（uint64 数组）
+        self._buckets = [{} for _ in range(self.bands)]  # 每段：段内签名 -> 歌曲id集合
+        self._known = {}       # 歌曲id -> (歌词,)，用于 sync 判断是否修改
+        self._synced = None    # 上次同步时歌曲库的版本号
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._known)
+
+    def __contains__(self, song_id):
+        return song_id in self._known
+
+    def signature(self, lyric):
+        """歌词的 MinHash 签名，没有有效词组时返回 None"""
+        import numpy as np
+
+        words = shingles(lyric, self.shingle_size)
+        if not words:
+            return None
+        hashes = np.array([
+            int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+            for word in words
+        ], dtype=np.uint64)
+        return splitmix64(hashes[None, :] ^ self._seeds).min(axis=1)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [signature[i * rows:(i + 1) * rows].tobytes() for i in range(self.bands)]
+
+    def _similarity(self, a, b):
+        return float((a == b).mean())
+
+    def add(self, song_id, lyric, signature=_NO_SIGNATURE):
+        """新增或更新一首歌；signature 为已算好的 self.signature(lyric)，避免重复分词"""
+        if signature is _NO_SIGNATURE:
+            signature = self.signature(lyric)
+        with self._lock:
+            self._remove(song_id)
+            self._synced = None
+            self._known[song_id] = (lyric,)
+            if signature is None:
+                return
+            self._signatures[song_id] = signature
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                bucket.setdefault(key, set()).add(song_id)
+
+    def remove(self, song_id):
+        with self._lock:
+            self._remove(song_id)
+            self._synced = None
+
+    def _remove(self, song_id):
+        if self._known.pop(song_id, None) is None:
+            return
+        signature = self._signatures.pop(song_id, None)
+        if signature is None:
+            return
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            members = bucket.get(key)
+            if members is not None:
+                members.discard(song_id)
+                if not members:
+                    del bucket[key]
+
+    def sync(self, songs, workers=None):
+        """与歌曲库同步，只处理新增、修改和删除的歌曲，新歌词先多进程批量分词"""
+        version = library_version(songs)
+        if version is not None and version == self._synced:
+            # 歌曲库自上次同步后没有修改，不必逐首比较
+            return self
+        changed, removed = diff_songs(self._known, songs)
+        for song_id in removed:
+            self.remove(song_id)
+        warm_tokens([_dedupe_text(song.get('lyric')) for song in changed], workers)
+        for song in changed:
+            self.add(song['id'], song.get('lyric'))
+        self._synced = version
+        return self
+
+    def query(self, lyric, exclude=None, signature=_NO_SIGNATURE):
+        """
+        查找与歌词近似重复的歌曲；signature 为已算好的 self.signature(lyric)，
+        先查询再 add 同一首歌时只需计算一次签名
+
+        返回 [(歌曲id, 估计的相似度), ...]，按相似度降序，只包含不低于 threshold 的歌曲
+        """
+        if signature is _NO_SIGNATURE:
+            signature = self.signature(lyric)
+        if signature is None:
+            return []
+        with self._lock:
+            candidates = set()
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(bucket.get(key, ()))
+            candidates.discard(exclude)
+            matches = [(song_id, self._similarity(signature, self._signatures[song_id])) for song_id in candidates]
+        matches = [(song_id, score) for song_id, score in matches if score >= self.threshold]
+        matches.sort(key=lambda item: -item[1])
+        return matches
+
+    def duplicate_groups(self):
+        """
+        全库重复检测报告
+
+        返回重复歌曲分组 [[歌曲id, ...], ...]，组内两两之间经相似歌曲相连，按组大小降序；
+        只比较落在同一个哈希桶中的歌曲，每个桶的比较次数为 桶大小 × 桶内的组数
+        """
+        with self._lock:
+            parent = {}
+
+            def find(song_id):
+                root = parent.setdefault(song_id, song_id)
+                while parent[root] != root:
+                    root = parent[root]
+                while song_id != root:
+                    parent[song_id], song_id = root, parent[song_id]
+                return root
+
+            for bucket in self._buckets:
+                for members in bucket.values():
+                    if len(members) < 2:
+                        continue
+                    # 桶内每首歌只与桶中已出现的各组的代表歌曲比较，相似即并入该组；
+                    # 已在同一组的歌曲不再比较，全是重复歌曲的大桶只需线性次比较
+                    representatives = []
+                    for song_id in sorted(members, key=str):
+                        root = find(song_id)
+                        for representative in representatives:
+                            if find(representative) == root:
+                                break
+                            if self._similarity(self._signatures[representative],
+                                                self._signatures[song_id]) >= self.threshold:
+                                parent[root] = find(representative)
+                                break
+                        else:
+                            representatives.append(song_id)
+
+            groups = {}
+            for song_id in parent:
+                groups.setdefault(find(song_id), []).append(song_id)
+        return sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
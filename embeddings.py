@@ -0,0 +1,352 @@
+"""
+歌词的低维稠密向量（LSA）
+
+用法:
+    python embeddings.py 导出的歌词.json [--dim 256] [--output 路径前缀]
+
+对歌曲库的 TF-IDF 矩阵做截断SVD，每首歌降到 dim 维 float32 向量并做L2归一化。
+结果保存为 路径前缀.vectors.npy（歌曲向量）、路径前缀.components.npy（词 -> 向量的投影）
+和 路径前缀.json（词表、IDF、歌曲id和歌词指纹）。各进程以只读方式内存映射两个 .npy 文件，
+同一台机器上的所有进程共享操作系统的页缓存，每个会话不再各自保存稀疏 TF-IDF 矩阵。
+"""
+import os
+import json
+import threading
+from cache_utils import cache_path, diff_songs, load_json, lyric_hash, save_json
+from song_library import library_version
+
+_MASK = (1 << 64) - 1
+
+def default_embedding_path():
+    """歌词向量的默认路径前缀（缓存目录下的 lyric_embeddings），用到时才创建缓存目录"""
+    return cache_path('lyric_embeddings')
+
+# 相似歌曲推荐的相似度后端：'tfidf' 为会话内的 TF-IDF 索引，'embedding' 为离线拟合的歌词向量
+SIMILARITY_BACKENDS = ('tfidf', 'embedding')
+
+def default_similarity_backend():
+    """相似度后端，可通过 LYRICS_SIMILARITY_BACKEND 设置，默认 'tfidf'；无法识别的值按 'tfidf' 处理"""
+    backend = os.environ.get('LYRICS_SIMILARITY_BACKEND', 'tfidf')
+    return backend if backend in SIMILARITY_BACKENDS else 'tfidf'
+
+def default_embedding_dim():
+    """向量维数，可通过 LYRICS_EMBEDDING_DIM 设置"""
+    return int(os.environ.get('LYRICS_EMBEDDING_DIM', 256))
+
+def _normalize(vectors):
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+def _save_array(path, array):
+    import numpy as np
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+class LyricEmbeddings:
+    """离线拟合的歌词向量（只读，进程内所有会话共享）
+    - vectors: 歌曲数 × dim 的 float32 向量，行顺序与 ids 一致
+    - components: 词表大小 × dim 的投影，新歌词按 TF-IDF 行乘以投影得到向量
+    - fingerprints: 拟合时每首歌的歌词哈希，歌词修改后不再使用保存的向量
+    """
+
+    def __init__(self, ids, fingerprints, vocabulary, idf, components, vectors):
+        import numpy as np
+
+        self.ids = list(ids)
+        self.fingerprints = list(fingerprints)
+        self.vocabulary = {term: column for column, term in enumerate(vocabulary)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.components = components
+        self.vectors = vectors
+        self.positions = {song_id: i for i, song_id in enumerate(self.ids)}
+        self.version = lyric_hash(json.dumps([self.ids, self.fingerprints, self.dim], ensure_ascii=False))[:16]
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def save(self, path=None):
+        path = path or default_embedding_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _save_array(path + '.vectors.npy', self.vectors)
+        _save_array(path + '.components.npy', self.components)
+        # 元数据最后写入，读取方以它的修改时间判断是否需要重新加载
+        save_json(path + '.json', {
+            'ids': self.ids,
+            'fingerprints': self.fingerprints,
+            'vocabulary': sorted(self.vocabulary, key=self.vocabulary.get),
+            'idf': self.idf.tolist(),
+        })
+
+    @classmethod
+    def load(cls, path=None, mmap=True):
+        import numpy as np
+
+        path = path or default_embedding_path()
+        meta = load_json(path + '.json')
+        if meta is None:
+            raise FileNotFoundError(path + '.json')
+        mmap_mode = 'r' if mmap else None
+        return cls(
+            meta['ids'],
+            meta['fingerprints'],
+            meta['vocabulary'],
+            meta['idf'],
+            np.load(path + '.components.npy', mmap_mode=mmap_mode),
+            np.load(path + '.vectors.npy', mmap_mode=mmap_mode),
+        )
+
+    def embed(self, texts):
+        """把歌词列表转换成 len(texts) × dim 的归一化向量，不在词表中的词忽略"""
+        import numpy as np
+        from similarity_index import analyze
+
+        result = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            columns = [self.vocabulary[term] for term in analyze(text) if term in self.vocabulary]
+            if not columns:
+                continue
+            columns, counts = np.unique(np.asarray(columns, dtype=np.int64), return_counts=True)
+            weights = counts * self.idf[columns]
+            # 只读取用到的词所在的投影行
+            result[i] = (weights / np.linalg.norm(weights)) @ self.components[columns]
+        return _normalize(result)
+
+def fit_embeddings(songs, dim=None, index=None, seed=0):
+    """
+    对歌曲库拟合歌词向量
+
+    参数:
+    - songs: 歌曲字典列表，包含 'id'、'lyric'
+    - dim: 向量维数（建议128–256），默认取 default_embedding_dim()
+    - index: 已有的 SimilarityIndex，默认新建
+    - seed: 随机SVD的随机种子
+    """
+    import numpy as np
+    from sklearn.decomposition import TruncatedSVD
+    from similarity_index import SimilarityIndex
+
+    index = (index or SimilarityIndex()).sync(songs)
+    matrix = index.matrix.astype(np.float32)
+    dim = min(dim or default_embedding_dim(), max(1, min(matrix.shape) - 1))
+    svd = TruncatedSVD(n_components=dim, algorithm='randomized', random_state=seed)
+    vectors = _normalize(svd.fit_transform(matrix))
+    songs_by_id = {song['id']: song for song in songs}
+    return LyricEmbeddings(
+        index.ids,
+        [lyric_hash(songs_by_id[song_id]['lyric']) for song_id in index.ids],
+        sorted(index.vocabulary, key=index.vocabulary.get),
+        index.idf,
+        np.ascontiguousarray(svd.components_.T, dtype=np.float32),
+        vectors,
+    )
+
+class EmbeddingIndex:
+    """基于共享歌词向量的相似度索引，接口与 SimilarityIndex 一致
+    - 歌曲在向量文件中且歌词未修改时直接引用文件中的行，其他歌曲按投影实时计算向量（保存在会话中）
+    - 对全库打分时在内存映射的向量上做一次矩阵乘积，不复制向量
+    - 可传给 get_similar_songs(index=...) 和 IVFIndex，相似度为向量的余弦相似度
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self._sources = {}     # 歌曲id -> 文件中的行号，实时计算的歌曲为 -1
+        self._extra = {}       # 歌曲id -> 实时计算的向量
+        self._known = {}       # 歌曲id -> (歌词,)，用于 sync 判断是否修改
+        self._synced = None    # 上次同步时歌曲库的版本号
+        self._digests = {}
+        self._digest = 0
+        self._ids = []
+        self._positions = {}
+        self._rows = None      # 行号 -> 文件中的行号，实时计算的歌曲为 -(在 _extra_matrix 中的行号 + 1)
+        self._extra_matrix = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._known)
+
+    def __contains__(self, song_id):
+        return song_id in self._known
+
+    @property
+    def version(self):
+        return f"{self.embeddings.version}:{self._digest:016x}"
+
+    @property
+    def ids(self):
+        self._refresh()
+        return self._ids
+
+    def sync(self, songs):
+        """与歌曲库同步，只处理新增、修改和删除的歌曲"""
+        version = library_version(songs)
+        if version is not None and version == self._synced:
+            # 歌曲库自上次同步后没有修改，不必逐首比较
+            return self
+        changed, removed = diff_songs(self._known, songs)
+        if not changed and not removed:
+            self._synced = version
+            return self
+        embeddings = self.embeddings
+
+        def stored(song):
+            position = embeddings.positions.get(song['id'])
+            return position is not None and embeddings.fingerprints[position] == lyric_hash(song['lyric'])
+
+        # 不在向量文件中或歌词已修改的歌曲实时计算向量
+        computed = [song for song in changed if not stored(song)]
+        vectors = dict(zip((song['id'] for song in computed), embeddings.embed([song['lyric'] for song in computed])))
+        with self._lock:
+            for song_id in removed:
+                self._remove(song_id)
+            for song in changed:
+                song_id = song['id']
+                self._remove(song_id)
+                vector = vectors.get(song_id)
+                if vector is None:
+                    self._sources[song_id] = embeddings.positions[song_id]
+                else:
+                    self._sources[song_id] = -1
+                    self._extra[song_id] = vector
+                digest = int(lyric_hash(f"{song_id!r}\x00{song['lyric']}")[:16], 16)
+                self._known[song_id] = (song['lyric'],)
+                self._digests[song_id] = digest
+                self._digest = (self._digest + digest) & _MASK
+            self._rows = None
+        self._synced = version
+        return self
+
+    def _remove(self, song_id):
+        if self._known.pop(song_id, None) is None:
+            return
+        self._sources.pop(song_id)
+        self._extra.pop(song_id, None)
+        self._digest = (self._digest - self._digests.pop(song_id)) & _MASK
+        self._rows = None
+
+    def _refresh(self):
+        import numpy as np
+
+        with self._lock:
+            if self._rows is not None:
+                return
+            self._ids = list(self._sources)
+            self._positions = {song_id: i for i, song_id in enumerate(self._ids)}
+            extra_ids = list(self._extra)
+            extra_rows = {song_id: i for i, song_id in enumerate(extra_ids)}
+            self._rows = np.fromiter(
+                (source if source >= 0 else -(extra_rows[song_id] + 1) for song_id, source in self._sources.items()),
+                dtype=np.int64, count=len(self._sources))
+            self._extra_matrix = (np.stack([self._extra[song_id] for song_id in extra_ids]) if extra_ids
+                                  else np.zeros((0, self.embeddings.dim), dtype=np.float32))
+
+    @property
+    def matrix(self):
+        """按行号取向量的只读视图（matrix[行号数组] 返回 float32 数组），行顺序与 ids 一致，不复制整个矩阵"""
+        self._refresh()
+        return _RowView(self)
+
+    def _gather(self, rows):
+        import numpy as np
+
+        result = np.empty((len(rows), self.embeddings.dim), dtype=np.float32)
+        from_file = rows >= 0
+        result[from_file] = self.embeddings.vectors[rows[from_file]]
+        result[~from_file] = self._extra_matrix[-rows[~from_file] - 1]
+        return result
+
+    def vector(self, song=None, text=None):
+        """返回查询向量（1×dim）；已在索引中且歌词未修改的歌曲直接取其向量"""
+        self._refresh()
+        if song is not None and song.get('id') in self._positions and self._known[song['id']] == (song.get('lyric'),):
+            return self._gather(self._rows[[self._positions[song['id']]]])
+        if text is None:
+            text = song.get('lyric') if song is not None else ''
+        return self.embeddings.embed([text])
+
+    def rows(self, song_ids):
+        """返回歌曲id对应的行号数组"""
+        import numpy as np
+
+        self._refresh()
+        return np.fromiter((self._positions[song_id] for song_id in song_ids), dtype=np.int64, count=len(song_ids))
+
+    def scores(self, song=None, text=None, rows=None):
+        """返回查询与索引中每首歌（或 rows 指定的行）的余弦相似度数组，默认顺序与 ids 一致"""
+        import numpy as np
+
+        query = self.vector(song, text)[0]
+        self._refresh()
+        sources = self._rows if rows is None else self._rows[rows]
+        result = np.empty(len(sources), dtype=np.float32)
+        from_file = sources >= 0
+        if rows is None:
+            # 全库打分：在共享的向量上做一次乘积再按行号取出
+            result[from_file] = (self.embeddings.vectors @ query)[sources[from_file]]
+        else:
+            result[from_file] = self.embeddings.vectors[sources[from_file]] @ query
+        result[~from_file] = self._extra_matrix[-sources[~from_file] - 1] @ query
+        return result
+
+class _RowView:
+    """EmbeddingIndex.matrix：按需从共享向量和实时计算的向量中取出指定的行"""
+
+    def __init__(self, index):
+        self._index = index
+        self.shape = (len(index._rows), index.embeddings.dim)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        import numpy as np
+
+        return self._index._gather(np.atleast_1d(self._index._rows[rows]))
+
+_embeddings = {}
+_embeddings_lock = threading.Lock()
+
+def get_lyric_embeddings(path=None):
+    """读取内存映射的歌词向量（默认路径见 default_embedding_path），文件不存在时返回 None；文件更新后自动重新加载"""
+    path = path or default_embedding_path()
+    try:
+        mtime = os.path.getmtime(path + '.json')
+    except OSError:
+        return None
+    with _embeddings_lock:
+        cached = _embeddings.get(path)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = _embeddings[path] = (mtime, LyricEmbeddings.load(path))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"歌词向量加载失败：{e}")
+                return None
+        return cached[1]
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="拟合并保存歌词向量（LSA）")
+    parser.add_argument('lyrics_file', help="导出的歌词JSON文件（需包含 id）")
+    parser.add_argument('--dim', type=int, default=default_embedding_dim(), help="向量维数（建议128–256）")
+    parser.add_argument('--output', default=None, help="输出路径前缀，默认为缓存目录下的 lyric_embeddings")
+    args = parser.parse_args()
+
+    with open(args.lyrics_file, 'r', encoding='utf-8') as f:
+        songs = json.load(f)
+    embeddings = fit_embeddings(songs, dim=args.dim)
+    output = args.output or default_embedding_path()
+    embeddings.save(output)
+    print(f"已保存 {len(embeddings)} 首歌的 {embeddings.dim} 维向量到 {output}.vectors.npy")
+
+if __name__ == '__main__':
+    main()
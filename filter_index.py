@@ -0,0 +1,139 @@
+import threading
+from song_library import library_version
+
+class FilterIndex:
+    """歌手、风格筛选索引
+    - 每首歌占一行，行号 -> 歌手编号、风格编号（int32 数组），删除的行用布尔数组标记
+    - 筛选条件转换成编号集合，用 NumPy 一次得到布尔掩码，多个条件取交集
+    - 行的顺序与歌曲加入顺序一致，修改歌曲时原地更新，因此筛选结果保持歌曲库中的顺序
+    """
+
+    def __init__(self):
+        import numpy as np
+
+        self._ids = []          # 行号 -> 歌曲id
+        self._rows = {}         # 歌曲id -> 行号
+        self._known = {}        # 歌曲id -> (歌手, 风格)
+        self._artist_codes = np.zeros(0, dtype=np.int32)
+        self._style_codes = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self.artists = []       # 歌手编号 -> 歌手
+        self.styles = []        # 风格编号 -> 风格
+        self._artist_index = {}
+        self._style_index = {}
+        self._synced = None     # 上次同步时的 (歌曲库版本号, 风格缓存版本号)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _code(self, value, values, index):
+        if value is None:
+            return -1
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(values)
+            values.append(value)
+        return code
+
+    def sync(self, songs, styles=None):
+        """
+        与歌曲库同步，只更新新增、修改和删除的歌曲
+
+        参数:
+        - songs: 歌曲字典列表
+        - styles: 可选的 {歌曲id: 风格}（如会话中的风格缓存），默认取歌曲的 'style' 字段
+        """
+        import numpy as np
+
+        version = (library_version(songs), getattr(styles, 'version', None) if styles is not None else 0)
+        if None not in version and version == self._synced:
+            # 歌曲库和风格缓存自上次同步后都没有修改，不必逐首比较
+            return self
+        with self._lock:
+            seen = set()
+            added = []
+            for song in songs:
+                song_id = song['id']
+                seen.add(song_id)
+                style = styles.get(song_id) if styles is not None else song.get('style')
+                key = (song.get('artist'), style)
+                if self._known.get(song_id) == key:
+                    continue
+                self._known[song_id] = key
+                artist_code = self._code(key[0], self.artists, self._artist_index)
+                style_code = self._code(style, self.styles, self._style_index)
+                row = self._rows.get(song_id)
+                if row is None:
+                    added.append((song_id, artist_code, style_code))
+                else:
+                    self._artist_codes[row] = artist_code
+                    self._style_codes[row] = style_code
+            removed = [song_id for song_id in self._known if song_id not in seen]
+            for song_id in removed:
+                del self._known[song_id]
+                self._alive[self._rows.pop(song_id)] = False
+            if added:
+                for song_id, _, _ in added:
+                    self._rows[song_id] = len(self._ids)
+                    self._ids.append(song_id)
+                self._artist_codes = np.concatenate([self._artist_codes, np.array([a for _, a, _ in added], dtype=np.int32)])
+                self._style_codes = np.concatenate([self._style_codes, np.array([s for _, _, s in added], dtype=np.int32)])
+                self._alive = np.concatenate([self._alive, np.ones(len(added), dtype=bool)])
+            if len(self._ids) > 2 * len(self._rows) + 1024:
+                self._compact()
+            self._synced = version
+        return self
+
+    def _compact(self):
+        import numpy as np
+
+        keep = np.flatnonzero(self._alive)
+        self._ids = [self._ids[i] for i in keep]
+        self._rows = {song_id: i for i, song_id in enumerate(self._ids)}
+        self._artist_codes = self._artist_codes[keep]
+        self._style_codes = self._style_codes[keep]
+        self._alive = np.ones(len(keep), dtype=bool)
+
+    def mask(self, artists=None, styles=None, artist_contains=None):
+        """
+        返回满足全部条件的行的布尔掩码
+
+        参数:
+        - artists: 歌手集合（精确匹配），None 或空表示不限
+        - styles: 风格集合，None 或空表示不限
+        - artist_contains: 歌手名需包含的子串
+        """
+        import numpy as np
+
+        mask = self._alive.copy()
+        if artists:
+            codes = [self._artist_index[a] for a in artists if a in self._artist_index]
+            mask &= np.isin(self._artist_codes, codes)
+        if artist_contains:
+            codes = [code for code, a in enumerate(self.artists) if artist_contains in (a or '')]
+            mask &= np.isin(self._artist_codes, codes)
+        if styles:
+            codes = [self._style_index[s] for s in styles if s in self._style_index]
+            mask &= np.isin(self._style_codes, codes)
+        return mask
+
+    def ids(self, mask=None, **conditions):
+        """返回满足条件的歌曲id列表，顺序与歌曲库一致；可直接传入 mask 或筛选条件"""
+        import numpy as np
+
+        if mask is None:
+            mask = self.mask(**conditions)
+        return [self._ids[row] for row in np.flatnonzero(mask).tolist()]
+
+    def count(self, mask=None, **conditions):
+        if mask is None:
+            mask = self.mask(**conditions)
+        return int(mask.sum())
+
+    def style_names(self):
+        """当前歌曲库中出现过的风格"""
+        import numpy as np
+
+        codes = np.unique(self._style_codes[self._alive])
+        return [self.styles[code] for code in codes.tolist() if code >= 0]
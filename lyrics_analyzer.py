@@ -1,14 +1,34 @@
-import jieba
-from sklearn.feature_extraction.text import TfidfVectorizer
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import numpy as np
-import os
 import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from cache_utils import diff_songs, lyric_hash
+from song_library import library_version
+from token_cache import get_token_cache, warm_tokens
+from startup import load_jieba
 
-# 分词函数
+# 分词函数，结果由共享分词缓存按歌词内容哈希复用
 def tokenize(text):
-    return list(jieba.cut(text))
+    return get_token_cache().tokens(text)
+
+# TF-IDF关键词提取（与 jieba.analyse.extract_tags 结果一致，分词结果走共享缓存）
+def extract_tags(text, topK=20, withWeight=False):
+    load_jieba()
+    import jieba.analyse
+
+    tfidf = jieba.analyse.default_tfidf
+    freq = {}
+    for word in tokenize(text):
+        if len(word.strip()) < 2 or word.lower() in tfidf.stop_words:
+            continue
+        freq[word] = freq.get(word, 0.0) + 1.0
+    total = sum(freq.values())
+    for word in freq:
+        freq[word] *= tfidf.idf_freq.get(word, tfidf.median_idf) / total
+    tags = sorted(freq.items(), key=lambda x: x[1], reverse=True)
+    if topK:
+        tags = tags[:topK]
+    return tags if withWeight else [word for word, _ in tags]
 
 # 读取歌词文本（支持文件和直接文本）
 def read_lyrics(files=None, text=None):
@@ -21,70 +41,277 @@ def read_lyrics(files=None, text=None):
         lyrics_list.append(text)
     return lyrics_list
 
+# numpy 只在关键词引擎首次使用时导入一次，模块导入保持轻量
+@lru_cache(maxsize=None)
+def _np():
+    import numpy
+    return numpy
+
+class KeywordEngine:
+    """语料级TF-IDF关键词引擎
+    - 整个语料只统计一次词频和文档频率，新增、修改、删除歌曲时增量更新
+    - 每首歌保存为稀疏行（词编号、词频），IDF在查询时按当前文档频率计算
+    - 单首或多首歌曲的 top-k 关键词用 argpartition 选取，不做稠密化
+    - 可传入另一个引擎导出的 corpus_df() 固定IDF，多进程分片计算关键词时各进程共用同一语料的IDF
+    """
+
+    def __init__(self, corpus_df=None):
+        np = _np()
+
+        self._rows = {}     # 文档id -> (词编号数组, 词频数组)
+        self._known = {}    # 文档id -> (歌词,)，用于 sync 判断是否修改
+        self._synced = None  # 上次同步时歌曲库的版本号
+        self._df = np.zeros(0)
+        self._fixed = None  # 固定的 (按词编号的文档频率, 文档总数)，为 None 时按本引擎中的歌曲计算
+        self._lock = threading.Lock()
+        if corpus_df is not None:
+            frequencies, n_docs = corpus_df
+            cache = get_token_cache()
+            ids = cache.intern_all(frequencies)
+            df = np.zeros(cache.vocabulary_size)
+            df[ids] = list(frequencies.values())
+            self._fixed = (df, n_docs)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._rows
+
+    def _row(self, text):
+        np = _np()
+
+        # 与 TfidfVectorizer(tokenizer=tokenize) 一致：先转小写再分词
+        ids = np.frombuffer(get_token_cache().token_ids((text or '').lower()), dtype=np.uint32)
+        terms, counts = np.unique(ids, return_counts=True)
+        return terms.astype(np.int64), counts.astype(float)
+
+    def add(self, doc_id, text):
+        """新增或更新一首歌"""
+        np = _np()
+
+        terms, counts = self._row(text)
+        with self._lock:
+            self._remove(doc_id)
+            self._synced = None
+            size = get_token_cache().vocabulary_size
+            if size > len(self._df):
+                self._df = np.concatenate([self._df, np.zeros(size - len(self._df))])
+            self._df[terms] += 1
+            self._rows[doc_id] = (terms, counts)
+            self._known[doc_id] = (text,)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+            self._synced = None
+
+    def _remove(self, doc_id):
+        row = self._rows.pop(doc_id, None)
+        self._known.pop(doc_id, None)
+        if row is not None:
+            self._df[row[0]] -= 1
+
+    def sync(self, songs, workers=None):
+        """与歌曲库同步，只处理新增、修改和删除的歌曲，新歌词先多进程批量分词"""
+        version = library_version(songs)
+        if version is not None and version == self._synced:
+            # 歌曲库自上次同步后没有修改，不必逐首比较
+            return self
+        changed, removed = diff_songs(self._known, songs)
+        warm_tokens([(song['lyric'] or '').lower() for song in changed], workers)
+        for doc_id in removed:
+            self.remove(doc_id)
+        for song in changed:
+            self.add(song['id'], song['lyric'])
+        self._synced = version
+        return self
+
+    def corpus_df(self):
+        """返回当前语料的文档频率 ({词: 文档数}, 文档总数)，可传给其他进程中的 KeywordEngine(corpus_df=...)"""
+        np = _np()
+
+        with self._lock:
+            ids = np.flatnonzero(self._df > 0)
+            counts = self._df[ids]
+            n_docs = len(self._rows)
+        cache = get_token_cache()
+        return {cache.word(word_id): int(count) for word_id, count in zip(ids.tolist(), counts.tolist())}, n_docs
+
+    def _idf(self, terms):
+        np = _np()
+
+        df, n_docs = self._fixed if self._fixed is not None else (self._df, len(self._rows))
+        # 固定语料中没有的词（编号超出范围）文档频率为0
+        frequencies = np.zeros(len(terms))
+        inside = terms < len(df)
+        frequencies[inside] = df[terms[inside]]
+        return np.log((1 + n_docs) / (1 + frequencies)) + 1
+
+    def _weights(self, doc_id):
+        np = _np()
+
+        terms, counts = self._rows[doc_id]
+        weights = counts * self._idf(terms)
+        norm = np.linalg.norm(weights)
+        return terms, weights / norm if norm > 0 else weights
+
+    @staticmethod
+    def _top(terms, weights, top_k):
+        """
+        按权重降序取 top-k；同权重时按词的字符串降序
+
+        TfidfVectorizer 的特征按词排序，在其行上做稳定的 argsort()[::-1] 时并列的词即按此顺序排列。
+        原实现使用 NumPy 默认的非稳定排序，截断处并列词的先后由排序实现决定，
+        因此截断处并列的词可能与原实现取舍不同（其余关键词及顺序一致）
+        """
+        np = _np()
+
+        if top_k is not None and top_k < len(weights):
+            # 先用 argpartition 取第 k 大的权重，再保留所有不低于它的词（含并列），并列的词由下面的排序决定取舍
+            threshold = weights[np.argpartition(-weights, top_k - 1)[top_k - 1]]
+            candidates = np.flatnonzero(weights >= threshold)
+        else:
+            candidates = np.arange(len(weights))
+        cache = get_token_cache()
+        words = [cache.word(int(terms[i])) for i in candidates]
+        order = sorted(range(len(candidates)), key=words.__getitem__, reverse=True)
+        order.sort(key=lambda j: -weights[candidates[j]])
+        return [(words[j], float(weights[candidates[j]])) for j in order[:top_k] if weights[candidates[j]] > 0]
+
+    def top_keywords(self, doc_id, top_k=20, with_weight=False):
+        """返回一首歌的 top-k 关键词"""
+        with self._lock:
+            if doc_id not in self._rows:
+                return []
+            terms, weights = self._weights(doc_id)
+        result = self._top(terms, weights, top_k)
+        return result if with_weight else [word for word, _ in result]
+
+    def top_keyword_ids(self, doc_ids, top_k=10):
+        """
+        向量化地批量选取多首歌各自的 top-k 关键词，结果与逐首调用 top_keywords 一致
+
+        返回 (positions, terms) 两个数组：terms[i] 为关键词的词编号，positions[i] 为其所属歌曲在 doc_ids 中的下标；
+        同一首歌的关键词按权重降序相邻排列，不在引擎中的歌曲没有关键词
+        """
+        np = _np()
+
+        with self._lock:
+            positions = [position for position, doc_id in enumerate(doc_ids) if doc_id in self._rows]
+            rows = [self._rows[doc_ids[position]] for position in positions]
+            if not rows:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            terms = np.concatenate([row[0] for row in rows])
+            # 每行的归一化不改变行内顺序，直接按未归一化的 TF-IDF 排序
+            weights = np.concatenate([row[1] for row in rows]) * self._idf(terms)
+        lengths = np.array([len(row[0]) for row in rows])
+        owners = np.repeat(np.asarray(positions, dtype=np.int64), lengths)
+
+        # 同权重时按词的字符串降序（与 _top 一致），先求出现过的词的字符串排名
+        vocabulary, inverse = np.unique(terms, return_inverse=True)
+        cache = get_token_cache()
+        words = [cache.word(int(term)) for term in vocabulary]
+        rank = np.empty(len(words), dtype=np.int64)
+        rank[sorted(range(len(words)), key=words.__getitem__)] = np.arange(len(words))
+
+        order = np.lexsort((-rank[inverse], -weights, owners))
+        within = np.arange(len(order)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        keep = order[within < top_k]
+        return owners[keep], terms[keep]
+
+    def top_keywords_for(self, doc_ids, top_k=20, with_weight=False):
+        """返回多首歌（如某位歌手的全部作品）合并后的 top-k 关键词，按各歌归一化权重求和"""
+        np = _np()
+
+        with self._lock:
+            rows = [self._weights(doc_id) for doc_id in doc_ids if doc_id in self._rows]
+        if not rows:
+            return []
+        terms = np.concatenate([row[0] for row in rows])
+        weights = np.concatenate([row[1] for row in rows])
+        unique_terms, inverse = np.unique(terms, return_inverse=True)
+        result = self._top(unique_terms, np.bincount(inverse, weights=weights), top_k)
+        return result if with_weight else [word for word, _ in result]
+
 # TF-IDF关键词提取
 def extract_keywords(lyrics_list, top_k=20):
     # 检查输入是否为空或只包含空字符串
     if not lyrics_list or all(not lyric.strip() for lyric in lyrics_list):
         return [[] for _ in lyrics_list]
-        
-    vectorizer = TfidfVectorizer(tokenizer=tokenize)
-    tfidf = vectorizer.fit_transform(lyrics_list)
-    keywords = []
-    for i, row in enumerate(tfidf):
-        row_data = row.toarray().flatten()
-        indices = np.argsort(row_data)[::-1][:top_k]
-        words = [vectorizer.get_feature_names_out()[idx] for idx in indices if row_data[idx] > 0]
-        keywords.append(words)
-    return keywords
-
-# 生成词云图片
-def generate_wordcloud(text, font_path='msyh.ttc', output_file=None, artist=None):
+
+    # 对本次输入的歌词一次性建立关键词引擎
+    warm_tokens([lyrics.lower() for lyrics in lyrics_list])
+    engine = KeywordEngine()
+    for i, lyrics in enumerate(lyrics_list):
+        engine.add(i, lyrics)
+    return [engine.top_keywords(i, top_k) for i in range(len(lyrics_list))]
+
+# 生成词云图片，直接返回PNG字节（不创建matplotlib图像），结果按内容缓存
+def generate_wordcloud(text, font_path=None, output_file=None, artist=None):
+    from wordcloud_service import get_wordcloud_png
+
     # 生成词云前先过滤歌手等信息
-    text = clean_lyrics(text, artist)
-    wc = WordCloud(font_path=font_path, width=800, height=400, background_color='white').generate(text)
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.imshow(wc, interpolation='bilinear')
-    ax.axis('off')
+    png = get_wordcloud_png('text', artist, lyric_hash(text or ''), lambda: count_words([text], artist), font_path)
     if output_file:
-        fig.savefig(output_file, bbox_inches='tight')
-    return fig
+        with open(output_file, 'wb') as f:
+            f.write(png)
+    return png
+
+# 整行包含这些关键词的行视为无关信息（作词、作曲等）
+IGNORE_FIELDS = ["作词", "作曲", "-", "(Live)", "(", ")", "曲", "词", "编曲", 
+                 "录音室", "录音", "混音", "制作", "监制", "演唱", "歌手", 
+                 "Artist", "纯音乐", "无歌词", "Instrumental"]
+
+# 预编译的清洗正则
+_IGNORE_RE = re.compile('|'.join(re.escape(field) for field in IGNORE_FIELDS))
+_TIMESTAMP_RE = re.compile(r'\[\d{2}:\d{2}\.\d{2,}\]')   # 歌词时间编码 [00:00.00]
+_SYMBOL_RE = re.compile(r'[^\w\s\u4e00-\u9fff]')        # 保留中文、英文、数字和空格
+_SPACE_RE = re.compile(r'\s+')
+
+# 不缓存清洗结果：整首歌词作为缓存键会常驻内存，预编译的正则已足够快
+def _clean_text(text, artist=None):
+    # 过滤掉包含特定关键词的整行和空行
+    filtered_lines = [
+        line for line in text.splitlines()
+        if line.strip() and not _IGNORE_RE.search(line) and not (artist and artist in line)
+    ]
+    if not filtered_lines:
+        return ''
+    text = '\n'.join(filtered_lines)
+    text = _TIMESTAMP_RE.sub('', text)
+    text = _SYMBOL_RE.sub(' ', text)
+    text = _SPACE_RE.sub(' ', text)
+    return text.strip()
 
 def clean_lyrics(text, artist=None):
     # 检查输入是否为空
     if not text or not isinstance(text, str):
         return "示例歌词"  # 返回一个默认文本，避免后续处理出错
-    
-    # 过滤掉包含特定关键词的整行
-    ignore_fields = ["作词", "作曲", "-", "(Live)", "(", ")", "曲", "词", "编曲", 
-                    "录音室", "录音", "混音", "制作", "监制", "演唱", "歌手", 
-                    "Artist", "纯音乐", "无歌词", "Instrumental"]
-    if artist and isinstance(artist, str):
-        ignore_fields.append(artist)
-    
-    lines = text.splitlines()
-    filtered_lines = []
-    for line in lines:
-        # 整行包含无关信息则过滤
-        if any(field in line for field in ignore_fields):
-            continue
-        # 过滤空行
-        if line.strip():
-            filtered_lines.append(line)
-    
-    # 如果过滤后没有内容，返回默认文本
-    if not filtered_lines:
-        return "示例歌词"
-    
-    text = '\n'.join(filtered_lines)
-    
-    # 去除歌词时间编码 [00:00.00]
-    text = re.sub(r'\[\d{2}:\d{2}\.\d{2,}\]', '', text)
-    
-    # 去除其他常见的无关字符
-    text = re.sub(r'[^\w\s\u4e00-\u9fff]', ' ', text)  # 保留中文、英文、数字和空格
-    
-    # 去除多余空白
-    text = re.sub(r'\s+', ' ', text)
-    
-    result = text.strip()
-    return result if result else "示例歌词"
\ No newline at end of file
+    if not isinstance(artist, str):
+        artist = None
+    # 过滤后没有内容时返回默认文本
+    return _clean_text(text, artist or None) or "示例歌词"
+
+# 流式清洗：逐首清洗歌词，跳过清洗后为空的歌词，不拼接成一个大字符串
+def iter_clean_lyrics(texts, artist=None):
+    if not isinstance(artist, str):
+        artist = None
+    for text in texts:
+        if text and isinstance(text, str):
+            cleaned = _clean_text(text, artist or None)
+            if cleaned:
+                yield cleaned
+
+# 按各分析器实际查询的文本预热分词缓存：关键词引擎和BM25检索用小写歌词，词频统计和词云用清洗后的歌词；
+# extra 为其他需要一并分词的文本（如重复检测的文本），在同一批并行分词中完成
+def warm_lyrics(lyrics, workers=None, extra=()):
+    lyrics = [lyric for lyric in lyrics if lyric and isinstance(lyric, str)]
+    return warm_tokens([lyric.lower() for lyric in lyrics] + list(iter_clean_lyrics(lyrics)) + list(extra), workers)
+
+# 流式词频统计：逐首清洗、分词（走共享分词缓存）并累加到计数器
+def count_words(texts, artist=None, min_length=2):
+    word_freq = Counter()
+    for cleaned in iter_clean_lyrics(texts, artist):
+        word_freq.update(word for word in tokenize(cleaned) if len(word) >= min_length)
+    return word_freq
\ No newline at end of file
@@ -1,9 +1,14 @@
 import streamlit as st
 import time
+from startup import warm_up_in_background
+from song_library import check_song_library
+
+# 后台预热jieba词典，首页渲染不必等待分析模块加载
+warm_up_in_background()
 
 # 初始化session state
-if 'song_db' not in st.session_state:
-    st.session_state['song_db'] = []
+# 歌曲库带修改版本号，各类索引在歌曲库未修改时不再逐首比较
+check_song_library(st.session_state)
 if 'delete_flags' not in st.session_state:
     st.session_state['delete_flags'] = {}
 if 'highlight_imports' not in st.session_state:
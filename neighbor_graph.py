@@ -0,0 +1,235 @@
+"""
+离线预计算的相似歌曲近邻图
+
+用法:
+    python neighbor_graph.py 导出的歌词.json [--k 10] [--memory-mb 256] [--output 路径]
+
+JSON文件为数据导入导出页面导出的歌曲列表（包含 id）。近邻图默认保存在缓存目录的
+neighbor_graph.npz，智能推荐页面读取后即可在 O(k) 内给出基于歌曲的推荐。
+"""
+import os
+import json
+import threading
+from cache_utils import cache_path, lyric_hash
+
+STYLE_BOOST = 1.2  # 相同风格的歌曲得分提高20%
+
+def default_graph_path():
+    """近邻图的默认保存路径（缓存目录下的 neighbor_graph.npz），用到时才创建缓存目录"""
+    return cache_path('neighbor_graph.npz')
+
+def song_fingerprint(song):
+    """歌词和风格的内容指纹，任一变化都说明近邻图中的这首歌已过期"""
+    return lyric_hash(json.dumps([song.get('lyric'), song.get('style')], ensure_ascii=False))
+
+class NeighborGraph:
+    """每首歌的 top-k 相似歌曲
+    - neighbors/scores: 不考虑风格时的近邻行号（int32）和相似度（float32）
+    - style_neighbors/style_scores: 相同风格加权后的近邻
+    - 行号对应 ids，fingerprints 记录建图时每首歌的内容指纹
+    """
+
+    def __init__(self, ids, fingerprints, neighbors, scores, style_neighbors, style_scores):
+        self.ids = list(ids)
+        self.fingerprints = list(fingerprints)
+        self.neighbors = neighbors
+        self.scores = scores
+        self.style_neighbors = style_neighbors
+        self.style_scores = style_scores
+        self._positions = {song_id: i for i, song_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    def save(self, path=None):
+        import numpy as np
+
+        path = path or default_graph_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            ids=np.array([json.dumps(song_id) for song_id in self.ids]),
+            fingerprints=np.array(self.fingerprints),
+            neighbors=self.neighbors,
+            scores=self.scores,
+            style_neighbors=self.style_neighbors,
+            style_scores=self.style_scores,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=None):
+        import numpy as np
+
+        path = path or default_graph_path()
+        with np.load(path) as data:
+            return cls(
+                [json.loads(song_id) for song_id in data['ids'].tolist()],
+                data['fingerprints'].tolist(),
+                data['neighbors'],
+                data['scores'],
+                data['style_neighbors'],
+                data['style_scores'],
+            )
+
+    def lookup(self, base_song, songs_by_id, n_recommendations=5, consider_style=True, with_scores=False):
+        """
+        从近邻图读取推荐结果
+
+        返回推荐歌曲列表（with_scores 为 True 时返回 [(歌曲id, 得分), ...]）；
+        基准歌曲不在图中、内容已修改或有效近邻不足时返回 None，由调用方实时计算
+        """
+        position = self._positions.get(base_song['id'])
+        if position is None or self.fingerprints[position] != song_fingerprint(base_song):
+            return None
+        boosted = consider_style and base_song.get('style') is not None
+        row = (self.style_neighbors if boosted else self.neighbors)[position]
+        scores = (self.style_scores if boosted else self.scores)[position]
+        result = []
+        complete = True
+        for neighbor, score in zip(row.tolist(), scores.tolist()):
+            song = songs_by_id.get(self.ids[neighbor])
+            if song is None or song_fingerprint(song) != self.fingerprints[neighbor]:
+                # 近邻已删除或修改
+                complete = False
+                continue
+            result.append((song['id'], score) if with_scores else song)
+            if len(result) == n_recommendations:
+                return result
+        # 图中保存了除自身外的全部歌曲时，不足 n 首也是完整结果
+        if complete and self.k == len(self.ids) - 1:
+            return result
+        return None
+
+def _row_top_k(block, k):
+    """按行取 top-k：argpartition 选出候选，再按得分降序、行号升序排序"""
+    import numpy as np
+
+    if k < block.shape[1]:
+        part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        part.sort(axis=1)
+    else:
+        part = np.tile(np.arange(block.shape[1]), (block.shape[0], 1))
+    values = np.take_along_axis(block, part, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+def _chunk_starts(row_costs, budget):
+    """按每行的内存估计把行切成连续的块，每块的总量不超过预算（至少一行），返回各块的起始行和末尾"""
+    import numpy as np
+
+    cumulative = np.cumsum(row_costs)
+    starts = [0]
+    while starts[-1] < len(row_costs):
+        used = cumulative[starts[-1] - 1] if starts[-1] else 0
+        stop = int(np.searchsorted(cumulative, used + budget, side='right'))
+        starts.append(max(stop, starts[-1] + 1))
+    return starts
+
+def build_neighbor_graph(songs, k=10, memory_budget=256 * 1024 * 1024, index=None, progress=None):
+    """
+    计算每首歌的 top-k 相似歌曲
+
+    参数:
+    - songs: 歌曲字典列表，包含 'id'、'lyric'，可选 'style'
+    - k: 每首歌保存的近邻数
+    - memory_budget: 分块计算时每块的内存上限（字节），包括稀疏乘积和稠密得分块
+    - index: 已有的 SimilarityIndex，默认新建
+    - progress: 进度回调 progress(已完成行数, 总行数)
+
+    相似度与 get_similar_songs 一致（TF-IDF余弦相似度，相同风格乘以1.2），
+    按行分块计算稀疏矩阵乘积，块的大小按稀疏乘积的非零元估计和稠密得分矩阵一起计入内存预算。
+    """
+    import numpy as np
+    from similarity_index import SimilarityIndex
+
+    index = (index or SimilarityIndex()).sync(songs)
+    songs_by_id = {song['id']: song for song in songs}
+    ids = index.ids
+    matrix = index.matrix.astype(np.float32)
+    n_songs = len(ids)
+    k = max(min(k, n_songs - 1), 0)
+
+    # 风格编码，-1 表示没有风格字段
+    style_codes = {}
+    styles = np.array([
+        -1 if songs_by_id[song_id].get('style') is None
+        else style_codes.setdefault(songs_by_id[song_id]['style'], len(style_codes))
+        for song_id in ids
+    ], dtype=np.int32)
+
+    neighbors = np.zeros((n_songs, k), dtype=np.int32)
+    scores = np.zeros((n_songs, k), dtype=np.float32)
+    style_neighbors = np.zeros((n_songs, k), dtype=np.int32)
+    style_scores = np.zeros((n_songs, k), dtype=np.float32)
+
+    # 每行约占用：稠密的得分、加权得分（float32）和 argpartition 的下标（int64），
+    # 加上稀疏乘积的非零元（值 float32、列号 int32），非零元数按该行各词的文档频率之和估计上界
+    column_counts = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    product_nnz = np.bincount(np.repeat(np.arange(n_songs), np.diff(matrix.indptr)),
+                              weights=column_counts[matrix.indices], minlength=n_songs)
+    row_costs = n_songs * 16 + np.minimum(product_nnz, n_songs) * 8
+    matrix_t = matrix.T.tocsc()
+    starts = _chunk_starts(row_costs, memory_budget) if k else [0]
+    for start, stop in zip(starts[:-1], starts[1:]):
+        block = (matrix[start:stop] @ matrix_t).toarray()
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = -np.inf  # 排除自身
+        neighbors[start:stop], scores[start:stop] = _row_top_k(block, k)
+
+        same_style = (styles[start:stop, None] == styles[None, :]) & (styles[None, :] >= 0)
+        np.multiply(block, STYLE_BOOST, out=block, where=same_style)
+        style_neighbors[start:stop], style_scores[start:stop] = _row_top_k(block, k)
+        if progress:
+            progress(stop, n_songs)
+
+    fingerprints = [song_fingerprint(songs_by_id[song_id]) for song_id in ids]
+    return NeighborGraph(ids, fingerprints, neighbors, scores, style_neighbors, style_scores)
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+def get_neighbor_graph(path=None):
+    """读取近邻图（默认路径见 default_graph_path），文件不存在时返回 None；文件更新后自动重新加载"""
+    path = path or default_graph_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _graphs_lock:
+        cached = _graphs.get(path)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = _graphs[path] = (mtime, NeighborGraph.load(path))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"近邻图加载失败：{e}")
+                return None
+        return cached[1]
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="预计算相似歌曲近邻图")
+    parser.add_argument('lyrics_file', help="导出的歌词JSON文件（需包含 id）")
+    parser.add_argument('--k', type=int, default=10, help="每首歌保存的近邻数")
+    parser.add_argument('--memory-mb', type=int, default=256, help="分块计算的内存上限（MB）")
+    parser.add_argument('--output', default=None, help="输出文件路径，默认为缓存目录下的 neighbor_graph.npz")
+    args = parser.parse_args()
+
+    with open(args.lyrics_file, 'r', encoding='utf-8') as f:
+        songs = json.load(f)
+    graph = build_neighbor_graph(
+        songs, k=args.k, memory_budget=args.memory_mb * 1024 * 1024,
+        progress=lambda done, total: print(f"\r{done}/{total}", end='', flush=True),
+    )
+    output = args.output or default_graph_path()
+    graph.save(output)
+    print(f"\n已保存 {len(graph)} 首歌的近邻图到 {output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 import streamlit as st
 import time
-from lyrics_analyzer import clean_lyrics
-from style_classifier import load_style_dict, classify_style
+from style_store import fill_style_cache, check_style_cache_version
+from filter_index import FilterIndex
+from song_library import SongLibrary, check_song_library
 
 st.set_page_config(
     page_title="歌词管理", 
@@ -54,8 +55,7 @@ st.markdown("""
 st.title("📝 歌词管理")
 
 # 初始化session state（如果需要）
-if 'song_db' not in st.session_state:
-    st.session_state['song_db'] = []
+check_song_library(st.session_state)
 if 'delete_flags' not in st.session_state:
     st.session_state['delete_flags'] = {}
 if 'highlight_imports' not in st.session_state:
@@ -64,17 +64,21 @@ if 'editing_song' not in st.session_state:
     st.session_state['editing_song'] = None
 if 'cache_styles' not in st.session_state:
     st.session_state['cache_styles'] = {}
+if 'filter_index' not in st.session_state:
+    st.session_state['filter_index'] = FilterIndex()
+# 风格词典修改后，会话中的风格缓存随之失效
+check_style_cache_version(st.session_state)
 
 def mark_delete(song_id, flag):
     st.session_state['delete_flags'][song_id] = flag
 
 def save_deletions():
-    st.session_state['song_db'] = [s for s in st.session_state['song_db'] if not st.session_state['delete_flags'].get(s['id'], False)]
+    st.session_state['song_db'] = SongLibrary(s for s in st.session_state['song_db'] if not st.session_state['delete_flags'].get(s['id'], False))
     st.session_state['delete_flags'] = {}
     st.rerun()
 
 def delete_song(song_id):
-    st.session_state['song_db'] = [s for s in st.session_state['song_db'] if s['id'] != song_id]
+    st.session_state['song_db'] = SongLibrary(s for s in st.session_state['song_db'] if s['id'] != song_id)
     st.session_state['cache_styles'].pop(song_id, None)
     st.rerun()
 
@@ -82,12 +86,8 @@ def edit_song(song_id):
     st.session_state['editing_song'] = song_id
 
 def save_edit(song_id, new_artist, new_title, new_lyric):
-    for song in st.session_state['song_db']:
-        if song['id'] == song_id:
-            song['artist'] = new_artist
-            song['title'] = new_title
-            song['lyric'] = new_lyric
-            break
+    # 经 update_song 修改，歌曲库的版本号随之更新，各索引下次同步时能发现这首歌
+    st.session_state['song_db'].update_song(song_id, artist=new_artist, title=new_title, lyric=new_lyric)
     st.session_state['editing_song'] = None
     st.session_state['cache_styles'].pop(song_id, None)
 
@@ -107,6 +107,12 @@ st.markdown("""
 
 # 歌词列表视图
 if st.session_state['song_db']:
+    # 从共享的风格得分库补全风格缓存，只对新增或修改过的歌曲批量分类
+    fill_style_cache(st.session_state['song_db'], st.session_state['cache_styles'])
+    # 筛选索引随歌曲库和风格缓存增量同步
+    filter_index = st.session_state['filter_index'].sync(
+        st.session_state['song_db'], st.session_state['cache_styles'])
+
     # 搜索和过滤功能
     col1, col2 = st.columns([2, 2])
     with col1:
@@ -114,7 +120,7 @@ if st.session_state['song_db']:
     with col2:
         style_filter = st.selectbox(
             "按风格筛选",
-            ["全部"] + list(set(st.session_state['cache_styles'].values())),
+            ["全部"] + filter_index.style_names(),
             index=0
         )
     
@@ -122,18 +128,18 @@ if st.session_state['song_db']:
     if st.button("删除所选"):
         save_deletions()
 
+    # 风格过滤在筛选索引上完成，只遍历符合条件的歌曲
+    if style_filter == "全部":
+        visible_songs = st.session_state['song_db']
+    else:
+        songs_by_id = {song['id']: song for song in st.session_state['song_db']}
+        visible_songs = [songs_by_id[song_id] for song_id in filter_index.ids(styles=[style_filter])]
+
     # 显示歌词列表
-    for song in st.session_state['song_db']:
+    for song in visible_songs:
         # 搜索过滤
         if search_term and not any(search_term.lower() in x.lower() for x in [song['artist'], song['title'], song['lyric']]):
             continue
-            
-        # 风格过滤
-        if song['id'] not in st.session_state['cache_styles']:
-            cleaned_lyric = clean_lyrics(song['lyric'], song['artist'])
-            st.session_state['cache_styles'][song['id']] = classify_style(cleaned_lyric, load_style_dict())[0]
-        if style_filter != "全部" and st.session_state['cache_styles'][song['id']] != style_filter:
-            continue
 
         with st.container():
             st.markdown("---")
@@ -1,15 +1,13 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 from collections import Counter
-import matplotlib.pyplot as plt
-from wordcloud import WordCloud
-import jieba.analyse
-from lyrics_analyzer import clean_lyrics
-from style_classifier import classify_style, load_style_dict
-import matplotlib as mpl
+from lyrics_analyzer import extract_tags
+from term_store import TermFrequencyStore
+from artist_stats import ArtistStatsAggregator
+from wordcloud_service import get_wordcloud_png
+from style_classifier import load_style_dict
+from style_store import fill_style_cache, check_style_cache_version
+from song_library import check_song_library
 import platform
-import os
 
 st.set_page_config(
     page_title="歌词分析", 
@@ -59,8 +57,10 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 设置matplotlib中文字体
-def set_matplotlib_chinese_font():
+# 按需导入matplotlib并设置中文字体（pandas、numpy、matplotlib都在用到它们的选项卡中才导入）
+def get_pyplot():
+    import matplotlib.pyplot as plt
+
     if platform.system() == "Windows":
         # Windows系统使用微软雅黑
         plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
@@ -72,106 +72,34 @@ def set_matplotlib_chinese_font():
         plt.rcParams['font.sans-serif'] = ['WenQuanYi Micro Hei']
     
     plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+    return plt
 
-# 初始化matplotlib中文字体
-set_matplotlib_chinese_font()
 st.title("📊 歌词分析")
 
 # 初始化session state
-if 'song_db' not in st.session_state:
-    st.session_state['song_db'] = []
+check_song_library(st.session_state)
 if 'cache_analysis' not in st.session_state:
     st.session_state['cache_analysis'] = {}
-
-def get_all_lyrics():
-    """获取所有歌词文本"""
-    return [song['lyric'] for song in st.session_state['song_db']]
+if 'cache_styles' not in st.session_state:
+    st.session_state['cache_styles'] = {}
+if 'term_store' not in st.session_state:
+    st.session_state['term_store'] = TermFrequencyStore()
+if 'artist_stats' not in st.session_state:
+    st.session_state['artist_stats'] = ArtistStatsAggregator()
+# 风格词典修改后，会话中的风格缓存随之失效
+check_style_cache_version(st.session_state)
 
 def get_all_artists():
     """获取所有歌手"""
     return list(set(song['artist'] for song in st.session_state['song_db']))
 
-def create_word_cloud(text):
-    """生成词云图"""
-    # 检查输入文本
-    if not text or len(text.strip()) < 2:
-        raise ValueError("输入文本过短，无法生成词云")
-
-    # 使用jieba分词
-    words = jieba.lcut(text)
-    # 过滤掉单字词和停用词
-    words = [word for word in words if len(word) > 1]
-    
-    if not words:
-        raise ValueError("分词结果为空，无法生成词云")
-    
-    # 将词语重新组合
-    text = " ".join(words)
-    
-    # 根据不同操作系统选择合适的字体
-    if platform.system() == "Windows":
-        font_paths = [
-            'C:/Windows/Fonts/simhei.ttf',  # 黑体
-            'C:/Windows/Fonts/msyh.ttc',    # 微软雅黑
-            'C:/Windows/Fonts/simsun.ttc'   # 宋体
-        ]
-    elif platform.system() == "Darwin":
-        font_paths = [
-            '/System/Library/Fonts/PingFang.ttc',
-            '/System/Library/Fonts/STHeiti Light.ttc'
-        ]
-    else:
-        font_paths = [
-            '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
-            '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf'
-        ]
-    
-    # 尝试不同的字体
-    font_path = None
-    for path in font_paths:
-        if os.path.exists(path):
-            font_path = path
-            break
-    
-    try:
-        wordcloud = WordCloud(
-            font_path=font_path if font_path else None,
-            width=800,
-            height=400,
-            background_color='white',
-            max_words=200,
-            max_font_size=150,
-            random_state=42,
-            min_word_length=2,  # 最小词长度
-            collocations=False  # 避免重复词语
-        )
-        
-        # 生成词云
-        wordcloud.generate(text)
-        return wordcloud
-        
-    except FileNotFoundError:
-        st.warning("未找到合适的中文字体，尝试使用系统默认字体")
-        # 使用默认字体
-        wordcloud = WordCloud(
-            width=800,
-            height=400,
-            background_color='white',
-            max_words=200,
-            max_font_size=150,
-            random_state=42,
-            min_word_length=2,
-            collocations=False
-        )
-        wordcloud.generate(text)
-        return wordcloud
-    except Exception as e:
-        raise Exception(f"生成词云时出错: {str(e)}")
-
 # 检查是否有数据
 if not st.session_state['song_db']:
     st.info("暂无歌词数据。请在'数据导入导出'页面添加歌词。")
 else:
+    # 词频库与歌曲库增量同步：只对新增、修改、删除的歌曲重新统计
+    term_store = st.session_state['term_store'].sync(st.session_state['song_db'])
+
     # 创建分析面板
     tab1, tab2, tab3, tab4 = st.tabs([
         "词频统计 📈", 
@@ -181,6 +109,8 @@ else:
     ])
 
     with tab1:
+        import pandas as pd
+        plt = get_pyplot()
         st.subheader("词频统计分析")
         
         # 选择分析范围
@@ -192,29 +122,17 @@ else:
 
         if analysis_scope == "按歌手筛选":
             selected_artist = st.selectbox("选择歌手", get_all_artists())
-            lyrics_to_analyze = [
-                song['lyric'] for song in st.session_state['song_db']
-                if song['artist'] == selected_artist
-            ]
+            scope_artist = selected_artist
         else:
-            lyrics_to_analyze = get_all_lyrics()
+            scope_artist = None
 
         # 词频分析
-        if lyrics_to_analyze:
-            # 合并所有歌词并清洗
-            combined_lyrics = " ".join(lyrics_to_analyze)
-            cleaned_lyrics = clean_lyrics(combined_lyrics)
+        if scope_artist is None or term_store.song_count(scope_artist):
+            # 直接读取词频库中预先合并好的词频（已过滤单字词），不再重新分词
+            word_freq = term_store.frequencies(scope_artist)
             
             # 统计词频
-            if cleaned_lyrics and cleaned_lyrics != "示例歌词":
-                words = jieba.lcut(cleaned_lyrics)
-                word_freq = Counter()
-                
-                # 过滤掉单字词和停用词，并添加到Counter中
-                for word, freq in Counter(words).items():
-                    if len(word) > 1:
-                        word_freq[word] = freq
-                
+            if term_store.document_count(scope_artist):
                 if word_freq:
                     # 展示词频统计
                     df = pd.DataFrame(
@@ -252,6 +170,7 @@ else:
                 st.warning("请先输入或选择要分析的歌词")
 
     with tab2:
+        import pandas as pd
         st.subheader("词云可视化")
         
         # 词云生成选项
@@ -267,37 +186,32 @@ else:
                 get_all_artists(),
                 key="cloud_artist"
             )
-            lyrics_for_cloud = " ".join([
-                song['lyric'] for song in st.session_state['song_db']
-                if song['artist'] == selected_artist
-            ])
+            cloud_artist = selected_artist
         else:
-            lyrics_for_cloud = " ".join(get_all_lyrics())
+            cloud_artist = None
 
-        if lyrics_for_cloud:
+        if cloud_artist is None or term_store.song_count(cloud_artist):
             with st.spinner("正在生成词云..."):
                 try:
-                    # 清洗歌词文本
-                    cleaned_lyrics = clean_lyrics(lyrics_for_cloud)
-                    
                     # 检查清洗后的文本是否为空
-                    if not cleaned_lyrics or cleaned_lyrics == "示例歌词":
+                    if not term_store.document_count(cloud_artist):
                         st.warning("清洗后的歌词文本为空，无法生成词云。请尝试其他歌词。")
                     else:
                         try:
-                            # 生成词云
-                            wordcloud = create_word_cloud(cleaned_lyrics)
+                            # 生成词云：按 (范围, 歌手, 语料内容摘要, 字体) 缓存PNG，切换回看过的歌手时直接命中；
+                            # 词频只在未命中时才读取和过滤
+                            png = get_wordcloud_png(
+                                cloud_scope,
+                                cloud_artist,
+                                term_store.version(cloud_artist),
+                                lambda: term_store.frequencies(cloud_artist)
+                            )
+                            word_counts = term_store.frequencies(cloud_artist)
                             
                             # 显示词云图
-                            fig, ax = plt.subplots(figsize=(10, 5))
-                            ax.imshow(wordcloud, interpolation='bilinear')
-                            ax.axis('off')
-                            st.pyplot(fig)
-                            plt.close()
+                            st.image(png, use_container_width=True)
                             
                             # 显示词频统计
-                            words = jieba.lcut(cleaned_lyrics)
-                            word_counts = Counter([w for w in words if len(w) > 1])
                             if word_counts:
                                 st.write("### 词频统计")
                                 word_df = pd.DataFrame(word_counts.most_common(15), columns=['词语', '出现次数'])
@@ -313,6 +227,8 @@ else:
                     st.error(f"处理歌词时出错: {str(e)}")
 
     with tab3:
+        import pandas as pd
+        plt = get_pyplot()
         st.subheader("TF-IDF关键词分析")
         
         # 选择分析对象
@@ -332,7 +248,7 @@ else:
                 song = st.session_state['song_db'][song_idx]
                 
                 # 提取关键词
-                keywords = jieba.analyse.extract_tags(
+                keywords = extract_tags(
                     song['lyric'],
                     topK=10,
                     withWeight=True
@@ -362,7 +278,7 @@ else:
                 ])
                 
                 # 提取关键词
-                keywords = jieba.analyse.extract_tags(
+                keywords = extract_tags(
                     artist_lyrics,
                     topK=15,
                     withWeight=True
@@ -386,17 +302,17 @@ else:
                     plt.close()
 
     with tab4:
+        import numpy as np
+        plt = get_pyplot()
         st.subheader("歌词风格分布分析")
         
         # 计算所有歌词的风格
         style_dict = load_style_dict()
         
-        # 统计风格分布
-        style_stats = Counter()
-        for song in st.session_state['song_db']:
-            cleaned_lyric = clean_lyrics(song['lyric'], song['artist'])
-            style = classify_style(cleaned_lyric, style_dict)[0]
-            style_stats[style] += 1
+        # 统计风格分布：从共享的风格得分库读取，只对未缓存的歌曲批量分类
+        cache_styles = fill_style_cache(st.session_state['song_db'], st.session_state['cache_styles'], style_dict)
+        main_styles = np.array([cache_styles[song['id']] for song in st.session_state['song_db']], dtype=object)
+        style_stats = Counter(main_styles.tolist())
         
         # 创建风格分布图表
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
@@ -427,16 +343,12 @@ else:
         
         if selected_artist:
             # 统计该歌手的风格分布
-            artist_style_stats = Counter()
-            artist_songs = [
-                song for song in st.session_state['song_db']
-                if song['artist'] == selected_artist
-            ]
-            
-            for song in artist_songs:
-                cleaned_lyric = clean_lyrics(song['lyric'], song['artist'])
-                style = classify_style(cleaned_lyric, style_dict)[0]
-                artist_style_stats[style] += 1
+            # 复用上面的批量分类结果，按歌手掩码筛选
+            artist_mask = np.array([
+                song['artist'] == selected_artist
+                for song in st.session_state['song_db']
+            ])
+            artist_style_stats = Counter(main_styles[artist_mask].tolist())
             
             # 创建该歌手的风格分布图表
             fig, ax = plt.subplots(figsize=(10, 6))
@@ -448,4 +360,15 @@ else:
             plt.xticks(rotation=45, ha='right')
             
             st.pyplot(fig)
-            plt.close()
\ No newline at end of file
+            plt.close()
+            
+            # 歌手倾向统计：与歌曲库增量同步，只更新新增、修改、删除歌曲所属的歌手
+            artist_stats = st.session_state['artist_stats'].sync(st.session_state['song_db'], style_dict)
+            stats = artist_stats.statistics(selected_artist)
+            col1, col2, col3 = st.columns(3)
+            col1.metric("主要风格", stats['primary_style'])
+            col2.metric("次要风格", stats['secondary_style'])
+            col3.metric("风格多样性", stats['style_diversity'])
+            keywords = [word for word, _ in stats['top_keywords'] if word.strip()]
+            if keywords:
+                st.write("常用关键词：" + "、".join(keywords))
\ No newline at end of file
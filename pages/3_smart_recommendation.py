@@ -1,10 +1,13 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-import numpy as np
 from recommender import get_similar_songs
-from style_classifier import classify_style, load_style_dict
-from lyrics_analyzer import clean_lyrics
+from similarity_index import SimilarityIndex
+from embeddings import EmbeddingIndex, default_similarity_backend, get_lyric_embeddings
+from neighbor_graph import get_neighbor_graph
+from filter_index import FilterIndex
+from recommendation_cache import get_recommendation_cache
+from style_store import fill_style_cache, check_style_cache_version
+from song_library import check_song_library
 import requests
 
 st.set_page_config(
@@ -67,19 +70,29 @@ st.markdown("""
 st.title("🎵 智能推荐")
 
 # 初始化session state
-if 'song_db' not in st.session_state:
-    st.session_state['song_db'] = []
+check_song_library(st.session_state)
 if 'recommendation_history' not in st.session_state:
     st.session_state['recommendation_history'] = []
 if 'cache_styles' not in st.session_state:
     st.session_state['cache_styles'] = {}
+# 相似度索引只建立一次，之后随歌曲库增量同步；
+# 设置 LYRICS_SIMILARITY_BACKEND=embedding 且有离线拟合的歌词向量时，改用共享的内存映射向量，
+# 会话中不再保存稀疏 TF-IDF 矩阵
+similarity_backend = default_similarity_backend()
+lyric_embeddings = get_lyric_embeddings() if similarity_backend == 'embedding' else None
+if lyric_embeddings is not None:
+    if getattr(st.session_state.get('similarity_index'), 'embeddings', None) is not lyric_embeddings:
+        st.session_state['similarity_index'] = EmbeddingIndex(lyric_embeddings)
+elif not isinstance(st.session_state.get('similarity_index'), SimilarityIndex):
+    st.session_state['similarity_index'] = SimilarityIndex()
+if 'filter_index' not in st.session_state:
+    st.session_state['filter_index'] = FilterIndex()
+# 风格词典修改后，会话中的风格缓存随之失效
+check_style_cache_version(st.session_state)
 
 def get_song_style(song):
-    """获取歌曲风格"""
-    if song['id'] not in st.session_state['cache_styles']:
-        cleaned_lyric = clean_lyrics(song['lyric'], song['artist'])
-        st.session_state['cache_styles'][song['id']] = classify_style(cleaned_lyric, load_style_dict())[0]
-    return st.session_state['cache_styles'][song['id']]
+    """获取歌曲风格；整个歌曲库已在页面开始时批量补全，这里通常直接命中"""
+    return fill_style_cache([song], st.session_state['cache_styles'])[song['id']]
 
 def add_to_history(base_song, recommended_songs, mode="song_based", filters=None):
     """添加推荐记录到历史"""
@@ -110,8 +123,14 @@ else:
         st.subheader("推荐设置")
 
         # 获取所有歌手和风格列表
+        fill_style_cache(st.session_state['song_db'], st.session_state['cache_styles'])
+        # 筛选索引随歌曲库和风格缓存增量同步
+        filter_index = st.session_state['filter_index'].sync(
+            st.session_state['song_db'], st.session_state['cache_styles'])
         all_artists = list(set(song['artist'] for song in st.session_state['song_db']))
-        all_styles = list(set(st.session_state['cache_styles'].values())) if st.session_state['cache_styles'] else []
+        # 每次运行只建立一次 {歌曲id: 歌曲} 映射，推荐和筛选直接按id取歌曲
+        songs_by_id = {song['id']: song for song in st.session_state['song_db']}
+        all_styles = filter_index.style_names()
         
         # 推荐方式选择
         recommendation_mode = st.radio(
@@ -137,6 +156,12 @@ else:
                 # 推荐参数设置
                 num_recommendations = st.slider("推荐数量", 1, 10, 5)
                 consider_style = st.checkbox("考虑歌曲风格", value=True)
+                if lyric_embeddings is not None:
+                    st.caption(f"相似度计算：LSA 歌词向量（{lyric_embeddings.dim} 维，{len(lyric_embeddings)} 首）")
+                elif similarity_backend == 'embedding':
+                    st.caption("相似度计算：TF-IDF（未找到歌词向量文件，请先运行 embeddings.py）")
+                else:
+                    st.caption("相似度计算：TF-IDF")
                 
                 if st.button("获取推荐"):
                     # 获取推荐结果
@@ -144,7 +169,11 @@ else:
                         base_song,
                         st.session_state['song_db'],
                         n_recommendations=num_recommendations,
-                        consider_style=consider_style
+                        consider_style=consider_style,
+                        index=st.session_state['similarity_index'],
+                        graph=get_neighbor_graph(),
+                        cache=get_recommendation_cache(),
+                        songs_by_id=songs_by_id
                     )
                     
                     # 添加到历史记录
@@ -182,22 +211,13 @@ else:
             num_recommendations = st.slider("推荐数量", 1, 10, 5)
             
             if st.button("获取推荐"):
-                # 筛选歌曲
-                filtered_songs = st.session_state['song_db']
-                
-                # 应用歌手筛选
-                if selected_artists:
-                    filtered_songs = [
-                        song for song in filtered_songs
-                        if song['artist'] in selected_artists
-                    ]
-                
-                # 应用风格筛选
-                if selected_styles:
-                    filtered_songs = [
-                        song for song in filtered_songs
-                        if get_song_style(song) in selected_styles
-                    ]
+                import numpy as np
+
+                # 筛选歌曲：歌手、风格条件在筛选索引上取交集
+                filtered_songs = [
+                    songs_by_id[song_id]
+                    for song_id in filter_index.ids(artists=selected_artists, styles=selected_styles)
+                ]
                     
                 # 检查筛选结果
                 if not filtered_songs:
@@ -1,14 +1,14 @@
 import streamlit as st
 import json
-import pandas as pd
 from datetime import datetime
 import uuid
 import time
-import numpy as np
 import re
 import os
-from lyrics_analyzer import clean_lyrics
+from lyrics_analyzer import clean_lyrics, warm_lyrics
+from dedupe import MinHashIndex, default_threshold, dedupe_texts
 from style_classifier import classify_style, load_style_dict
+from song_library import check_song_library
 
 
 st.set_page_config(
@@ -61,13 +61,28 @@ st.markdown("""
 st.title("💾 数据导入导出")
 
 # 初始化session state
-if 'song_db' not in st.session_state:
-    st.session_state['song_db'] = []
+check_song_library(st.session_state)
 if 'import_history' not in st.session_state:
     st.session_state['import_history'] = []
 if 'highlight_imports' not in st.session_state:
     st.session_state['highlight_imports'] = {}
 
+# 重复检测设置：相似度阈值和发现重复时的处理方式
+DUPLICATE_POLICY_LABELS = {'flag': "标记后仍然导入", 'skip': "跳过重复歌曲", 'merge': "合并到已有歌曲"}
+with st.sidebar:
+    st.subheader("重复歌曲检测")
+    duplicate_threshold = st.slider("相似度阈值", 0.5, 1.0, default_threshold(), 0.05,
+                                    help="歌词词组的 Jaccard 相似度不低于该值时视为重复")
+    duplicate_policy = st.selectbox("发现重复时", list(DUPLICATE_POLICY_LABELS),
+                                    format_func=DUPLICATE_POLICY_LABELS.get)
+
+# 近似重复检测索引，阈值变化时重建；先与歌曲库同步，其他页面的编辑和删除也会反映进来
+dedupe_index = st.session_state.get('dedupe_index')
+if dedupe_index is None or dedupe_index.threshold != duplicate_threshold:
+    dedupe_index = st.session_state['dedupe_index'] = MinHashIndex(threshold=duplicate_threshold)
+dedupe_index.sync(st.session_state['song_db'])
+songs_by_id = {song['id']: song for song in st.session_state['song_db']}
+
 
 def parse_lrc(content):
     """解析LRC文件内容"""
@@ -214,23 +229,58 @@ def validate_song_data(artist, title, lyric):
     return True, ""
 
 def add_song(artist, title, lyric):
-    """添加歌曲到数据库"""
-    song_id = str(uuid.uuid4())
-    song = {
-        'id': song_id,
-        'artist': artist,
-        'title': title,
-        'lyric': lyric,
-        'import_time': datetime.now().isoformat()
-    }
-    st.session_state['song_db'].append(song)
+    """
+    添加歌曲到数据库，先检测与已有歌曲是否近似重复
+
+    返回 (处理结果, 重复的已有歌曲)，处理结果为：
+    - 'added': 没有重复，已添加
+    - 'flag': 已添加，并用 'duplicate_of' 字段记录重复的已有歌曲id
+    - 'skip': 未添加
+    - 'merge': 未添加，歌名记入已有歌曲的 'aliases'，新歌词更完整时替换已有歌词
+    """
+    # 签名只计算一次，查询和加入索引共用
+    signature = dedupe_index.signature(lyric)
+    matches = [(songs_by_id[song_id], score) for song_id, score in dedupe_index.query(lyric, signature=signature)
+               if song_id in songs_by_id]
+    existing = matches[0][0] if matches else None
+    action = duplicate_policy if existing is not None else 'added'
+
+    if action in ('added', 'flag'):
+        song_id = str(uuid.uuid4())
+        song = {
+            'id': song_id,
+            'artist': artist,
+            'title': title,
+            'lyric': lyric,
+            'import_time': datetime.now().isoformat()
+        }
+        if existing is not None:
+            song['duplicate_of'] = existing['id']
+        st.session_state['song_db'].append(song)
+        songs_by_id[song_id] = song
+        dedupe_index.add(song_id, lyric, signature=signature)
+    elif action == 'merge':
+        # 经 update_song 修改，歌曲库的版本号随之更新，各索引下次同步时能发现这首歌
+        fields = {}
+        if title != existing['title'] and title not in existing.get('aliases', []):
+            fields['aliases'] = existing.get('aliases', []) + [title]
+        if len(lyric) > len(existing.get('lyric') or ''):
+            fields['lyric'] = lyric
+        if fields:
+            st.session_state['song_db'].update_song(existing['id'], **fields)
+        if 'lyric' in fields:
+            dedupe_index.add(existing['id'], lyric, signature=signature)
     
     # 记录导入历史
+    details = f"{title} - {artist}"
+    if existing is not None:
+        details += f"（与 {existing['title']} - {existing['artist']} 重复，{DUPLICATE_POLICY_LABELS[action]}）"
     st.session_state['import_history'].append({
         'timestamp': datetime.now(),
-        'action': 'import',
-        'details': f"{title} - {artist}"
+        'action': 'import' if action == 'added' else f'duplicate_{action}',
+        'details': details
     })
+    return action, existing
 
 
 # 创建两列布局
@@ -256,8 +306,12 @@ with col1:
             if submitted:
                 valid, error_msg = validate_song_data(artist, title, lyric)
                 if valid:
-                    add_song(artist, title, lyric)
-                    st.success(f"成功添加歌曲：{title} - {artist}")
+                    action, existing = add_song(artist, title, lyric)
+                    if existing is None:
+                        st.success(f"成功添加歌曲：{title} - {artist}")
+                    else:
+                        st.warning(f"与已有歌曲 {existing['title']} - {existing['artist']} 重复，"
+                                   f"{DUPLICATE_POLICY_LABELS[action]}")
                 else:
                     st.error(error_msg)
     
@@ -277,10 +331,14 @@ with col1:
         if uploaded_files:
             total_files = len(uploaded_files)
             success_count = 0
+            skipped_count = 0  # 一键导入中按“跳过”策略未导入的重复歌曲
             
             # 一键导入按钮 - 确保不在form内
             if st.button("✨ 一键导入所有文件", use_container_width=True, type="primary"):
                 with st.spinner(f"正在批量导入 {total_files} 个文件..."):
+                    history_start = len(st.session_state['import_history'])
+                    # 先解析全部文件，收集通过校验的 (歌手, 歌名, 歌词)
+                    parsed_songs = []
                     for uploaded_file in uploaded_files:
                         try:
                             content = uploaded_file.getvalue().decode('utf-8')
@@ -299,8 +357,7 @@ with col1:
                                     lyric = lrc_data.get('lyric', "")
                                     valid, _ = validate_song_data(artist, title, lyric)
                                     if valid:
-                                        add_song(artist, title, lyric)
-                                        success_count += 1
+                                        parsed_songs.append((artist, title, lyric))
                             
                             elif file_type == 'json':
                                 data = json.loads(content)
@@ -312,8 +369,7 @@ with col1:
                                             lyric = song.get('lyric', "")
                                             valid, _ = validate_song_data(artist, title, lyric)
                                             if valid:
-                                                add_song(artist, title, lyric)
-                                                success_count += 1
+                                                parsed_songs.append((artist, title, lyric))
                             
                             elif file_type == 'txt':
                                 songs = []
@@ -340,13 +396,28 @@ with col1:
                                     lyric = '\n'.join(song.get('lyric', []))
                                     valid, _ = validate_song_data(artist, title, lyric)
                                     if valid:
-                                        add_song(artist, title, lyric)
-                                        success_count += 1
+                                        parsed_songs.append((artist, title, lyric))
                         
                         except Exception:
                             continue
+
+                    # 逐首检测重复之前，多进程预先分词：重复检测的文本，以及分析器查询的小写、清洗后文本，
+                    # 检测重复和后续分析页面都直接命中分词缓存
+                    lyrics = [lyric for _, _, lyric in parsed_songs]
+                    warm_lyrics(lyrics, extra=dedupe_texts(lyrics))
+                    for artist, title, lyric in parsed_songs:
+                        if add_song(artist, title, lyric)[0] == 'skip':
+                            skipped_count += 1
+                        else:
+                            success_count += 1
                 
                 st.success(f"🎉 批量导入完成！成功导入 {success_count}/{total_files} 个文件")
+                if skipped_count:
+                    st.info(f"跳过 {skipped_count} 首与已有歌曲重复的歌曲")
+                duplicates = sum(record['action'].startswith('duplicate_')
+                                 for record in st.session_state['import_history'][history_start:])
+                if duplicates:
+                    st.warning(f"其中 {duplicates} 首歌曲与已有歌曲重复（{DUPLICATE_POLICY_LABELS[duplicate_policy]}），详见导入历史")
                 st.balloons()
 
             # 单个文件处理逻辑
@@ -424,9 +495,11 @@ with col1:
                                 )
                                 
                                 if valid:
-                                    add_song(artist, title, lyrics)
-                                    st.success(f"✅ 成功导入歌曲: {title}")
-                                    success_count += 1
+                                    if add_song(artist, title, lyrics)[0] == 'skip':
+                                        st.info(f"⏭️ 歌曲 {title} 与已有歌曲重复，已跳过")
+                                    else:
+                                        st.success(f"✅ 成功导入歌曲: {title}")
+                                        success_count += 1
                                 else:
                                     st.error(f"❌ 数据验证失败: {error_msg}")
                     
@@ -436,6 +509,7 @@ with col1:
                             if isinstance(data, list):
                                 # 批量导入多首歌曲
                                 file_success = 0
+                                file_skipped = 0
                                 for song in data:
                                     try:
                                         if all(k in song for k in ['artist', 'title', 'lyric']):
@@ -445,13 +519,16 @@ with col1:
                                                 song['lyric']
                                             )
                                             if valid:
-                                                add_song(song['artist'], song['title'], song['lyric'])
-                                                file_success += 1
+                                                if add_song(song['artist'], song['title'], song['lyric'])[0] == 'skip':
+                                                    file_skipped += 1
+                                                else:
+                                                    file_success += 1
                                     except Exception as e:
                                         st.error(f"导入歌曲失败: {str(e)}")
                                 
                                 success_count += 1 if file_success > 0 else 0
-                                st.success(f"✅ 文件 {uploaded_file.name} 导入完成 (成功 {file_success}/{len(data)} 首)")
+                                skipped_note = f"，跳过重复 {file_skipped} 首" if file_skipped else ""
+                                st.success(f"✅ 文件 {uploaded_file.name} 导入完成 (成功 {file_success}/{len(data)} 首{skipped_note})")
                             else:
                                 st.error("JSON文件格式不正确，应包含歌曲数组")
                         except json.JSONDecodeError:
@@ -487,6 +564,7 @@ with col1:
                             
                             # 导入解析的歌曲
                             file_success = 0
+                            file_skipped = 0
                             for song in songs:
                                 try:
                                     valid, error_msg = validate_song_data(
@@ -495,13 +573,16 @@ with col1:
                                         '\n'.join(song['lyric'])
                                     )
                                     if valid:
-                                        add_song(song['artist'], song['title'], '\n'.join(song['lyric']))
-                                        file_success += 1
+                                        if add_song(song['artist'], song['title'], '\n'.join(song['lyric']))[0] == 'skip':
+                                            file_skipped += 1
+                                        else:
+                                            file_success += 1
                                 except Exception as e:
                                     st.error(f"导入歌曲失败: {song.get('title', '未知歌曲')} - {str(e)}")
                             
                             success_count += 1 if file_success > 0 else 0
-                            st.success(f"✅ 文件 {uploaded_file.name} 导入完成 (成功 {file_success}/{len(songs)} 首)")
+                            skipped_note = f"，跳过重复 {file_skipped} 首" if file_skipped else ""
+                            st.success(f"✅ 文件 {uploaded_file.name} 导入完成 (成功 {file_success}/{len(songs)} 首{skipped_note})")
                         
                         except Exception as e:
                             st.error(f"❌ 处理TXT文件 {uploaded_file.name} 时出错: {str(e)}")
@@ -557,6 +638,18 @@ with col2:
         st.write("### 数据统计")
         st.write(f"- 总歌曲数：{len(st.session_state['song_db'])}")
         st.write(f"- 歌手数量：{len(set(song['artist'] for song in st.session_state['song_db']))}")
+
+        # 全库重复检测报告
+        st.write("### 重复检测")
+        if st.button("检测重复歌曲", use_container_width=True):
+            groups = dedupe_index.duplicate_groups()
+            if groups:
+                st.write(f"发现 {len(groups)} 组重复歌曲，共 {sum(len(group) for group in groups)} 首")
+                for i, group in enumerate(groups, 1):
+                    st.write(f"{i}. " + "；".join(
+                        f"{songs_by_id[song_id]['title']} - {songs_by_id[song_id]['artist']}" for song_id in group))
+            else:
+                st.info("没有发现重复歌曲")
         
         # 导入历史
         st.write("### 导入历史")
@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from cache_utils import lyric_hash
+
+class RecommendationCache:
+    """推荐结果缓存
+    - 以 (基准歌曲id, 歌词哈希, 推荐数量, 是否考虑风格, 检索方式, 歌曲库或索引版本, 基准歌曲风格) 为键
+    - 只保存 (歌曲id, 得分) 列表，不引用会话中的歌曲字典
+    - 有条目数和内存上限的LRU，进程内所有会话共享；歌曲库变化后版本号随之变化，旧条目自然淘汰
+    """
+
+    def __init__(self, max_items=1024, max_bytes=16 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._lru = OrderedDict()  # 键 -> (结果, 估算字节数)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._lru)
+
+    @staticmethod
+    def make_key(base_song, n_recommendations, consider_style, mode, version, base_style=None):
+        return (base_song['id'], lyric_hash(base_song.get('lyric')), n_recommendations, consider_style,
+                mode, version, base_style)
+
+    @staticmethod
+    def _size(result):
+        # 列表本身加每个 (id, 得分) 元组的大致开销
+        return sys.getsizeof(result) + sum(
+            sys.getsizeof(pair) + sys.getsizeof(pair[0]) + sys.getsizeof(pair[1]) for pair in result)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return list(entry[0])
+
+    def put(self, key, result):
+        result = list(result)
+        size = self._size(result)
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._lru[key] = (result, size)
+            self._bytes += size
+            while self._lru and (len(self._lru) > self.max_items or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._lru.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._bytes = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """返回命中次数、未命中次数、命中率、条目数和估算内存占用"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate,
+                'items': len(self._lru),
+                'bytes': self._bytes,
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_recommendation_cache():
+    """获取进程内共享的推荐结果缓存，容量可通过 LYRICS_REC_CACHE_SIZE、LYRICS_REC_CACHE_MB 设置"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RecommendationCache(
+                    max_items=int(os.environ.get('LYRICS_REC_CACHE_SIZE', 1024)),
+                    max_bytes=int(os.environ.get('LYRICS_REC_CACHE_MB', 16)) * 1024 * 1024,
+                )
+    return _cache
@@ -1,4 +1,7 @@
 import re
+import threading
+from style_classifier import load_style_dict
+from song_library import library_version
 
 def parse_user_query(query):
     """
@@ -7,14 +10,8 @@ def parse_user_query(query):
     """
     style = None
     artist = None
-    # 风格词在 style_dict.json 里
-    import json
-    try:
-        with open('style_dict.json', 'r', encoding='utf-8') as f:
-            style_dict = json.load(f)
-    except Exception as e:
-        print(f"加载风格词典失败：{e}")
-        style_dict = {}
+    # 风格词在 style_dict.json 里，由注册表缓存，文件变化时才重新加载
+    style_dict = load_style_dict()
     for s in style_dict.keys():
         if s in query:
             style = s
@@ -35,51 +32,118 @@ def parse_user_query(query):
     keywords = [kw.strip() for kw in keywords if kw.strip()]
     return {'style': style, 'artist': artist, 'keywords': keywords}
 
+# recommend 未提供索引时使用的进程内共享索引，随传入的歌曲库增量同步
+_query_indexes = None
+_query_lock = threading.Lock()
+# 共享索引当前同步到的歌曲库版本号，以及换成其他歌曲库（或无版本号的列表）的次数
+_query_owner = None
+_query_generation = 0
+
+def get_query_indexes():
+    """获取进程内共享的 (以 'lyrics' 字段建立的 BM25Index, FilterIndex)"""
+    global _query_indexes
+    from search_index import BM25Index
+    from filter_index import FilterIndex
+
+    with _query_lock:
+        if _query_indexes is None:
+            _query_indexes = (BM25Index(field='lyrics'), FilterIndex())
+        return _query_indexes
+
+def _query_songs(lyrics_db):
+    """
+    带 id 的歌曲原样使用；全部没有 id 时按位置编号为 ('#', 下标)，与真实 id 分属不同的命名空间，
+    只为索引需要的字段建立轻量记录；部分有 id 部分没有时抛出 ValueError
+    """
+    with_id = sum('id' in item for item in lyrics_db)
+    if with_id == len(lyrics_db):
+        return lyrics_db
+    if with_id:
+        raise ValueError("lyrics_db 中的歌曲要么都有 id，要么都没有 id")
+    return [{'id': ('#', i), 'artist': item.get('artist'), 'style': item.get('style'), 'lyrics': item.get('lyrics')}
+            for i, item in enumerate(lyrics_db)]
+
 # 推荐函数
-def recommend(lyrics_db, user_query):
+def recommend(lyrics_db, user_query, index=None, filters=None, return_scores=False):
     """
-    lyrics_db: [{"artist": , "title": , "lyrics": , "style": }]
+    lyrics_db: [{"id": , "artist": , "title": , "lyrics": , "style": }]，全部没有 id 时按位置编号为 ('#', 下标)，
+               部分有 id 部分没有时抛出 ValueError
     user_query: 用户输入
-    返回推荐的歌曲列表
+    index: 以 'lyrics' 字段建立的 BM25Index，提供时先与 lyrics_db 增量同步；默认使用进程内共享的索引
+    filters: 歌手、风格筛选索引 FilterIndex，提供时先与 lyrics_db 增量同步；默认使用进程内共享的索引
+    return_scores: 为 True 时返回 [(歌曲id, 得分), ...]，不复制歌曲字典
+    返回推荐的歌曲列表（每项附带 BM25 得分 match_count）
     """
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
-    import numpy as np
+    songs = _query_songs(lyrics_db)
+    if index is not None and filters is not None:
+        return _recommend(songs, lyrics_db, user_query, index.sync(songs), filters.sync(songs), return_scores)
+    shared_index, shared_filters = get_query_indexes()
+    index = shared_index if index is None else index
+    filters = shared_filters if filters is None else filters
+    version = library_version(songs)
+    if version is None:
+        # 普通列表无法判断查询期间共享索引是否被其他歌曲库重新同步，同步和查询整体互斥
+        with _query_lock:
+            _claim_query_indexes(None)
+            return _recommend(songs, lyrics_db, user_query, index.sync(songs), filters.sync(songs), return_scores)
+    # 只在同步共享索引时加锁，查询不互斥；查询期间共享索引被换成其他歌曲库时，在锁内重新查询
+    with _query_lock:
+        generation = _claim_query_indexes(version)
+        index.sync(songs)
+        filters.sync(songs)
+    results = _recommend(songs, lyrics_db, user_query, index, filters, return_scores)
+    if generation == _query_generation:
+        return results
+    with _query_lock:
+        _claim_query_indexes(version)
+        return _recommend(songs, lyrics_db, user_query, index.sync(songs), filters.sync(songs), return_scores)
 
+def _claim_query_indexes(version):
+    """在 _query_lock 内调用：记录共享索引将同步到的歌曲库，换了歌曲库时递增并返回换用次数"""
+    global _query_owner, _query_generation
+    if version is None or version != _query_owner:
+        _query_owner = version
+        _query_generation += 1
+    return _query_generation
+
+def _recommend(songs, lyrics_db, user_query, index, filters, return_scores):
+    """在已与 songs 同步的索引上查询"""
     cond = parse_user_query(user_query)
     results = []
-    filtered_db = []
     
-    # 风格和歌手过滤
-    for item in lyrics_db:
-        if cond['style'] and item.get('style') != cond['style']:
-            continue
-        if cond['artist'] and cond['artist'] not in item.get('artist', ''):
-            continue
-        filtered_db.append(item)
+    # 风格和歌手过滤：在筛选索引上取交集
+    mask = filters.mask(styles=[cond['style']] if cond['style'] else None, artist_contains=cond['artist'])
+    filtered_ids = filters.ids(mask)
     
-    if not filtered_db:
+    if not filtered_ids:
         return []
     
-    # 使用TF-IDF计算语义相似性
-    vectorizer = TfidfVectorizer()
-    lyrics_texts = [item['lyrics'] for item in filtered_db]
+    # 倒排索引只遍历查询词的倒排表，过滤后的歌曲作为候选集合
+    candidates = set(filtered_ids) if len(filtered_ids) < len(songs) else None
     query_text = ' '.join(cond['keywords']) if cond['keywords'] else user_query
-    tfidf_matrix = vectorizer.fit_transform(lyrics_texts + [query_text])
-    
-    # 计算余弦相似度
-    similarities = cosine_similarity(tfidf_matrix[-1:], tfidf_matrix[:-1])[0]
-    
-    for idx, item in enumerate(filtered_db):
-        item = dict(item)  # 拷贝，避免污染原数据
-        item['match_count'] = similarities[idx]
+    matches = dict(index.search(query_text, top_k=10, candidates=candidates))
+
+    # 命中不足10首时，按原顺序补足未命中的歌曲
+    ranked = list(matches.items())
+    for song_id in filtered_ids:
+        if len(ranked) >= 10:
+            break
+        if song_id not in matches:
+            ranked.append((song_id, 0.0))
+    if return_scores:
+        return ranked
+
+    # 只复制入选的歌曲
+    scores = dict(ranked)
+    originals = {song['id']: item for song, item in zip(songs, lyrics_db) if song['id'] in scores}
+    for song_id, score in ranked:
+        item = dict(originals[song_id])  # 拷贝，避免污染原数据
+        item['match_count'] = score
         results.append(item)
-    
-    # 按相似度降序排序
-    results.sort(key=lambda x: x.get('match_count', 0), reverse=True)
-    return results[:10]  # 最多推荐10首
+    return results  # 最多推荐10首
 
-def get_similar_songs(base_song, song_db, n_recommendations=5, consider_style=True):
+def get_similar_songs(base_song, song_db, n_recommendations=5, consider_style=True, index=None, graph=None,
+                      exact=True, probes=None, candidate_ids=None, return_scores=False, cache=None, songs_by_id=None):
     """
     基于歌曲内容推荐相似歌曲
     
@@ -88,19 +152,117 @@ def get_similar_songs(base_song, song_db, n_recommendations=5, consider_style=Tr
     - song_db: 歌曲数据库列表
     - n_recommendations: 推荐数量
     - consider_style: 是否考虑歌曲风格
+    - index: 相似度索引 SimilarityIndex，提供时先与歌曲库增量同步，不再重新拟合向量器
+    - graph: 预计算的近邻图 NeighborGraph，基准歌曲在图中且未修改时直接读取结果
+    - exact: 为 False 时使用近似最近邻（IVF）检索候选，再对候选精确打分，适合超大歌曲库；
+      IVF 聚类与相似度索引绑定，此时必须提供 index，否则抛出 ValueError
+    - probes: 近似检索时探查的簇数，越大召回率越高、越慢
+    - candidate_ids: 可选的候选歌曲id（如 FilterIndex 的筛选结果），只对这些歌曲打分
+    - return_scores: 为 True 时返回 [(歌曲id, 得分), ...]，不取歌曲字典
+    - cache: 推荐结果缓存 RecommendationCache，需同时提供 index；song_db 为 SongLibrary 时以歌曲库版本号为键，
+      命中时不同步索引，否则以同步后的索引版本为键
+    - songs_by_id: 可选的 {歌曲id: 歌曲} 映射（与 song_db 一致），提供时读取近邻图和取出推荐歌曲都不再遍历歌曲库
     
     返回:
     推荐歌曲列表
     """
+    if graph is not None and candidate_ids is None:
+        if songs_by_id is None:
+            songs_by_id = {song['id']: song for song in song_db}
+        recommended = graph.lookup(base_song, songs_by_id, n_recommendations, consider_style,
+                                   with_scores=return_scores)
+        if recommended is not None:
+            return recommended
+        # 建图之后新增或修改的歌曲实时计算
+
+    key = None
+    if cache is not None and index is not None and candidate_ids is None:
+        mode = ('exact',) if exact else ('approximate', probes)
+        # 考虑风格时，结果还取决于基准歌曲的风格和其他歌曲的 'style' 字段
+        base_style = ('style', base_song['style']) if consider_style and 'style' in base_song else None
+        version = library_version(song_db)
+        if version is not None:
+            # 歌曲库版本号涵盖所有歌曲的歌词和风格，命中缓存时不必同步索引
+            key = cache.make_key(base_song, n_recommendations, consider_style, mode,
+                                 (type(index).__name__, version), base_style)
+        elif base_style is None:
+            # 普通列表只能同步索引后以索引版本为键；索引版本不包含风格字段，考虑风格时不走缓存
+            key = cache.make_key(base_song, n_recommendations, consider_style, mode, index.sync(song_db).version)
+        if key is not None:
+            ranked = cache.get(key)
+            if ranked is not None:
+                return ranked if return_scores else _materialize(ranked, song_db, songs_by_id)
+
+    if not exact:
+        if index is None:
+            # 临时新建的索引每次查询都要重新聚类，比精确计算还慢
+            raise ValueError("近似检索（exact=False）需要提供相似度索引 index")
+        ids, scores = _approximate_scores(base_song, song_db, index, probes, candidate_ids)
+    elif index is not None:
+        ids, scores = _index_scores(base_song, song_db, index, candidate_ids)
+    else:
+        ids, scores = _refit_scores(base_song, song_db, candidate_ids)
+    ranked = [] if ids is None else _rank_similar(base_song, song_db, ids, scores, n_recommendations,
+                                                  consider_style, songs_by_id)
+    if key is not None:
+        cache.put(key, ranked)
+    return ranked if return_scores else _materialize(ranked, song_db, songs_by_id)
+
+def _materialize(ranked, song_db, songs_by_id=None):
+    """把 [(歌曲id, 得分), ...] 换成歌曲字典列表，只查找入选的歌曲"""
+    if songs_by_id is not None:
+        return [songs_by_id[song_id] for song_id, _ in ranked]
+    wanted = {song_id for song_id, _ in ranked}
+    songs = {song['id']: song for song in song_db if song['id'] in wanted}
+    return [songs[song_id] for song_id, _ in ranked]
+
+def _top_k(values, k):
+    """返回得分最高的 k 个下标：得分降序，同分按下标升序（与稳定排序一致）"""
+    import numpy as np
+
+    if k <= 0 or not len(values):
+        return np.zeros(0, dtype=np.int64)
+    if len(values) > k:
+        # 先用 argpartition 取第 k 大的得分，再保留所有不低于它的（含并列）
+        threshold = values[np.argpartition(-values, k - 1)[k - 1]]
+        candidates = np.flatnonzero(values >= threshold)
+    else:
+        candidates = np.arange(len(values))
+    return candidates[np.lexsort((candidates, -values[candidates]))][:k]
+
+def _rank_similar(base_song, song_db, ids, scores, n_recommendations, consider_style, songs_by_id=None):
+    """对打好分的歌曲排除基准歌曲、按风格加权后取前 n 首，返回 [(歌曲id, 得分), ...]"""
+    import numpy as np
+
+    if consider_style and 'style' in base_song:
+        # 相同风格的歌曲得分提高20%
+        songs = songs_by_id if songs_by_id is not None else {song['id']: song for song in song_db}
+        same_style = np.fromiter(
+            ('style' in songs[song_id] and songs[song_id]['style'] == base_song['style'] for song_id in ids),
+            dtype=bool, count=len(ids))
+        scores = np.where(same_style, scores * 1.2, scores)
+
+    # 过滤掉基准歌曲本身
+    scores = np.asarray(scores, dtype=float)
+    keep = np.ones(len(ids), dtype=bool)
+    try:
+        keep[ids.index(base_song['id'])] = False
+    except ValueError:
+        pass
+    candidates = np.flatnonzero(keep)
+    winners = candidates[_top_k(scores[candidates], n_recommendations)].tolist()
+    return [(ids[i], float(scores[i])) for i in winners]
+
+def _refit_scores(base_song, song_db, candidate_ids=None):
+    """对整个歌曲库重新拟合 TfidfVectorizer 计算相似度"""
     from sklearn.feature_extraction.text import TfidfVectorizer
     from sklearn.metrics.pairwise import cosine_similarity
-    import numpy as np
-    
+
     # 过滤掉基准歌曲本身
     filtered_db = [song for song in song_db if song['id'] != base_song['id']]
     
     if not filtered_db:
-        return []
+        return None, None
     
     # 准备歌词文本
     lyrics_texts = [song['lyric'] for song in filtered_db]
@@ -112,24 +274,109 @@ def get_similar_songs(base_song, song_db, n_recommendations=5, consider_style=Tr
     
     # 计算余弦相似度
     similarities = cosine_similarity(tfidf_matrix[-1:], tfidf_matrix[:-1])[0]
-    
-    # 为每首歌计算综合得分
-    results = []
-    for idx, song in enumerate(filtered_db):
-        score = similarities[idx]
-        
-        # 如果考虑风格，对相同风格的歌曲加权
-        if consider_style and 'style' in base_song and 'style' in song:
-            if base_song['style'] == song['style']:
-                score *= 1.2  # 相同风格的歌曲得分提高20%
-        
-        results.append({
-            'song': song,
-            'score': score
-        })
-    
-    # 按得分排序
-    results.sort(key=lambda x: x['score'], reverse=True)
-    
-    # 返回推荐结果
-    return [item['song'] for item in results[:n_recommendations]]
\ No newline at end of file
+    ids = [song['id'] for song in filtered_db]
+    if candidate_ids is not None:
+        allowed = set(candidate_ids)
+        keep = [i for i, song_id in enumerate(ids) if song_id in allowed]
+        ids, similarities = [ids[i] for i in keep], similarities[keep]
+    return ids, similarities
+
+def _index_scores(base_song, song_db, index, candidate_ids=None):
+    """用相似度索引计算相似度：一次稀疏乘积，有候选歌曲时只计算候选所在的行"""
+    index.sync(song_db)
+    if candidate_ids is None:
+        return index.ids, index.scores(base_song)
+    ids = [song_id for song_id in candidate_ids if song_id in index]
+    return ids, index.scores(base_song, rows=index.rows(ids))
+
+def _approximate_scores(base_song, song_db, index, probes, candidate_ids=None):
+    """用近似最近邻索引取候选歌曲，只对候选计算精确相似度"""
+    from ann_index import get_ann_index
+
+    ann = get_ann_index(index).sync(song_db)
+    ids = ann.candidates(index.vector(base_song), probes)
+    if candidate_ids is not None:
+        allowed = set(candidate_ids)
+        ids = [song_id for song_id in ids if song_id in allowed]
+    if not ids:
+        return None, None
+    return ids, index.scores(base_song, rows=index.rows(ids))
+
+def iter_similar_songs(base_ids, song_db, n_recommendations=5, consider_style=True, index=None, block_size=256):
+    """
+    批量计算多首歌的相似歌曲，按输入顺序逐首产出 (基准歌曲id, 推荐歌曲列表)
+
+    参数:
+    - base_ids: 基准歌曲id列表
+    - song_db: 歌曲数据库列表
+    - n_recommendations: 每首歌的推荐数量
+    - consider_style: 是否考虑歌曲风格
+    - index: 相似度索引 SimilarityIndex，默认新建
+    - block_size: 每块的基准歌曲数，内存占用与块大小成正比
+
+    结果与逐首调用 get_similar_songs(..., index=index) 一致：每块只做一次稀疏矩阵乘积，
+    风格加权用向量化掩码完成，每行只在非零相似度中选取 top-n。
+    不在 song_db 中的基准歌曲id不会中断批量计算，产出 (基准歌曲id, [])。
+    """
+    import numpy as np
+    from similarity_index import SimilarityIndex
+
+    index = (index if index is not None else SimilarityIndex()).sync(song_db)
+    songs = {song['id']: song for song in song_db}
+    ids = index.ids
+    matrix = index.matrix
+    matrix_t = matrix.T.tocsc()
+
+    # 风格编码，-1 表示歌曲没有风格字段
+    style_codes = {}
+    styles = np.array([
+        style_codes.setdefault(songs[song_id]['style'], len(style_codes)) if 'style' in songs[song_id] else -1
+        for song_id in ids
+    ], dtype=np.int64)
+
+    for start in range(0, len(base_ids), block_size):
+        block_ids = base_ids[start:start + block_size]
+        # 不在歌曲库中的基准歌曲不参与计算，按输入顺序产出空的推荐列表
+        rows = index.rows([base_id for base_id in block_ids if base_id in songs])
+        block = (matrix[rows] @ matrix_t).tocsr()
+        block.sort_indices()
+        if consider_style:
+            # 相同风格的歌曲得分提高20%
+            entry_rows = np.repeat(rows, np.diff(block.indptr))
+            same_style = (styles[entry_rows] == styles[block.indices]) & (styles[block.indices] >= 0)
+            block.data[same_style] *= 1.2
+        rows_iter = iter(enumerate(rows.tolist()))
+        for base_id in block_ids:
+            if base_id not in songs:
+                yield base_id, []
+                continue
+            i, row = next(rows_iter)
+            lo, hi = block.indptr[i], block.indptr[i + 1]
+            columns, values = block.indices[lo:hi], block.data[lo:hi]
+            keep = (columns != row) & (values > 0)
+            columns, values = columns[keep], values[keep]
+            # 得分降序，同分按歌曲库中的顺序（列号已排序）
+            chosen = columns[_top_k(values, n_recommendations)].tolist()
+            if len(chosen) < n_recommendations:
+                # 相似度为0的歌曲按顺序补足
+                taken = set(chosen)
+                for column in range(len(ids)):
+                    if len(chosen) >= n_recommendations:
+                        break
+                    if column != row and column not in taken:
+                        chosen.append(column)
+            yield base_id, [songs[ids[column]] for column in chosen]
+
+def write_similar_songs(base_ids, song_db, writer, n_recommendations=5, consider_style=True, index=None,
+                        block_size=256):
+    """
+    批量计算相似歌曲并逐首交给 writer(基准歌曲id, 推荐歌曲列表)，适合离线生成歌单
+
+    返回写出的歌曲数
+    """
+    count = 0
+    for base_id, recommended in iter_similar_songs(base_ids, song_db, n_recommendations, consider_style,
+                                                   index, block_size):
+        writer(base_id, recommended)
+        count += 1
+    return count
@@ -0,0 +1,119 @@
+import re
+import heapq
+import math
+import threading
+from collections import Counter
+from cache_utils import diff_songs
+from song_library import library_version
+from token_cache import get_token_cache, warm_tokens
+
+# 只保留包含文字的词，忽略空白和标点
+_WORD_RE = re.compile(r'\w')
+
+def search_terms(text):
+    """jieba分词（经共享分词缓存），转小写并去掉空白和标点"""
+    return [word for word in get_token_cache().tokens((text or '').lower()) if _WORD_RE.search(word)]
+
+class BM25Index:
+    """jieba分词的倒排索引，按 BM25 打分
+    - 每个词保存倒排表 {文档id: 词频}，查询只遍历查询词的倒排表
+    - 新增、修改、删除歌曲时只更新该歌曲涉及的倒排表
+    - 前 top_k 个结果用堆选取
+    """
+
+    def __init__(self, field='lyric', k1=1.5, b=0.75):
+        self.field = field
+        self.k1 = k1
+        self.b = b
+        self._postings = {}    # 词 -> {文档id: 词频}
+        self._lengths = {}     # 文档id -> 文档长度（词数）
+        self._known = {}       # 文档id -> (文本,)，用于 sync 判断是否修改
+        self._synced = None    # 上次同步时歌曲库的版本号
+        self._terms = {}       # 文档id -> 文档中的词，删除时直接定位倒排表，不再重新分词
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._lengths
+
+    def add(self, doc_id, text):
+        """新增或更新一篇文档"""
+        terms = search_terms(text)
+        counts = Counter(terms)
+        with self._lock:
+            self._remove(doc_id)
+            self._synced = None
+            for term, count in counts.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+            self._lengths[doc_id] = len(terms)
+            self._total_length += len(terms)
+            self._known[doc_id] = (text,)
+            self._terms[doc_id] = tuple(counts)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+            self._synced = None
+
+    def _remove(self, doc_id):
+        if self._known.pop(doc_id, None) is None:
+            return
+        for term in self._terms.pop(doc_id):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+
+    def sync(self, songs, workers=None):
+        """与歌曲库同步，只处理新增、修改和删除的歌曲，新文本先多进程批量分词"""
+        version = library_version(songs)
+        if version is not None and version == self._synced:
+            # 歌曲库自上次同步后没有修改，不必逐首比较
+            return self
+        changed, removed = diff_songs(self._known, songs, fields=(self.field,))
+        for doc_id in removed:
+            self.remove(doc_id)
+        warm_tokens([(song.get(self.field) or '').lower() for song in changed], workers)
+        for song in changed:
+            self.add(song['id'], song.get(self.field))
+        self._synced = version
+        return self
+
+    def scores(self, query, candidates=None):
+        """
+        返回 {文档id: BM25得分}，只包含至少命中一个查询词的文档
+
+        参数:
+        - query: 查询文本
+        - candidates: 可选的候选文档id集合，只对其中的文档打分
+        """
+        terms = set(search_terms(query))
+        scores = {}
+        with self._lock:
+            n_docs = len(self._lengths)
+            if not n_docs:
+                return scores
+            avg_length = self._total_length / n_docs or 1
+            k1, b = self.k1, self.b
+            lengths = self._lengths
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if candidates is not None and doc_id not in candidates:
+                        continue
+                    norm = k1 * (1 - b + b * lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=10, candidates=None):
+        """返回得分最高的 top_k 个 [(文档id, 得分), ...]，按得分降序"""
+        scores = self.scores(query, candidates)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
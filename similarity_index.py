@@ -0,0 +1,186 @@
+import re
+import threading
+from cache_utils import diff_songs, lyric_hash
+from song_library import library_version
+
+# 与 TfidfVectorizer 默认分词一致：转小写后取两个及以上字符的词
+_TOKEN_RE = re.compile(r'(?u)\b\w\w+\b')
+_MASK = (1 << 64) - 1
+
+def analyze(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+class SimilarityIndex:
+    """歌词相似度索引
+    - 保存每首歌的词频行、词表和文档频率，新增、修改、删除时只更新该歌曲
+    - IDF与L2归一化的稀疏矩阵在下一次查询时才重新计算（惰性刷新）
+    - 查询只需一次稀疏行向量与矩阵的乘积，结果与对整个歌曲库重新拟合 TfidfVectorizer 一致
+    - 内容摘要（各歌曲id与歌词哈希之和）作为索引版本号
+    - 与 SongLibrary 同步时记录其版本号，歌曲库未修改时 sync 为 O(1)
+    """
+
+    def __init__(self):
+        import numpy as np
+
+        self.vocabulary = {}   # 词 -> 列号
+        self._df = np.zeros(0)
+        self._rows = {}        # 歌曲id -> (列号数组, 词频数组)
+        self._known = {}       # 歌曲id -> (歌词,)，用于 sync 判断是否修改
+        self._synced = None    # 上次同步时歌曲库的版本号
+        self._digests = {}     # 歌曲id -> 内容哈希
+        self._digest = 0
+        self._ids = []         # 矩阵行号 -> 歌曲id
+        self._positions = {}   # 歌曲id -> 矩阵行号
+        self._matrix = None
+        self._idf = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, song_id):
+        return song_id in self._rows
+
+    @property
+    def version(self):
+        return f"{self._digest:016x}"
+
+    @property
+    def ids(self):
+        """矩阵行号对应的歌曲id列表"""
+        self._refresh()
+        return self._ids
+
+    def _counts(self, text, grow):
+        import numpy as np
+
+        columns = []
+        for term in analyze(text):
+            column = self.vocabulary.get(term)
+            if column is None:
+                if not grow:
+                    continue
+                column = self.vocabulary[term] = len(self.vocabulary)
+            columns.append(column)
+        columns, counts = np.unique(np.asarray(columns, dtype=np.int64), return_counts=True)
+        return columns, counts.astype(float)
+
+    def add(self, song_id, lyric):
+        """新增或更新一首歌"""
+        import numpy as np
+
+        # 摘要同时包含歌曲id，id不同的歌曲库版本号不同
+        digest = int(lyric_hash(f"{song_id!r}\x00{lyric}")[:16], 16)
+        with self._lock:
+            self._remove(song_id)
+            self._synced = None
+            columns, counts = self._counts(lyric, grow=True)
+            if len(self.vocabulary) > len(self._df):
+                self._df = np.concatenate([self._df, np.zeros(len(self.vocabulary) - len(self._df))])
+            self._df[columns] += 1
+            self._rows[song_id] = (columns, counts)
+            self._known[song_id] = (lyric,)
+            self._digests[song_id] = digest
+            self._digest = (self._digest + digest) & _MASK
+            self._matrix = None
+
+    def remove(self, song_id):
+        with self._lock:
+            self._remove(song_id)
+            self._synced = None
+
+    def _remove(self, song_id):
+        row = self._rows.pop(song_id, None)
+        self._known.pop(song_id, None)
+        if row is None:
+            return
+        self._df[row[0]] -= 1
+        self._digest = (self._digest - self._digests.pop(song_id)) & _MASK
+        self._matrix = None
+
+    def sync(self, songs):
+        """与歌曲库同步，只处理新增、修改和删除的歌曲"""
+        version = library_version(songs)
+        if version is not None and version == self._synced:
+            # 歌曲库自上次同步后没有修改，不必逐首比较
+            return self
+        changed, removed = diff_songs(self._known, songs)
+        for song_id in removed:
+            self.remove(song_id)
+        for song in changed:
+            self.add(song['id'], song['lyric'])
+        self._synced = version
+        return self
+
+    def _refresh(self):
+        """按当前文档频率重新计算IDF，并组装L2归一化的 TF-IDF 稀疏矩阵"""
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        with self._lock:
+            if self._matrix is not None:
+                return
+            n_docs = len(self._rows)
+            # 与 TfidfVectorizer(smooth_idf=True) 一致
+            self._idf = np.log((1 + n_docs) / (1 + self._df)) + 1
+            self._ids = list(self._rows)
+            self._positions = {song_id: i for i, song_id in enumerate(self._ids)}
+            rows = list(self._rows.values())
+            lengths = np.fromiter((len(row[0]) for row in rows), dtype=np.int64, count=len(rows))
+            indptr = np.concatenate([[0], np.cumsum(lengths)])
+            indices = np.concatenate([row[0] for row in rows]) if rows else np.zeros(0, dtype=np.int64)
+            data = np.concatenate([row[1] for row in rows]) if rows else np.zeros(0)
+            data = data * self._idf[indices]
+            # 按行做L2归一化
+            norms = np.sqrt(np.add.reduceat(data ** 2, indptr[:-1])) if len(data) else np.zeros(n_docs)
+            norms[lengths == 0] = 1
+            norms[norms == 0] = 1
+            data /= np.repeat(norms, lengths)
+            self._matrix = csr_matrix((data, indices, indptr), shape=(n_docs, len(self.vocabulary)))
+
+    @property
+    def matrix(self):
+        """L2归一化的 TF-IDF 稀疏矩阵，行顺序与 ids 一致"""
+        self._refresh()
+        return self._matrix
+
+    @property
+    def idf(self):
+        """当前词表的 IDF 数组，下标为列号"""
+        self._refresh()
+        return self._idf
+
+    def vector(self, song=None, text=None):
+        """
+        返回查询向量（1×词表大小的稀疏矩阵）
+
+        已在索引中的歌曲直接取其行；其他文本按当前词表和IDF向量化，不在词表中的词忽略
+        """
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        self._refresh()
+        if song is not None and song.get('id') in self._positions and self._known[song['id']] == (song.get('lyric'),):
+            return self._matrix[self._positions[song['id']]]
+        if text is None:
+            text = song.get('lyric') if song is not None else ''
+        with self._lock:
+            columns, counts = self._counts(text, grow=False)
+        data = counts * self._idf[columns]
+        norm = np.linalg.norm(data)
+        if norm > 0:
+            data /= norm
+        return csr_matrix((data, columns, [0, len(columns)]), shape=(1, len(self.vocabulary)))
+
+    def rows(self, song_ids):
+        """返回歌曲id对应的矩阵行号数组"""
+        import numpy as np
+
+        self._refresh()
+        return np.fromiter((self._positions[song_id] for song_id in song_ids), dtype=np.int64, count=len(song_ids))
+
+    def scores(self, song=None, text=None, rows=None):
+        """返回查询与索引中每首歌（或 rows 指定的行）的余弦相似度数组，默认顺序与 ids 一致"""
+        query = self.vector(song, text)
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        return (matrix @ query.T).toarray().ravel()
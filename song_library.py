@@ -0,0 +1,69 @@
+import itertools
+
+# 歌曲库版本号在进程内全局递增，不同歌曲库（不同会话）的版本号不会相同
+_versions = itertools.count(1)
+
+def _touching(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.touch()
+        return result
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+class SongLibrary(list):
+    """会话中的歌曲库（歌曲字典列表），带修改版本号
+    - append、extend、删除、切片赋值等列表操作后 version 自动更新
+    - 原地修改歌曲字段请用 update_song()，或修改后调用 touch()
+    - 各类索引记录上次同步时的版本号，歌曲库未修改时 sync 直接返回，不再逐首比较
+    """
+
+    def __init__(self, songs=()):
+        super().__init__(songs)
+        self.touch()
+
+    def touch(self):
+        """标记歌曲库已修改"""
+        self.version = next(_versions)
+
+    def update_song(self, song_id, **fields):
+        """原地修改一首歌的字段并更新版本号，返回该歌曲；歌曲不存在时返回 None"""
+        for song in self:
+            if song['id'] == song_id:
+                song.update(fields)
+                self.touch()
+                return song
+        return None
+
+    append = _touching('append')
+    extend = _touching('extend')
+    insert = _touching('insert')
+    remove = _touching('remove')
+    pop = _touching('pop')
+    clear = _touching('clear')
+    sort = _touching('sort')
+    reverse = _touching('reverse')
+    __setitem__ = _touching('__setitem__')
+    __delitem__ = _touching('__delitem__')
+    __iadd__ = _touching('__iadd__')
+    __imul__ = _touching('__imul__')
+
+def library_version(songs):
+    """返回歌曲库的修改版本号；普通列表没有版本号，返回 None（只能逐首比较）"""
+    return getattr(songs, 'version', None)
+
+def check_song_library(state):
+    """
+    确保会话中的 'song_db' 是 SongLibrary，旧会话中的普通列表会被包装
+
+    参数:
+    - state: 会话状态（如 st.session_state）
+    """
+    songs = state.get('song_db')
+    if not isinstance(songs, SongLibrary):
+        songs = state['song_db'] = SongLibrary(songs or [])
+    return songs
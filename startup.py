@@ -0,0 +1,115 @@
+"""
+启动优化：jieba词典预热与导入耗时报告
+
+用法:
+    python startup.py    # 输出各重量级模块和项目模块的冷启动导入耗时
+"""
+import os
+import sys
+import threading
+import subprocess
+from cache_utils import CACHE_DIR
+
+# 页面中按需加载的重量级依赖
+HEAVY_MODULES = [
+    'numpy',
+    'scipy.sparse',
+    'pandas',
+    'matplotlib.pyplot',
+    'sklearn.feature_extraction.text',
+    'jieba',
+    'jieba.analyse',
+    'wordcloud',
+]
+
+# 项目自身模块，导入时不应触发重量级依赖
+APP_MODULES = [
+    'cache_utils',
+    'style_classifier',
+    'style_store',
+    'token_cache',
+    'lyrics_analyzer',
+    'term_store',
+    'wordcloud_service',
+    'artist_stats',
+    'similarity_index',
+    'neighbor_graph',
+    'ann_index',
+    'search_index',
+    'filter_index',
+    'recommendation_cache',
+    'embeddings',
+    'dedupe',
+    'recommender',
+]
+
+_jieba_lock = threading.Lock()
+_jieba_configured = False
+_warm_thread = None
+
+def load_jieba():
+    """导入jieba并把前缀词典缓存文件放到项目缓存目录，词典只序列化一次"""
+    global _jieba_configured
+    import jieba
+
+    if not _jieba_configured:
+        with _jieba_lock:
+            if not _jieba_configured:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                jieba.dt.tmp_dir = CACHE_DIR
+                _jieba_configured = True
+    return jieba
+
+def warm_up():
+    """加载jieba前缀词典（优先读取缓存文件）"""
+    load_jieba().initialize()
+
+def warm_up_in_background():
+    """在后台线程中预热jieba词典，每个进程只启动一次，不阻塞首页渲染"""
+    global _warm_thread
+    if _warm_thread is None:
+        with _jieba_lock:
+            if _warm_thread is None:
+                _warm_thread = threading.Thread(target=warm_up, name='jieba-warm-up', daemon=True)
+                _warm_thread.start()
+    return _warm_thread
+
+def measure_import(module):
+    """在独立子进程中测量模块的冷启动导入耗时（秒）"""
+    code = (
+        "import time, sys; sys.path.insert(0, {root!r}); t = time.perf_counter(); "
+        "import {module}; print(time.perf_counter() - t)"
+    ).format(root=os.path.dirname(os.path.abspath(__file__)), module=module)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+def measure_jieba_initialize():
+    """在独立子进程中测量jieba词典加载耗时（秒）"""
+    code = (
+        "import sys; sys.path.insert(0, {root!r}); import time, startup; "
+        "jieba = startup.load_jieba(); t = time.perf_counter(); jieba.initialize(); "
+        "print(time.perf_counter() - t)"
+    ).format(root=os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+def import_time_report(modules=None):
+    """返回 [(模块名, 导入耗时秒数或None)]，None 表示模块不可用"""
+    modules = modules or HEAVY_MODULES + APP_MODULES
+    return [(module, measure_import(module)) for module in modules]
+
+def main():
+    print(f"{'模块':40s} 冷启动导入耗时")
+    for module, seconds in import_time_report():
+        cost = f"{seconds * 1000:8.1f} ms" if seconds is not None else "     不可用"
+        print(f"{module:40s} {cost}")
+    seconds = measure_jieba_initialize()
+    if seconds is not None:
+        print(f"{'jieba.initialize()':40s} {seconds * 1000:8.1f} ms")
+
+if __name__ == '__main__':
+    main()
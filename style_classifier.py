@@ -1,47 +1,301 @@
+import os
 import json
-from collections import Counter
+import time
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# 计算风格词典内容摘要，作为预编译模型的版本号
+def style_dict_digest(style_dict):
+    payload = json.dumps(style_dict, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class StyleDictRegistry:
+    """风格词典注册表
+    - 词典文件只加载一次，之后只检查文件修改时间
+    - 文件内容真正变化时才递增版本号，依赖版本号的缓存随之失效
+    - 支持在运行中直接编辑 style_dict.json，无需重启
+    """
+
+    def __init__(self, path='style_dict.json', check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.version = 0
+        self.digest = None
+        self._style_dict = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """返回当前风格词典，文件变化时自动重新加载"""
+        self.refresh()
+        return self._style_dict
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._mtime is not None and now - self._checked_at < self.check_interval:
+            return self.version
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                if self._mtime is None:
+                    print(f"加载风格词典失败：{e}")
+                    self._mtime = -1
+                return self.version
+            if mtime == self._mtime and not force:
+                return self.version
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    style_dict = json.load(f)
+            except Exception as e:
+                # 编辑过程中文件可能暂时不是合法JSON，保留上一版本
+                print(f"加载风格词典失败：{e}")
+                return self.version
+            self._mtime = mtime
+            digest = style_dict_digest(style_dict)
+            if digest != self.digest:
+                self._style_dict = style_dict
+                self.digest = digest
+                self.version += 1
+        return self.version
+
+# 按文件路径共享的风格词典注册表
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_style_registry(style_dict_path='style_dict.json'):
+    key = os.path.abspath(style_dict_path)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(key, StyleDictRegistry(style_dict_path))
+    return registry
 
 # 读取风格词典
 def load_style_dict(style_dict_path='style_dict.json'):
-    try:
-        with open(style_dict_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"加载风格词典失败：{e}")
-        return {}
+    return get_style_registry(style_dict_path).get()
+
+class StyleScorer(ABC):
+    """风格打分器基类，子类实现 score() 返回 (歌词数, 风格数) 的得分矩阵"""
+
+    styles = []
+    version = None
+
+    @abstractmethod
+    def score(self, lyrics_list):
+        """返回 (歌词数, 风格数) 的得分矩阵"""
+
+    def distributions(self, lyrics_list):
+        """返回 (主风格下标数组, 归一化风格分布矩阵)"""
+        import numpy as np
+
+        scores = self.score(lyrics_list)
+        totals = scores.sum(axis=1, keepdims=True)
+        normalized = np.divide(scores, totals, out=np.zeros_like(scores), where=totals > 0)
+        # 强制选择一个风格，即使得分很低（并列时取词典中靠前的风格）
+        main_idx = scores.argmax(axis=1) if self.styles else np.zeros(len(lyrics_list), dtype=int)
+        return main_idx, normalized
+
+    def classify(self, lyrics):
+        """对单首歌词分类，返回 (main_style, normalized_count)"""
+        if not self.styles:
+            return None, {}
+        main_idx, normalized = self.distributions([lyrics])
+        normalized_count = dict(zip(self.styles, normalized[0].tolist()))
+        return self.styles[main_idx[0]], normalized_count
+
+class StyleModel(StyleScorer):
+    """预编译的风格模型
+    - 每个风格词典版本只拟合一次TF-IDF
+    - 风格向量保存为L2归一化的稀疏矩阵
+    - 单首或批量歌词都只需一次稀疏矩阵乘法
+    """
+
+    def __init__(self, style_dict):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.preprocessing import normalize
+
+        self.styles = list(style_dict.keys())
+        self.version = style_dict_digest(style_dict)
+        self.vectorizer = TfidfVectorizer(token_pattern=r'(?u)\b\w+\b', max_features=500)
+        docs = [' '.join(keywords) for keywords in style_dict.values()]
+        try:
+            style_tfidf = self.vectorizer.fit_transform(docs)
+        except ValueError:
+            # 风格词典为空或全部为空词表时，所有得分均为0
+            self.vectorizer = None
+            self.style_matrix = None
+        else:
+            # 形状为 (词表大小, 风格数)，便于直接与歌词向量相乘
+            self.style_matrix = normalize(style_tfidf).T.tocsr()
+
+    def score(self, lyrics_list):
+        """返回每首歌词与各风格的余弦相似度矩阵，形状为 (歌词数, 风格数)"""
+        import numpy as np
+
+        if self.style_matrix is None or not lyrics_list:
+            return np.zeros((len(lyrics_list), len(self.styles)))
+        # TfidfVectorizer默认对每行做L2归一化，点积即为余弦相似度
+        lyrics_matrix = self.vectorizer.transform(lyrics_list)
+        return (lyrics_matrix @ self.style_matrix).toarray()
+
+class StyleAutomaton(StyleScorer):
+    """基于Aho-Corasick多模式自动机的词典计数风格打分器
+    - 所有风格词编译为一个自动机，每首歌词只需线性扫描一遍
+    - 每次命中按词权重累加到对应风格，被多个风格共享的词权重被平均分摊
+    - 不依赖分词，直接在未分词的中文文本上匹配
+    """
+
+    def __init__(self, style_dict):
+        import numpy as np
+
+        self.styles = list(style_dict.keys())
+        self.version = style_dict_digest(style_dict) + ':automaton'
+        # 词 -> 风格权重向量
+        term_styles = {}
+        for i, keywords in enumerate(style_dict.values()):
+            for word in keywords:
+                if word:
+                    term_styles.setdefault(word, set()).add(i)
+        self.terms = list(term_styles)
+        self.term_weights = np.zeros((len(self.terms), len(self.styles)))
+        for t, word in enumerate(self.terms):
+            style_ids = list(term_styles[word])
+            self.term_weights[t, style_ids] = 1.0 / len(style_ids)
+        self._build(self.terms)
+
+    def _build(self, terms):
+        from collections import deque
+
+        # goto[state]: {字符: 下一状态}，output[state]: 在该状态结束的词编号
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for t, word in enumerate(terms):
+            state = 0
+            for ch in word:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(t)
+        # 广度优先计算失败指针，并合并后缀状态的输出
+        queue = deque(self.goto[0].values())
+        order = []
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0) if state else 0
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+        # 展开为确定性转移表，扫描时每个字符只需一次字典查找
+        self.delta = [dict(self.goto[0])] + [None] * (len(self.goto) - 1)
+        for state in order:
+            transitions = dict(self.delta[self.fail[state]])
+            transitions.update(self.goto[state])
+            self.delta[state] = transitions
+
+    def count_terms(self, lyrics):
+        """线性扫描一遍歌词，返回每个词的命中次数"""
+        import numpy as np
+
+        counts = [0] * len(self.terms)
+        delta, output = self.delta, self.output
+        state = 0
+        for ch in lyrics or '':
+            state = delta[state].get(ch, 0)
+            if output[state]:
+                for t in output[state]:
+                    counts[t] += 1
+        return np.array(counts, dtype=float)
+
+    def score(self, lyrics_list):
+        """返回每首歌词在各风格上的加权命中数，形状为 (歌词数, 风格数)"""
+        import numpy as np
+
+        if not self.terms or not lyrics_list:
+            return np.zeros((len(lyrics_list), len(self.styles)))
+        counts = np.vstack([self.count_terms(lyrics) for lyrics in lyrics_list])
+        return counts @ self.term_weights
+
+# 风格分类模式：'tfidf' 为TF-IDF余弦相似度，'automaton' 为词典计数快速模式
+STYLE_MODES = ('tfidf', 'automaton')
+DEFAULT_STYLE_MODE = os.environ.get('LYRICS_STYLE_MODE', 'tfidf')
+
+# 已编译的风格模型，按 (词典版本, 模式) 缓存
+_style_models = OrderedDict()
+_MAX_STYLE_MODELS = 4
+
+def _registered_digest(style_dict):
+    # 来自注册表的词典直接复用已计算的摘要，避免每次重新序列化
+    for registry in list(_registries.values()):
+        if registry._style_dict is style_dict:
+            return registry.digest
+    return None
+
+def style_model_version(style_dict, mode=None):
+    """返回风格词典在指定模式下的模型版本号，无需编译模型"""
+    mode = mode or DEFAULT_STYLE_MODE
+    if mode not in STYLE_MODES:
+        raise ValueError(f"未知的风格分类模式：{mode}")
+    digest = _registered_digest(style_dict) or style_dict_digest(style_dict)
+    return digest + ':automaton' if mode == 'automaton' else digest
+
+def get_style_model(style_dict, mode=None):
+    """获取风格词典对应的预编译模型，同一版本、同一模式只编译一次"""
+    key = style_model_version(style_dict, mode)
+    model = _style_models.get(key)
+    if model is None:
+        model = StyleAutomaton(style_dict) if key.endswith(':automaton') else StyleModel(style_dict)
+        _style_models[key] = model
+        if len(_style_models) > _MAX_STYLE_MODELS:
+            _style_models.popitem(last=False)
+    else:
+        _style_models.move_to_end(key)
+    return model
 
 # 风格分析函数
-def classify_style(lyrics, style_dict):
-    from sklearn.feature_extraction.text import TfidfVectorizer
+def classify_style(lyrics, style_dict, mode=None):
+    # 使用预编译的风格模型计算歌词与各风格的匹配度（TF-IDF余弦相似度或词典加权命中数），
+    # 归一化后得到每个风格的相对比例，并选择得分最高的风格作为主风格
+    return get_style_model(style_dict, mode).classify(lyrics)
+
+# 批量风格分析函数
+def classify_styles(songs, style_dict=None, mode=None):
+    """
+    对整个歌曲库批量进行风格分析，所有清洗后的歌词只向量化一次
+
+    参数:
+    - songs: 歌曲字典列表，包含'artist', 'lyric'字段
+    - style_dict: 风格词典，默认读取 style_dict.json
+    - mode: 分类模式，'tfidf' 或 'automaton'，默认取 LYRICS_STYLE_MODE 环境变量
+
+    返回:
+    (main_styles, distributions)
+    - main_styles: 长度为N的主风格数组
+    - distributions: 形状为 (N, 风格数) 的归一化风格分布矩阵，列顺序与风格词典一致
+    """
     import numpy as np
-    
-    style_count = {style: 0 for style in style_dict}
-    # 使用TF-IDF计算关键词权重，增加对中文的支持
-    vectorizer = TfidfVectorizer(token_pattern=r'(?u)\b\w+\b', max_features=500)
-    docs = [' '.join(keywords) for keywords in style_dict.values()]
-    tfidf_matrix = vectorizer.fit_transform(docs + [lyrics])
-    feature_names = vectorizer.get_feature_names_out()
-    
-    # 计算每个风格的得分
-    total_similarity = 0
-    for i, style in enumerate(style_dict.keys()):
-        style_vector = tfidf_matrix[i].toarray().flatten()
-        lyrics_vector = tfidf_matrix[-1].toarray().flatten()
-        # 使用余弦相似度计算风格与歌词的匹配度
-        dot_product = np.dot(style_vector, lyrics_vector)
-        norm_style = np.linalg.norm(style_vector)
-        norm_lyrics = np.linalg.norm(lyrics_vector)
-        if norm_style > 0 and norm_lyrics > 0:
-            similarity = dot_product / (norm_style * norm_lyrics)
-            style_count[style] = similarity
-            total_similarity += similarity
-        else:
-            style_count[style] = 0
-    
-    # 归一化得分，计算每个风格的相对比例
-    normalized_count = {style: score / total_similarity if total_similarity > 0 else 0 for style, score in style_count.items()}
-    
-    # 选择得分最高的风格作为主风格，强制选择一个风格，即使得分很低
-    main_style = max(style_count, key=style_count.get) if style_count else list(style_dict.keys())[0]
-    
-    return main_style, normalized_count
\ No newline at end of file
+    from lyrics_analyzer import clean_lyrics
+
+    if style_dict is None:
+        style_dict = load_style_dict()
+    model = get_style_model(style_dict, mode)
+    cleaned = [clean_lyrics(song['lyric'], song['artist']) for song in songs]
+    main_idx, distributions = model.distributions(cleaned)
+    if not model.styles:
+        return np.empty(len(songs), dtype=object), distributions
+    main_styles = np.asarray(model.styles, dtype=object)[main_idx]
+    return main_styles, distributions
@@ -0,0 +1,256 @@
+import os
+import time
+import uuid
+import itertools
+import shutil
+import atexit
+import threading
+from cache_utils import cache_path, lyric_hash, load_json, save_json
+from song_library import library_version
+from style_classifier import load_style_dict, get_style_model, get_style_registry, style_model_version
+
+# 磁盘上最多保留的风格词典版本数
+_MAX_VERSIONS = 4
+# 新分类的结果最多间隔多少秒写回磁盘，进程退出时写回剩余部分
+_FLUSH_INTERVAL = 5.0
+# 一个版本的分段文件超过该数量时，加载后合并为一个文件
+_MAX_SEGMENTS = 16
+
+class StyleStore:
+    """持久化的风格得分库
+    - 以 歌词内容哈希 + 风格词典版本（含分类模式）为键保存完整风格分布
+    - 持久化到磁盘，同一进程内所有会话和页面共享
+    - 每首歌词在每个词典版本下只分类一次
+    - 每个词典版本一个目录；每次写盘只把新分类的结果写成该目录下的一个新分段文件，
+      多个进程（如并行统计的子进程）同时写盘互不覆盖，加载时合并全部分段
+    - 新结果先记在内存中，距上次写盘超过 flush_interval 秒或进程退出时才写回
+    """
+
+    def __init__(self, directory=None, flush_interval=_FLUSH_INTERVAL):
+        self.directory = directory or cache_path('style_scores')
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._versions = {}  # {版本: {'styles': [...], 'scores': {歌词哈希: [分布]}}}
+        self._pending = {}   # {版本: (风格列表, {歌词哈希: [分布]})}，尚未写盘的新结果
+
+    def _version_dir(self, version):
+        # 版本号中的 ':' 不能出现在 Windows 文件名中
+        return os.path.join(self.directory, version.replace(':', '-'))
+
+    def _entry(self, version, styles):
+        entry = self._versions.get(version)
+        if entry is None or entry['styles'] != styles:
+            entry = self._versions[version] = {'styles': styles, 'scores': self._load(version, styles)}
+            while len(self._versions) > _MAX_VERSIONS:
+                self._versions.pop(next(iter(self._versions)))
+        return entry
+
+    def _load(self, version, styles):
+        """合并该版本目录下的全部分段文件，分段过多时合并成一个文件"""
+        directory = self._version_dir(version)
+        try:
+            names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+        except FileNotFoundError:
+            return {}
+        scores = {}
+        for name in names:
+            segment = load_json(os.path.join(directory, name), default=None) or {}
+            if segment.get('styles') == styles:
+                scores.update(segment.get('scores', {}))
+        if len(names) > _MAX_SEGMENTS:
+            try:
+                self._write_segment(version, styles, scores)
+                # 只删除本次读取过的分段，其他进程此后写入的分段保留
+                for name in names:
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        pass
+            except Exception as e:
+                print(f"合并风格得分缓存失败：{e}")
+        return scores
+
+    def _write_segment(self, version, styles, scores):
+        directory = self._version_dir(version)
+        save_json(os.path.join(directory, f"{time.time_ns():020d}-{uuid.uuid4().hex}.json"),
+                  {'styles': styles, 'scores': scores})
+        # 目录修改时间记录最近使用，超出版本数时删除最久未写入的版本
+        versions = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        versions = [path for path in versions if os.path.isdir(path) and path != directory]
+        versions.sort(key=os.path.getmtime, reverse=True)
+        for path in versions[_MAX_VERSIONS - 1:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def lookup(self, texts, style_dict, mode=None):
+        """
+        批量查询风格分布，未命中的歌词一次性批量分类后写入缓存
+
+        参数:
+        - texts: 分类器输入文本列表（通常为清洗后的歌词）
+        - style_dict: 风格词典
+        - mode: 风格分类模式，不同模式的结果分开缓存
+
+        返回:
+        (main_styles, distributions)，与 classify_styles 的返回格式一致
+        """
+        import numpy as np
+
+        # 全部命中时只需版本号，不必编译模型（避免加载sklearn）
+        styles = list(style_dict.keys())
+        version = style_model_version(style_dict, mode)
+        keys = [lyric_hash(text) for text in texts]
+        with self._lock:
+            scores = self._entry(version, styles)['scores']
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in scores and key not in missing:
+                    missing[key] = text
+        if missing:
+            # 编译模型和分类都在锁外进行，不阻塞其他会话的查询
+            model = get_style_model(style_dict, mode)
+            _, distributions = model.distributions(list(missing.values()))
+            rows = {key: [round(value, 6) for value in row.tolist()] for key, row in zip(missing, distributions)}
+            with self._lock:
+                scores.update(rows)
+                self._pending.setdefault(version, (styles, {}))[1].update(rows)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+        with self._lock:
+            distributions = np.array([scores[key] for key in keys], dtype=float).reshape(len(keys), len(styles))
+
+        if not styles:
+            return np.empty(len(texts), dtype=object), distributions
+        # 归一化不改变大小关系，主风格可直接由分布取最大值得到
+        main_styles = np.asarray(styles, dtype=object)[distributions.argmax(axis=1)] if len(texts) else np.empty(0, dtype=object)
+        return main_styles, distributions
+
+    def flush(self):
+        """将尚未写盘的风格得分写成新的分段文件"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        for version, (styles, rows) in pending.items():
+            try:
+                self._write_segment(version, styles, rows)
+            except Exception as e:
+                print(f"保存风格得分缓存失败：{e}")
+                with self._lock:
+                    self._pending.setdefault(version, (styles, {}))[1].update(rows)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_style_store():
+    """获取进程内共享的风格得分库"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = StyleStore()
+                atexit.register(_store.flush)
+    return _store
+
+# 风格缓存的版本号在进程内全局递增，不同会话的缓存版本号不会相同
+_cache_versions = itertools.count(1)
+
+class StyleCache(dict):
+    """会话中的 {歌曲id: 主风格} 缓存，同时记录分类时的歌词，歌词修改后自动重新分类
+    - 每次修改后 version 更新，筛选索引据此判断风格是否变化，不必逐首比较
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lyrics = {}  # 歌曲id -> 分类时的歌词
+        self.filled = None  # 上次补全后的 (歌曲库版本号, 缓存版本号)
+        self.touch()
+
+    def touch(self):
+        """标记缓存已修改"""
+        self.version = next(_cache_versions)
+
+    def pop(self, song_id, *default):
+        self.lyrics.pop(song_id, None)
+        result = super().pop(song_id, *default)
+        self.touch()
+        return result
+
+    def __setitem__(self, song_id, style):
+        super().__setitem__(song_id, style)
+        self.touch()
+
+    def __delitem__(self, song_id):
+        self.lyrics.pop(song_id, None)
+        super().__delitem__(song_id)
+        self.touch()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.touch()
+
+    def setdefault(self, song_id, style=None):
+        result = super().setdefault(song_id, style)
+        self.touch()
+        return result
+
+    def popitem(self):
+        song_id, style = super().popitem()
+        self.lyrics.pop(song_id, None)
+        self.touch()
+        return song_id, style
+
+    def clear(self):
+        super().clear()
+        self.lyrics.clear()
+        self.touch()
+
+    def is_fresh(self, song):
+        # 未修改的歌词通常是同一个字符串对象，比较时直接命中身份判断
+        return song['id'] in self and self.lyrics.get(song['id']) == song['lyric']
+
+def song_styles(songs, style_dict=None):
+    """带持久化缓存的 classify_styles，返回 (main_styles, distributions)"""
+    from lyrics_analyzer import clean_lyrics
+
+    if style_dict is None:
+        style_dict = load_style_dict()
+    texts = [clean_lyrics(song['lyric'], song['artist']) for song in songs]
+    return get_style_store().lookup(texts, style_dict)
+
+def check_style_cache_version(state):
+    """
+    风格词典版本变化时清空会话中的 {歌曲id: 主风格} 缓存
+
+    参数:
+    - state: 会话状态（如 st.session_state），使用其中的 'cache_styles' 和 'cache_styles_version'
+    """
+    version = get_style_registry().refresh()
+    if state.get('cache_styles_version') != version or not isinstance(state.get('cache_styles'), StyleCache):
+        state['cache_styles'] = StyleCache()
+        state['cache_styles_version'] = version
+    return state['cache_styles']
+
+def fill_style_cache(songs, cache_styles, style_dict=None):
+    """
+    补全会话中的 {歌曲id: 主风格} 缓存，只有缺失的歌曲才会查询风格得分库；
+    cache_styles 为 StyleCache 时，歌词修改过的歌曲也会重新查询
+
+    返回更新后的 cache_styles
+    """
+    if not isinstance(cache_styles, StyleCache):
+        missing = [song for song in songs if song['id'] not in cache_styles]
+        if missing:
+            main_styles, _ = song_styles(missing, style_dict)
+            cache_styles.update(zip((song['id'] for song in missing), main_styles.tolist()))
+        return cache_styles
+    version = library_version(songs)
+    if version is not None and cache_styles.filled == (version, cache_styles.version):
+        # 歌曲库和缓存自上次补全后都没有修改
+        return cache_styles
+    missing = [song for song in songs if not cache_styles.is_fresh(song)]
+    if missing:
+        main_styles, _ = song_styles(missing, style_dict)
+        cache_styles.lyrics.update((song['id'], song['lyric']) for song in missing)
+        cache_styles.update(zip((song['id'] for song in missing), main_styles.tolist()))
+    cache_styles.filled = (version, cache_styles.version)
+    return cache_styles
\ No newline at end of file
@@ -0,0 +1,116 @@
+import threading
+from collections import Counter
+from cache_utils import diff_songs, lyric_hash
+from song_library import library_version
+from lyrics_analyzer import iter_clean_lyrics, count_words
+from token_cache import warm_tokens
+
+_MASK = (1 << 64) - 1
+
+class TermFrequencyStore:
+    """增量维护的词频库
+    - 保存每首歌清洗、分词后的词频（过滤单字词）
+    - 预先合并好每位歌手和整个歌曲库的词频
+    - 新增、修改、删除歌曲时只更新受影响的歌曲和歌手
+    - 每个范围附带内容摘要作为语料版本号，可直接用作词云缓存键
+    """
+
+    def __init__(self):
+        self._songs = {}       # 歌曲id -> (歌手, 词频, 内容哈希, 是否有有效歌词)
+        self._known = {}       # 歌曲id -> (歌手, 歌词)，用于 sync 判断是否修改
+        self._synced = None    # 上次同步时歌曲库的版本号
+        self._artists = {}     # 歌手 -> 合并词频
+        self._total = Counter()
+        self._digests = {}     # 歌手 -> 内容摘要（各歌曲哈希之和）
+        self._total_digest = 0
+        self._documents = Counter()  # 歌手 -> 清洗后仍有内容的歌曲数
+        self._song_counts = Counter()  # 歌手 -> 歌曲数
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._songs)
+
+    def add(self, song_id, artist, lyric):
+        """新增或更新一首歌"""
+        counts = count_words([lyric])
+        has_text = any(iter_clean_lyrics([lyric]))
+        digest = int(lyric_hash(lyric)[:16], 16)
+        with self._lock:
+            self._remove(song_id)
+            self._synced = None
+            self._songs[song_id] = (artist, counts, digest, has_text)
+            self._known[song_id] = (artist, lyric)
+            self._artists.setdefault(artist, Counter()).update(counts)
+            self._total.update(counts)
+            self._digests[artist] = (self._digests.get(artist, 0) + digest) & _MASK
+            self._total_digest = (self._total_digest + digest) & _MASK
+            self._documents[artist] += has_text
+            self._song_counts[artist] += 1
+
+    def remove(self, song_id):
+        with self._lock:
+            self._remove(song_id)
+            self._synced = None
+
+    def _remove(self, song_id):
+        entry = self._songs.pop(song_id, None)
+        self._known.pop(song_id, None)
+        if entry is None:
+            return
+        artist, counts, digest, has_text = entry
+        artist_counts = self._artists[artist]
+        for counter in (artist_counts, self._total):
+            counter.subtract(counts)
+            for word in counts:
+                if counter[word] <= 0:
+                    del counter[word]
+        self._digests[artist] = (self._digests[artist] - digest) & _MASK
+        self._total_digest = (self._total_digest - digest) & _MASK
+        self._documents[artist] -= has_text
+        self._song_counts[artist] -= 1
+        if self._song_counts[artist] <= 0:
+            # 歌手的歌曲已全部删除
+            for table in (self._artists, self._digests, self._documents, self._song_counts):
+                table.pop(artist, None)
+
+    def sync(self, songs, workers=None):
+        """与歌曲库同步，只处理新增、修改和删除的歌曲，新歌词先多进程批量分词"""
+        version = library_version(songs)
+        if version is not None and version == self._synced:
+            # 歌曲库自上次同步后没有修改，不必逐首比较
+            return self
+        changed, removed = diff_songs(self._known, songs, fields=('artist', 'lyric'))
+        for song_id in removed:
+            self.remove(song_id)
+        warm_tokens(list(iter_clean_lyrics(song['lyric'] for song in changed)), workers)
+        for song in changed:
+            self.add(song['id'], song['artist'], song['lyric'])
+        self._synced = version
+        return self
+
+    def frequencies(self, artist=None):
+        """返回整个歌曲库或某位歌手的合并词频（只读，请勿修改）"""
+        if artist is None:
+            return self._total
+        return self._artists.get(artist, Counter())
+
+    def song_frequencies(self, song_id):
+        entry = self._songs.get(song_id)
+        return entry[1] if entry else Counter()
+
+    def song_count(self, artist=None):
+        """返回整个歌曲库或某位歌手的歌曲数"""
+        if artist is None:
+            return len(self._songs)
+        return self._song_counts.get(artist, 0)
+
+    def document_count(self, artist=None):
+        """返回清洗后仍有有效歌词的歌曲数"""
+        if artist is None:
+            return sum(self._documents.values())
+        return self._documents.get(artist, 0)
+
+    def version(self, artist=None):
+        """返回整个歌曲库或某位歌手的语料版本号（与歌曲顺序无关的内容摘要）"""
+        digest = self._total_digest if artist is None else self._digests.get(artist, 0)
+        return f"{digest:016x}"
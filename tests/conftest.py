@@ -0,0 +1,36 @@
+import os
+import sys
+import random
+import tempfile
+
+import pytest
+
+# 测试使用独立的缓存目录，不读写项目的 .cache（须在导入项目模块之前设置）
+os.environ.setdefault('LYRICS_CACHE_DIR', tempfile.mkdtemp(prefix='lyrics-test-cache-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = [
+    'love', 'rain', 'night', 'city', 'dream', 'river', 'light', 'road', 'heart', 'fire',
+    'ocean', 'summer', 'winter', 'star', 'shadow', 'home', 'memory', 'storm', 'song', 'time',
+]
+STYLES = ['流行', '摇滚', '民谣']
+
+def make_songs(n, seed=0, length=(8, 30)):
+    """随机生成 n 首歌，歌词由英文词组成（SimilarityIndex 按 \\w\\w+ 切词），部分歌曲带风格"""
+    rng = random.Random(seed)
+    songs = []
+    for i in range(n):
+        song = {
+            'id': f'song-{i}',
+            'artist': f'歌手{i % 7}',
+            'title': f'歌曲{i}',
+            'lyric': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(*length))),
+        }
+        if i % 3:
+            song['style'] = rng.choice(STYLES)
+        songs.append(song)
+    return songs
+
+@pytest.fixture
+def songs():
+    return make_songs(60)
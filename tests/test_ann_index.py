@@ -0,0 +1,46 @@
+import pytest
+
+from ann_index import IVFIndex, get_ann_index
+from recommender import get_similar_songs
+from similarity_index import SimilarityIndex
+from song_library import SongLibrary
+
+def test_approximate_with_all_probes_matches_exact(songs):
+    index = SimilarityIndex()
+    for base in songs[:10]:
+        exact = get_similar_songs(base, songs, 5, index=index, return_scores=True)
+        approximate = get_similar_songs(base, songs, 5, index=index, exact=False, probes=len(songs),
+                                        return_scores=True)
+        assert approximate == exact
+
+def test_approximate_requires_index(songs):
+    with pytest.raises(ValueError):
+        get_similar_songs(songs[0], songs, 5, exact=False)
+
+def test_ivf_follows_library_changes(songs):
+    index = SimilarityIndex()
+    ann = IVFIndex(index, n_clusters=4)
+    ann.sync(songs)
+    assert len(ann) == len(songs)
+    ann.sync(songs[10:])
+    assert len(ann) == len(songs) - 10
+    candidates = ann.candidates(index.vector(songs[20]), probes=4)
+    assert sorted(candidates) == sorted(song['id'] for song in songs[10:])
+
+def test_approximate_queries_skip_unchanged_library(songs, monkeypatch):
+    import similarity_index
+
+    library = SongLibrary(songs)
+    index = SimilarityIndex()
+    get_similar_songs(library[0], library, 5, index=index, exact=False)
+    calls = []
+    diff_songs = similarity_index.diff_songs
+    monkeypatch.setattr(similarity_index, 'diff_songs', lambda *args, **kwargs: calls.append(1) or diff_songs(*args, **kwargs))
+    for base in library[:5]:
+        get_similar_songs(base, library, 5, index=index, exact=False)
+    assert calls == []
+    library.append(dict(library[0], id='copy'))
+    ranked = get_similar_songs(library[0], library, 5, index=index, exact=False, return_scores=True)
+    assert calls == [1]
+    assert ranked[0][0] == 'copy'
+    assert len(get_ann_index(index)) == len(library)
@@ -0,0 +1,90 @@
+import random
+from collections import Counter
+
+import numpy as np
+
+from artist_stats import artist_keyword_counters
+from lyrics_analyzer import KeywordEngine
+from token_cache import get_token_cache
+
+PHRASES = ['我们一起走过漫长的路', '夜晚的风很温柔', '天空中飘着白云', '雨水打湿了回忆', '你说要去远方',
+           '城市的灯火', '梦想在心里燃烧', '时间带走了眼泪', '海边的灯塔亮着', '青春像一首歌']
+
+def make_library(n_songs, n_artists, seed=0):
+    rng = random.Random(seed)
+    return [{'id': f'song-{i}', 'artist': f'歌手{rng.randrange(n_artists)}', 'title': f'歌曲{i}',
+             'lyric': '\n'.join(rng.choice(PHRASES) for _ in range(rng.randint(1, 6)))}
+            for i in range(n_songs)]
+
+def artist_lyrics(songs):
+    artist_lyrics_dict = {}
+    for song in songs:
+        artist_lyrics_dict.setdefault(song['artist'], []).append(song['lyric'])
+    return artist_lyrics_dict
+
+def test_top_keyword_ids_match_single_queries():
+    songs = make_library(40, 5)
+    engine = KeywordEngine().sync(songs, workers=1)
+    doc_ids = ['song-3', 'missing', 'song-0', 'song-7']
+    positions, terms = engine.top_keyword_ids(doc_ids, top_k=4)
+    cache = get_token_cache()
+    for position, doc_id in enumerate(doc_ids):
+        words = [cache.word(int(term)) for term in terms[positions == position]]
+        assert words == engine.top_keywords(doc_id, 4)
+
+def test_keyword_counters_match_per_song_counting():
+    songs = make_library(120, 9, seed=1)
+    engine = KeywordEngine().sync(songs, workers=1)
+    artists = sorted({song['artist'] for song in songs})
+    codes = np.array([artists.index(song['artist']) for song in songs])
+    counters = artist_keyword_counters(engine, [song['id'] for song in songs], codes, len(artists), most_common=5)
+    for code, artist in enumerate(artists):
+        expected = Counter()
+        for song in songs:
+            if song['artist'] == artist:
+                expected.update(engine.top_keywords(song['id'], 10))
+        assert list(counters[code].items()) == expected.most_common(5)
+
+def test_aggregator_matches_artist_statistics(tmp_path, monkeypatch):
+    import style_store
+    from artist_stats import ArtistStatsAggregator, artist_statistics
+    from style_classifier import load_style_dict
+
+    monkeypatch.setattr(style_store, '_store', style_store.StyleStore(str(tmp_path)))
+    style_dict = load_style_dict()
+    songs = make_library(400, 50, seed=2)
+    songs[5]['lyric'] = ' '
+    aggregator = ArtistStatsAggregator(style_dict).sync(songs, style_dict, workers=1)
+    assert aggregator.all_statistics() == artist_statistics(artist_lyrics(songs), style_dict, workers=1)
+
+    # 修改、删除和新增歌曲后仍与全量计算一致
+    edited = [dict(song) for song in songs[20:]] + make_library(3, 2, seed=3)
+    edited[0]['lyric'] = '城市的灯火'
+    edited[1]['artist'] = '新歌手'
+    aggregator.sync(edited, style_dict, workers=1)
+    expected = artist_statistics(artist_lyrics(edited), style_dict, workers=1)
+    assert set(aggregator.artists()) == set(expected)
+    for artist, statistics in expected.items():
+        assert aggregator.statistics(artist) == statistics
+
+def test_parallel_statistics_match_serial(tmp_path, monkeypatch):
+    import style_store
+    from artist_stats import artist_statistics, parallel_artist_statistics
+    from style_classifier import load_style_dict
+
+    monkeypatch.setattr(style_store, '_store', style_store.StyleStore(str(tmp_path)))
+    style_dict = load_style_dict()
+    artist_lyrics_dict = artist_lyrics(make_library(150, 12, seed=4))
+    progress = []
+    parallel = parallel_artist_statistics(artist_lyrics_dict, style_dict, workers=2,
+                                          progress=lambda done, total: progress.append((done, total)))
+    assert parallel == artist_statistics(artist_lyrics_dict, style_dict, workers=1)
+    assert list(parallel) == list(artist_lyrics_dict)
+    assert progress[-1] == (12, 12)
+
+def test_shards_balance_lyric_length():
+    from artist_stats import shard_artists
+
+    artist_lyrics_dict = {'大': ['字' * 100], '中': ['字' * 60], '小1': ['字' * 30], '小2': ['字' * 30]}
+    shards = sorted(sorted(shard) for shard in shard_artists(artist_lyrics_dict, 2))
+    assert shards == sorted([['大'], ['中', '小1', '小2']])
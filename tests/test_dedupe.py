@@ -0,0 +1,87 @@
+import random
+
+from dedupe import MinHashIndex, dedupe_texts
+from token_cache import get_token_cache
+
+LINES = [
+    '天空中飘着白云', '我在城市里流浪', '雨水打湿了回忆', '夜晚的风很温柔', '你说要去远方',
+    '海边的灯塔亮着', '青春像一首歌', '时间带走了眼泪', '阳光洒在窗前', '我们曾经自由',
+    '梦想在心里燃烧', '孤单的人在等待', '走过漫长的路', '星星照亮黑夜', '花开又花落',
+]
+
+def make_lyric(rng, n_lines=12):
+    return '\n'.join(rng.choice(LINES) + rng.choice(['啊', '呀', '吧', '']) for _ in range(n_lines))
+
+def near_duplicate(rng, lyric):
+    """重新上传的版本：加上LRC时间编码、制作信息和标点，并改动一行"""
+    lines = lyric.split('\n')
+    lines[rng.randrange(len(lines))] = '这一行被改写了'
+    return '作词：某人\n' + '\n'.join(f'[00:{i:02d}.00]{line}，' for i, line in enumerate(lines))
+
+def test_minhash_finds_near_duplicates():
+    rng = random.Random(0)
+    originals = {f'song-{i}': make_lyric(rng, 24) for i in range(40)}
+    index = MinHashIndex(threshold=0.6)
+    index.sync([{'id': song_id, 'lyric': lyric} for song_id, lyric in originals.items()])
+
+    found = 0
+    for song_id, lyric in originals.items():
+        matches = [match for match, _ in index.query(near_duplicate(rng, lyric))]
+        found += bool(matches) and matches[0] == song_id
+    assert found / len(originals) >= 0.9
+
+def test_minhash_ignores_unrelated_lyrics():
+    index = MinHashIndex()
+    index.add('a', '\n'.join(LINES[:8]))
+    assert index.query('\n'.join(LINES[8:])) == []
+    assert [song_id for song_id, _ in index.query('\n'.join(LINES[:8]))] == ['a']
+    assert index.query('\n'.join(LINES[:8]), exclude='a') == []
+
+def test_duplicate_groups_follow_sync():
+    rng = random.Random(1)
+    lyric = make_lyric(rng, 24)
+    songs = [
+        {'id': 'a', 'lyric': lyric},
+        {'id': 'b', 'lyric': near_duplicate(rng, lyric)},
+        {'id': 'c', 'lyric': '\n'.join(LINES)},
+    ]
+    index = MinHashIndex(threshold=0.6).sync(songs)
+    assert [sorted(group) for group in index.duplicate_groups()] == [['a', 'b']]
+    index.sync(songs[1:])
+    assert index.duplicate_groups() == []
+
+def test_duplicate_groups_merge_large_buckets():
+    rng = random.Random(2)
+    lyric = make_lyric(rng, 24)
+    songs = [{'id': i, 'lyric': lyric if i % 2 else near_duplicate(rng, lyric)} for i in range(30)]
+    songs.append({'id': 'other', 'lyric': make_lyric(rng, 24)})
+    groups = MinHashIndex(threshold=0.6).sync(songs).duplicate_groups()
+    assert [sorted(group) for group in groups] == [list(range(30))]
+
+def test_precomputed_signature_matches_lyric(monkeypatch):
+    rng = random.Random(3)
+    lyric = make_lyric(rng, 24)
+    index = MinHashIndex(threshold=0.6)
+    index.add('a', lyric)
+    duplicate = near_duplicate(rng, lyric)
+    signature = index.signature(duplicate)
+    expected = index.query(duplicate)
+
+    def fail(lyric):
+        raise AssertionError("传入签名时不应重新计算")
+
+    monkeypatch.setattr(index, 'signature', fail)
+    assert index.query(duplicate, signature=signature) == expected
+    index.add('b', duplicate, signature=signature)
+    assert [sorted(group) for group in index.duplicate_groups()] == [['a', 'b']]
+    index.add('empty', '', signature=None)
+    assert 'empty' in index and index.query('', signature=None) == []
+
+def test_dedupe_texts_are_the_tokenized_keys():
+    rng = random.Random(4)
+    lyrics = [near_duplicate(rng, make_lyric(rng)) for _ in range(3)]
+    texts = dedupe_texts(lyrics)
+    assert all('[00:' not in text and '作词' not in text for text in texts)
+    MinHashIndex().sync([{'id': i, 'lyric': lyric} for i, lyric in enumerate(lyrics)])
+    cache = get_token_cache()
+    assert all(text in cache for text in texts)
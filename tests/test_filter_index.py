@@ -0,0 +1,78 @@
+import pytest
+
+from conftest import make_songs
+from filter_index import FilterIndex
+from recommender import get_similar_songs, recommend
+from similarity_index import SimilarityIndex
+from song_library import SongLibrary
+from style_store import StyleCache
+
+def _naive(songs, artists=None, styles=None, artist_contains=None):
+    return [
+        song['id'] for song in songs
+        if (not artists or song['artist'] in artists)
+        and (not styles or song.get('style') in styles)
+        and (not artist_contains or artist_contains in song['artist'])
+    ]
+
+@pytest.mark.parametrize('conditions', [
+    {},
+    {'artists': ['歌手1', '歌手3']},
+    {'styles': ['摇滚']},
+    {'artists': ['歌手2'], 'styles': ['流行', '民谣']},
+    {'artist_contains': '4'},
+    {'artists': ['不存在的歌手']},
+])
+def test_mask_matches_naive_filter(songs, conditions):
+    index = FilterIndex().sync(songs)
+    assert index.ids(**conditions) == _naive(songs, **conditions)
+    assert index.count(**conditions) == len(_naive(songs, **conditions))
+
+def test_sync_follows_edits_and_removals(songs):
+    index = FilterIndex().sync(songs)
+    edited = [dict(song) for song in songs[5:]]
+    edited[0]['artist'] = '新歌手'
+    edited[1]['style'] = '摇滚'
+    index.sync(edited)
+    assert len(index) == len(edited)
+    for conditions in ({'artists': ['新歌手']}, {'styles': ['摇滚']}, {'artist_contains': '1'}):
+        assert index.ids(**conditions) == _naive(edited, **conditions)
+
+def test_sync_skips_unchanged_library_and_styles(songs):
+    library = SongLibrary(songs)
+    styles = StyleCache((song['id'], song.get('style')) for song in songs)
+    index = FilterIndex().sync(library, styles)
+    # 歌曲库和风格缓存都没有修改时不再逐首比较
+    library[0]['artist'] = '绕过版本号的修改'
+    index.sync(library, styles)
+    assert index.ids(artists=['绕过版本号的修改']) == []
+    styles[songs[1]['id']] = '摇滚'
+    index.sync(library, styles)
+    assert index.ids(artists=['绕过版本号的修改']) == [songs[0]['id']]
+    assert songs[1]['id'] in index.ids(styles=['摇滚'])
+
+def test_style_cache_version_changes_on_every_mutation():
+    cache = StyleCache()
+    versions = [cache.version]
+    cache['a'] = '流行'
+    versions.append(cache.version)
+    cache.update(b='摇滚')
+    versions.append(cache.version)
+    cache.pop('a')
+    versions.append(cache.version)
+    del cache['b']
+    versions.append(cache.version)
+    assert len(set(versions)) == len(versions)
+
+def test_recommend_uses_shared_indexes_for_each_library(songs):
+    first = SongLibrary(songs)
+    second = SongLibrary(dict(song, id='other-' + song['id']) for song in make_songs(20, seed=5))
+    expected = recommend(first, 'love', return_scores=True)
+    assert recommend(second, 'love', return_scores=True) != expected
+    assert recommend(first, 'love', return_scores=True) == expected
+
+def test_candidate_ids_restrict_results(songs):
+    index = SimilarityIndex()
+    allowed = [song['id'] for song in songs[::2]]
+    ranked = get_similar_songs(songs[1], songs, 5, index=index, candidate_ids=allowed, return_scores=True)
+    assert ranked and set(song_id for song_id, _ in ranked) <= set(allowed)
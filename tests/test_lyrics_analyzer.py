@@ -0,0 +1,64 @@
+import random
+
+import numpy as np
+
+from lyrics_analyzer import KeywordEngine, clean_lyrics, extract_keywords, iter_clean_lyrics, tokenize
+
+PHRASES = ['我们一起走过漫长的路', '夜晚的风很温柔', '天空中飘着白云', '雨水打湿了回忆', '你说要去远方',
+           '城市的灯火', '梦想在心里燃烧', '时间带走了眼泪']
+
+def make_lyrics(n, seed=0):
+    rng = random.Random(seed)
+    return ['\n'.join(rng.choice(PHRASES) for _ in range(rng.randint(2, 6))) for _ in range(n)]
+
+def reference_keywords(lyrics_list, top_k):
+    """原实现：对输入整体拟合 TfidfVectorizer，每行稳定排序后倒序取前 top_k 个非零词"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(tokenizer=tokenize, token_pattern=None)
+    tfidf = vectorizer.fit_transform(lyrics_list)
+    names = vectorizer.get_feature_names_out()
+    keywords = []
+    for row in tfidf:
+        row_data = row.toarray().flatten()
+        indices = np.argsort(row_data, kind='stable')[::-1][:top_k]
+        keywords.append([names[idx] for idx in indices if row_data[idx] > 0])
+    return keywords
+
+def test_extract_keywords_matches_vectorizer():
+    lyrics = make_lyrics(30)
+    for top_k in (3, 10):
+        assert extract_keywords(lyrics, top_k) == reference_keywords(lyrics, top_k)
+
+def test_engine_sync_matches_fresh_engine():
+    lyrics = make_lyrics(20, seed=1)
+    songs = [{'id': i, 'lyric': lyric} for i, lyric in enumerate(lyrics)]
+    engine = KeywordEngine().sync(songs, workers=1)
+    edited = [dict(song) for song in songs[5:]]
+    edited[0]['lyric'] = '全新的歌词 城市的灯火'
+    engine.sync(edited, workers=1)
+    fresh = KeywordEngine().sync(edited, workers=1)
+    assert len(engine) == len(fresh) == 15
+    for song in edited:
+        assert engine.top_keywords(song['id'], 5, with_weight=True) == fresh.top_keywords(song['id'], 5, with_weight=True)
+
+def test_fixed_corpus_df_matches_full_engine():
+    lyrics = make_lyrics(20, seed=2)
+    engine = KeywordEngine()
+    for i, lyric in enumerate(lyrics):
+        engine.add(i, lyric)
+    # 只含部分歌曲的引擎使用整个语料的IDF，关键词与完整引擎一致
+    partial = KeywordEngine(engine.corpus_df())
+    for i in range(5):
+        partial.add(i, lyrics[i])
+        assert partial.top_keywords(i, 5) == engine.top_keywords(i, 5)
+
+def test_clean_lyrics_drops_credits_and_timestamps():
+    text = '作词：某人\n[00:01.00]夜晚的风，很温柔！\n\n周杰伦 演唱会版\n[00:05.20]Hello world'
+    assert clean_lyrics(text, '周杰伦') == '夜晚的风 很温柔 Hello world'
+    assert clean_lyrics('作曲：某人') == '示例歌词'
+    assert clean_lyrics(None) == '示例歌词'
+
+def test_iter_clean_lyrics_skips_empty_lyrics():
+    texts = ['夜晚的风', '', None, '编曲：某人', '天空中飘着白云']
+    assert list(iter_clean_lyrics(texts)) == ['夜晚的风', '天空中飘着白云']
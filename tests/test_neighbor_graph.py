@@ -0,0 +1,43 @@
+import pytest
+
+from neighbor_graph import NeighborGraph, build_neighbor_graph
+from recommender import get_similar_songs
+from similarity_index import SimilarityIndex
+
+def _ids(ranked):
+    return [song_id for song_id, _ in ranked]
+
+def _scores(ranked):
+    return [score for _, score in ranked]
+
+def test_neighbor_graph_matches_index(songs):
+    index = SimilarityIndex()
+    # 很小的内存预算，强制分多块计算
+    graph = build_neighbor_graph(songs, k=8, memory_budget=4096)
+    for base in songs[:10]:
+        for consider_style in (True, False):
+            from_graph = get_similar_songs(base, songs, 5, consider_style, graph=graph, return_scores=True)
+            indexed = get_similar_songs(base, songs, 5, consider_style, index=index, return_scores=True)
+            assert _ids(from_graph) == _ids(indexed)
+            assert _scores(from_graph) == pytest.approx(_scores(indexed), rel=1e-5)
+
+def test_neighbor_graph_skips_edited_songs(songs):
+    graph = build_neighbor_graph(songs, k=8)
+    edited = dict(songs[0], lyric='completely new words here')
+    assert graph.lookup(edited, {song['id']: song for song in songs}) is None
+
+def test_neighbor_graph_round_trips_through_disk(songs, tmp_path):
+    graph = build_neighbor_graph(songs, k=6)
+    path = str(tmp_path / 'graph.npz')
+    graph.save(path)
+    loaded = NeighborGraph.load(path)
+    songs_by_id = {song['id']: song for song in songs}
+    assert loaded.ids == graph.ids
+    for base in songs[:5]:
+        assert loaded.lookup(base, songs_by_id, with_scores=True) == graph.lookup(base, songs_by_id, with_scores=True)
+
+def test_cache_paths_resolve_lazily(monkeypatch, tmp_path):
+    import neighbor_graph
+
+    monkeypatch.setattr('cache_utils.CACHE_DIR', str(tmp_path / 'cache'))
+    assert neighbor_graph.default_graph_path().startswith(str(tmp_path / 'cache'))
@@ -0,0 +1,57 @@
+from conftest import make_songs
+from recommendation_cache import RecommendationCache
+from recommender import get_similar_songs
+from similarity_index import SimilarityIndex
+from song_library import SongLibrary
+
+def test_recommendation_cache_hits_until_library_changes(songs):
+    index = SimilarityIndex()
+    cache = RecommendationCache()
+    base = dict(songs[0])
+    base.pop('style', None)
+    first = get_similar_songs(base, songs, 5, index=index, cache=cache)
+    assert get_similar_songs(base, songs, 5, index=index, cache=cache) == first
+    assert (cache.hits, cache.misses) == (1, 1)
+    added = dict(make_songs(1, seed=9)[0], id='song-new')
+    get_similar_songs(base, songs + [added], 5, index=index, cache=cache)
+    assert cache.misses == 2
+
+def test_cache_hit_does_not_sync_index(songs, monkeypatch):
+    library = SongLibrary(songs)
+    index = SimilarityIndex()
+    cache = RecommendationCache()
+    first = get_similar_songs(library[0], library, 5, index=index, cache=cache, return_scores=True)
+
+    def fail(songs):
+        raise AssertionError("命中缓存时不应同步索引")
+
+    monkeypatch.setattr(index, 'sync', fail)
+    assert get_similar_songs(library[0], library, 5, index=index, cache=cache, return_scores=True) == first
+    assert cache.hits == 1
+
+def test_cache_keys_on_base_style(songs):
+    library = SongLibrary(songs)
+    index = SimilarityIndex()
+    cache = RecommendationCache()
+    base = dict(library[1], style='摇滚')
+    rock = get_similar_songs(base, library, 5, index=index, cache=cache, return_scores=True)
+    assert get_similar_songs(base, library, 5, index=index, cache=cache, return_scores=True) == rock
+    assert (cache.hits, cache.misses) == (1, 1)
+    folk = get_similar_songs(dict(base, style='民谣'), library, 5, index=index, cache=cache, return_scores=True)
+    assert cache.misses == 2
+    assert folk == get_similar_songs(dict(base, style='民谣'), library, 5, index=SimilarityIndex(),
+                                     return_scores=True)
+    # 其他歌曲的风格修改后歌曲库版本变化，不会命中旧结果
+    library.update_song(library[2]['id'], style='摇滚')
+    get_similar_songs(base, library, 5, index=index, cache=cache, return_scores=True)
+    assert cache.misses == 3
+
+def test_recommendation_cache_evicts_least_recently_used():
+    cache = RecommendationCache(max_items=2)
+    cache.put('a', [(1, 1.0)])
+    cache.put('b', [(2, 1.0)])
+    assert cache.get('a') == [(1, 1.0)]
+    cache.put('c', [(3, 1.0)])
+    assert cache.get('b') is None
+    assert cache.get('a') == [(1, 1.0)]
+    assert len(cache) == 2
@@ -0,0 +1,16 @@
+from recommender import get_similar_songs, iter_similar_songs
+from similarity_index import SimilarityIndex
+
+def test_iter_similar_songs_matches_single_queries(songs):
+    index = SimilarityIndex()
+    base_ids = [song['id'] for song in songs[:12]]
+    by_id = {song['id']: song for song in songs}
+    for base_id, recommended in iter_similar_songs(base_ids, songs, 5, index=index, block_size=5):
+        single = get_similar_songs(by_id[base_id], songs, 5, index=index)
+        assert [song['id'] for song in recommended] == [song['id'] for song in single]
+
+def test_iter_similar_songs_yields_empty_for_unknown_ids(songs):
+    results = list(iter_similar_songs(['missing', songs[0]['id'], 'gone'], songs, 3, block_size=2))
+    assert [base_id for base_id, _ in results] == ['missing', songs[0]['id'], 'gone']
+    assert results[0][1] == [] and results[2][1] == []
+    assert len(results[1][1]) == 3
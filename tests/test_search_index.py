@@ -0,0 +1,58 @@
+import pytest
+
+from recommender import recommend
+from search_index import BM25Index
+
+DOCS = [
+    {'id': 1, 'lyric': 'apple banana'},
+    {'id': 2, 'lyric': 'apple apple apple cherry'},
+    {'id': 3, 'lyric': 'cherry date'},
+    {'id': 4, 'lyric': 'banana date elderberry fig grape'},
+]
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    index = BM25Index().sync(DOCS)
+    assert [doc_id for doc_id, _ in index.search('apple')] == [2, 1]
+    # 稀有词的权重更高：同时命中时 cherry（2篇）不如 fig（1篇）
+    ranked = index.search('fig cherry')
+    assert ranked[0][0] == 4
+    assert {doc_id for doc_id, _ in ranked} == {2, 3, 4}
+    assert index.search('kiwi') == []
+
+def test_bm25_candidates_and_top_k():
+    index = BM25Index().sync(DOCS)
+    assert [doc_id for doc_id, _ in index.search('apple', candidates={1})] == [1]
+    assert len(index.search('apple banana cherry date', top_k=2)) == 2
+
+def test_bm25_sync_updates_postings():
+    index = BM25Index().sync(DOCS)
+    edited = [dict(doc) for doc in DOCS[1:]]
+    edited[0]['lyric'] = 'cherry only'
+    index.sync(edited)
+    assert len(index) == 3
+    assert index.search('apple') == []
+    assert index.scores('cherry') == BM25Index().sync(edited).scores('cherry')
+
+def test_recommend_ranks_matches_first():
+    db = [
+        {'id': 'a', 'artist': '甲', 'title': 'A', 'lyrics': 'rain rain night', 'style': '流行'},
+        {'id': 'b', 'artist': '乙', 'title': 'B', 'lyrics': 'sunny day', 'style': '流行'},
+        {'id': 'c', 'artist': '甲', 'title': 'C', 'lyrics': 'rain on the road', 'style': '摇滚'},
+    ]
+    ranked = recommend(db, 'rain', return_scores=True)
+    assert [song_id for song_id, _ in ranked] == ['a', 'c', 'b']
+    assert ranked[-1][1] == 0.0
+    results = recommend(db, '摇滚 rain')
+    assert [song['id'] for song in results] == ['c']
+    assert results[0]['match_count'] > 0
+    assert 'match_count' not in db[2]
+
+def test_recommend_positional_ids_and_mixed_input():
+    db = [
+        {'artist': '甲', 'title': 'A', 'lyrics': 'rain night'},
+        {'artist': '乙', 'title': 'B', 'lyrics': 'sunny day'},
+    ]
+    assert recommend(db, 'sunny', return_scores=True)[0][0] == ('#', 1)
+    assert [song['title'] for song in recommend(db, 'sunny')] == ['B', 'A']
+    with pytest.raises(ValueError):
+        recommend(db + [{'id': 0, 'artist': '丙', 'title': 'C', 'lyrics': 'rain'}], 'rain')
@@ -0,0 +1,37 @@
+import pytest
+
+from recommender import get_similar_songs
+from similarity_index import SimilarityIndex
+
+def _ids(ranked):
+    return [song_id for song_id, _ in ranked]
+
+def _scores(ranked):
+    return [score for _, score in ranked]
+
+@pytest.mark.parametrize('consider_style', [True, False])
+def test_index_matches_refit(songs, consider_style):
+    index = SimilarityIndex()
+    for base in songs[:10]:
+        exact = get_similar_songs(base, songs, 5, consider_style, return_scores=True)
+        indexed = get_similar_songs(base, songs, 5, consider_style, index=index, return_scores=True)
+        assert _ids(indexed) == _ids(exact)
+        assert _scores(indexed) == pytest.approx(_scores(exact))
+
+def test_index_follows_edits(songs):
+    index = SimilarityIndex()
+    get_similar_songs(songs[0], songs, 5, index=index)
+    edited = [dict(song) for song in songs[:-5]]
+    edited[3]['lyric'] = edited[0]['lyric']
+    indexed = get_similar_songs(edited[0], edited, 5, index=index, return_scores=True)
+    assert indexed == get_similar_songs(edited[0], edited, 5, index=SimilarityIndex(), return_scores=True)
+    assert indexed[0][0] == edited[3]['id']
+
+def test_index_version_follows_content(songs):
+    index = SimilarityIndex().sync(songs)
+    version = index.version
+    assert SimilarityIndex().sync(list(reversed(songs))).version == version
+    index.remove(songs[0]['id'])
+    assert index.version != version
+    index.add(songs[0]['id'], songs[0]['lyric'])
+    assert index.version == version
@@ -0,0 +1,43 @@
+from similarity_index import SimilarityIndex
+from song_library import SongLibrary, check_song_library, library_version
+
+def test_every_mutation_changes_the_version():
+    library = SongLibrary([{'id': 1, 'lyric': 'a'}])
+    seen = {library.version}
+    mutations = [
+        lambda: library.append({'id': 2, 'lyric': 'b'}),
+        lambda: library.extend([{'id': 3, 'lyric': 'c'}]),
+        lambda: library.insert(0, {'id': 4, 'lyric': 'd'}),
+        lambda: library.pop(),
+        lambda: library.__delitem__(0),
+        lambda: library.__setitem__(slice(0, 1), []),
+        lambda: library.update_song(2, lyric='e'),
+        lambda: library.sort(key=lambda song: song['id']),
+        library.touch,
+    ]
+    for mutate in mutations:
+        mutate()
+        assert library.version not in seen
+        seen.add(library.version)
+    version = library.version
+    assert library.update_song('missing', lyric='x') is None
+    assert library.version == version
+
+def test_versions_are_unique_across_libraries():
+    assert SongLibrary().version != SongLibrary().version
+    assert library_version([]) is None
+
+def test_check_song_library_wraps_plain_lists():
+    state = {'song_db': [{'id': 1, 'lyric': 'a'}]}
+    library = check_song_library(state)
+    assert isinstance(library, SongLibrary) and state['song_db'] is library
+    assert check_song_library(state) is library
+    assert isinstance(check_song_library({}), SongLibrary)
+
+def test_index_sees_in_place_updates(songs):
+    library = SongLibrary(songs)
+    index = SimilarityIndex().sync(library)
+    version = index.version
+    library.update_song(songs[0]['id'], lyric='brand new words')
+    assert index.sync(library).version != version
+    assert index.sync(SongLibrary(library)).version == index.version
@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+from style_classifier import StyleAutomaton, StyleDictRegistry, StyleModel, get_style_model, get_style_registry
+from style_store import StyleCache, check_style_cache_version
+
+STYLE_DICT = {'爱情': ['爱', '爱情', '想你'], '伤感': ['眼泪', '想你', '情歌']}
+
+def write_dict(path, style_dict, mtime_ns):
+    path.write_text(json.dumps(style_dict, ensure_ascii=False), encoding='utf-8')
+    # 显式设置修改时间，不依赖文件系统的时间精度
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_registry_reloads_only_changed_content(tmp_path):
+    path = tmp_path / 'style_dict.json'
+    write_dict(path, STYLE_DICT, 10 ** 18)
+    registry = StyleDictRegistry(str(path), check_interval=0)
+    assert registry.get() == STYLE_DICT
+    assert registry.version == 1
+    loaded = registry.get()
+    # 只改修改时间、内容不变时版本号不变，仍返回同一个词典对象
+    write_dict(path, STYLE_DICT, 2 * 10 ** 18)
+    assert registry.get() is loaded
+    assert registry.version == 1
+    changed = dict(STYLE_DICT, 摇滚=['自由'])
+    write_dict(path, changed, 3 * 10 ** 18)
+    assert registry.get() == changed
+    assert registry.version == 2
+
+def test_registry_keeps_last_dict_on_invalid_json(tmp_path):
+    path = tmp_path / 'style_dict.json'
+    write_dict(path, STYLE_DICT, 10 ** 18)
+    registry = StyleDictRegistry(str(path), check_interval=0)
+    registry.get()
+    path.write_text('{"爱情": [', encoding='utf-8')
+    os.utime(path, ns=(2 * 10 ** 18, 2 * 10 ** 18))
+    assert registry.get() == STYLE_DICT
+    assert registry.version == 1
+
+def test_model_compiled_once_per_version(tmp_path):
+    path = tmp_path / 'style_dict.json'
+    write_dict(path, STYLE_DICT, 10 ** 18)
+    registry = get_style_registry(str(path))
+    registry.check_interval = 0
+    model = get_style_model(registry.get())
+    assert get_style_model(registry.get()) is model
+    write_dict(path, dict(STYLE_DICT, 摇滚=['自由']), 2 * 10 ** 18)
+    assert get_style_model(registry.get()) is not model
+
+def test_session_style_cache_cleared_on_version_bump(tmp_path, monkeypatch):
+    path = tmp_path / 'style_dict.json'
+    write_dict(path, STYLE_DICT, 10 ** 18)
+    registry = StyleDictRegistry(str(path), check_interval=0)
+    monkeypatch.setattr('style_store.get_style_registry', lambda: registry)
+    state = {}
+    cache = check_style_cache_version(state)
+    assert isinstance(cache, StyleCache)
+    cache[1] = '爱情'
+    assert check_style_cache_version(state) is cache
+    write_dict(path, dict(STYLE_DICT, 摇滚=['自由']), 2 * 10 ** 18)
+    assert check_style_cache_version(state) == {}
+    assert state['cache_styles_version'] == 2
+
+def test_automaton_counts_overlapping_terms():
+    automaton = StyleAutomaton(STYLE_DICT)
+    counts = dict(zip(automaton.terms, automaton.count_terms('爱情歌，我想你想你').tolist()))
+    assert counts == {'爱': 1, '爱情': 1, '想你': 2, '眼泪': 0, '情歌': 1}
+
+def test_automaton_splits_shared_terms():
+    automaton = StyleAutomaton(STYLE_DICT)
+    scores = automaton.score(['想你', '眼泪 眼泪', ''])
+    assert scores.tolist() == [[0.5, 0.5], [0.0, 2.0], [0.0, 0.0]]
+    assert automaton.classify('爱情')[0] == '爱情'
+
+def test_models_agree_on_main_style():
+    lyrics = ['爱 爱情', '眼泪 情歌']
+    for model in (StyleModel(STYLE_DICT), StyleAutomaton(STYLE_DICT)):
+        main_idx, distributions = model.distributions(lyrics)
+        assert main_idx.tolist() == [0, 1]
+        assert distributions.sum(axis=1) == pytest.approx([1.0, 1.0])
+
+def test_automaton_mode_is_versioned_separately():
+    assert get_style_model(STYLE_DICT, 'automaton') is not get_style_model(STYLE_DICT, 'tfidf')
+    assert isinstance(get_style_model(STYLE_DICT, 'automaton'), StyleAutomaton)
+    with pytest.raises(ValueError):
+        get_style_model(STYLE_DICT, 'unknown')
@@ -0,0 +1,74 @@
+import pytest
+
+import style_store
+from style_store import StyleCache, StyleStore, fill_style_cache
+
+STYLE_DICT = {'爱情': ['爱', '爱情', '想你'], '伤感': ['眼泪', '想你', '情歌']}
+TEXTS = ['爱 爱情', '眼泪 情歌', '想你']
+
+@pytest.fixture
+def compiles(monkeypatch):
+    """记录每次编译（取得）风格模型时的词典"""
+    calls = []
+    get_style_model = style_store.get_style_model
+
+    def counting(style_dict, mode=None):
+        calls.append(style_dict)
+        return get_style_model(style_dict, mode)
+
+    monkeypatch.setattr(style_store, 'get_style_model', counting)
+    return calls
+
+def test_lookup_classifies_each_text_once(tmp_path, compiles):
+    store = StyleStore(tmp_path)
+    main_styles, distributions = store.lookup(TEXTS, STYLE_DICT)
+    assert main_styles.tolist()[:2] == ['爱情', '伤感']
+    assert distributions.sum(axis=1) == pytest.approx([1.0] * 3)
+    again = store.lookup(TEXTS[::-1], STYLE_DICT)
+    assert again[1].tolist() == distributions[::-1].tolist()
+    assert len(compiles) == 1
+
+def test_flushed_scores_survive_restart(tmp_path, compiles):
+    store = StyleStore(tmp_path)
+    distributions = store.lookup(TEXTS, STYLE_DICT)[1]
+    store.flush()
+    restarted = StyleStore(tmp_path)
+    assert restarted.lookup(TEXTS, STYLE_DICT)[1].tolist() == distributions.tolist()
+    assert len(compiles) == 1
+
+def test_concurrent_writers_keep_each_others_scores(tmp_path, compiles):
+    # 两个进程各自的得分库先后写盘，后写的不会覆盖先写的
+    first, second = StyleStore(tmp_path), StyleStore(tmp_path)
+    first.lookup(TEXTS[:1], STYLE_DICT)
+    second.lookup(TEXTS[1:], STYLE_DICT)
+    first.flush()
+    second.flush()
+    StyleStore(tmp_path).lookup(TEXTS, STYLE_DICT)
+    assert len(compiles) == 2
+
+def test_segments_are_compacted(tmp_path, monkeypatch, compiles):
+    monkeypatch.setattr(style_store, '_MAX_SEGMENTS', 2)
+    store = StyleStore(tmp_path)
+    for text in TEXTS:
+        store.lookup([text], STYLE_DICT)
+        store.flush()
+    [directory] = tmp_path.iterdir()
+    assert len(list(directory.iterdir())) == 3
+    StyleStore(tmp_path).lookup(TEXTS, STYLE_DICT)
+    assert len(list(directory.iterdir())) == 1
+    assert len(compiles) == 3
+
+def test_dictionary_change_reclassifies(tmp_path, compiles):
+    store = StyleStore(tmp_path)
+    assert store.lookup(['眼泪'], STYLE_DICT)[0].tolist() == ['伤感']
+    changed = {'爱情': ['爱', '爱情', '眼泪'], '伤感': ['情歌']}
+    assert store.lookup(['眼泪'], changed)[0].tolist() == ['爱情']
+    assert compiles == [STYLE_DICT, changed]
+
+def test_style_cache_refills_edited_lyrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(style_store, '_store', StyleStore(tmp_path))
+    songs = [{'id': 1, 'artist': '甲', 'lyric': '眼泪 情歌'}, {'id': 2, 'artist': '乙', 'lyric': '爱情'}]
+    cache = fill_style_cache(songs, StyleCache(), STYLE_DICT)
+    assert cache == {1: '伤感', 2: '爱情'}
+    songs[0] = dict(songs[0], lyric='爱 爱情')
+    assert fill_style_cache(songs, cache, STYLE_DICT) == {1: '爱情', 2: '爱情'}
@@ -0,0 +1,43 @@
+from collections import Counter
+
+from lyrics_analyzer import count_words
+from term_store import TermFrequencyStore
+
+SONGS = [
+    {'id': 1, 'artist': '甲', 'lyric': '夜晚的风很温柔\n城市的灯火'},
+    {'id': 2, 'artist': '甲', 'lyric': '作词：某人\n天空中飘着白云'},
+    {'id': 3, 'artist': '乙', 'lyric': '城市的灯火\n梦想在心里燃烧'},
+    {'id': 4, 'artist': '乙', 'lyric': '编曲：某人'},
+]
+
+def assert_matches_full_count(store, songs):
+    assert store.frequencies() == count_words([song['lyric'] for song in songs])
+    for artist in {song['artist'] for song in songs}:
+        lyrics = [song['lyric'] for song in songs if song['artist'] == artist]
+        assert store.frequencies(artist) == count_words(lyrics)
+        assert store.song_count(artist) == len(lyrics)
+
+def test_store_matches_full_counter():
+    store = TermFrequencyStore().sync(SONGS, workers=1)
+    assert_matches_full_count(store, SONGS)
+    assert store.document_count('乙') == 1
+    assert store.song_frequencies(3) == count_words([SONGS[2]['lyric']])
+
+def test_sync_applies_edits_and_deletions():
+    store = TermFrequencyStore().sync(SONGS, workers=1)
+    edited = [dict(song) for song in SONGS[1:]]
+    edited[0]['lyric'] = '城市的灯火'
+    edited[1]['artist'] = '丙'
+    store.sync(edited, workers=1)
+    assert_matches_full_count(store, edited)
+    assert store.frequencies('乙') == Counter()
+    assert store.song_count() == 3
+
+def test_version_depends_only_on_content():
+    store = TermFrequencyStore().sync(SONGS, workers=1)
+    version, artist_version = store.version(), store.version('甲')
+    assert TermFrequencyStore().sync(SONGS[::-1], workers=1).version() == version
+    store.sync(SONGS[:1] + SONGS[2:], workers=1)
+    assert store.version() != version and store.version('甲') != artist_version
+    store.sync(SONGS, workers=1)
+    assert (store.version(), store.version('甲')) == (version, artist_version)
@@ -0,0 +1,38 @@
+import jieba
+
+from token_cache import TokenCache
+
+LYRICS = ['我们一起走过漫长的路', '夜晚的风很温柔', '天空中飘着白云', '雨水打湿了回忆']
+
+def test_tokens_match_jieba_and_hit_once_cached():
+    cache = TokenCache()
+    for lyric in LYRICS:
+        assert cache.tokens(lyric) == jieba.lcut(lyric)
+    assert cache.tokens(LYRICS[0]) == jieba.lcut(LYRICS[0])
+    assert (cache.hits, cache.misses) == (1, len(LYRICS))
+
+def test_word_ids_are_stable_after_eviction():
+    cache = TokenCache(max_items=1)
+    ids = list(cache.token_ids(LYRICS[0]))
+    cache.tokens(LYRICS[1])
+    assert list(cache.token_ids(LYRICS[0])) == ids
+    assert [cache.word(i) for i in ids] == jieba.lcut(LYRICS[0])
+    assert cache.intern_all(jieba.lcut(LYRICS[0])) == ids
+
+def test_spilled_tokens_survive_restart(tmp_path):
+    cache = TokenCache(max_items=1, spill_dir=str(tmp_path))
+    for lyric in LYRICS:
+        cache.tokens(lyric)
+    # 最后一首还在内存中，其余已溢出到磁盘
+    assert all(lyric in cache for lyric in LYRICS[:-1])
+    restarted = TokenCache(max_items=8, spill_dir=str(tmp_path))
+    for lyric in LYRICS[:-1]:
+        assert restarted.tokens(lyric) == jieba.lcut(lyric)
+    assert (restarted.hits, restarted.misses) == (len(LYRICS) - 1, 0)
+    assert LYRICS[-1] not in restarted
+
+def test_spill_directory_is_bounded(tmp_path):
+    cache = TokenCache(max_items=1, spill_dir=str(tmp_path), max_spill_files=2)
+    for i in range(10):
+        cache.tokens(f'第{i}首歌')
+    assert len(cache._spill_files()) <= 2
@@ -0,0 +1,26 @@
+import os
+
+from wordcloud_service import WordCloudCache
+
+def test_memory_lru_is_bounded():
+    cache = WordCloudCache(max_items=2)
+    for key in 'abc':
+        cache.put(key, key.encode())
+    assert cache.get('a') is None
+    assert cache.get('c') == b'c'
+
+def test_disk_hits_survive_restart(tmp_path):
+    WordCloudCache(disk_dir=str(tmp_path)).put('a', b'png')
+    assert WordCloudCache(disk_dir=str(tmp_path)).get('a') == b'png'
+    assert WordCloudCache(disk_dir=str(tmp_path)).get('b') is None
+
+def test_disk_pruning_follows_last_use(tmp_path):
+    cache = WordCloudCache(max_items=1, disk_dir=str(tmp_path), max_disk_items=2)
+    cache.put('old', b'1')
+    cache.put('new', b'2')
+    # 'old' 写入得更早，但读取后成为最近使用的文件
+    for i, key in enumerate(['old', 'new']):
+        os.utime(cache._disk_path(key), (1000 + i, 1000 + i))
+    assert WordCloudCache(disk_dir=str(tmp_path)).get('old') == b'1'
+    cache.put('third', b'3')
+    assert sorted(os.listdir(tmp_path)) == sorted(['old.png', 'third.png'])
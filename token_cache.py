@@ -0,0 +1,250 @@
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from cache_utils import cache_path, lyric_hash
+from startup import load_jieba
+
+# 溢出到磁盘时词与词之间的分隔符（jieba分词结果中不会出现）
+_SEPARATOR = '\x00'
+
+class TokenCache:
+    """共享的jieba分词缓存
+    - 以歌词内容哈希为键，每首歌词只分词一次
+    - 分词结果以驻留词编号的 array('I') 紧凑保存
+    - LRU淘汰，可选将淘汰的结果溢出到磁盘，重启后无需重新分词
+    - 磁盘上最多保留 max_spill_files 个文件，超出时按修改时间删除最久未用的（读取时会更新修改时间）
+    - 驻留词表不淘汰：KeywordEngine 以词编号作为矩阵列号，编号必须在进程内保持不变。
+      词表大小等于进程处理过的不同词数，受jieba词典和歌词语料限制（通常几十万词、几十MB），不随请求数增长
+    """
+
+    def __init__(self, max_items=4096, spill_dir=None, max_spill_files=200000):
+        self.max_items = max_items
+        self.spill_dir = spill_dir
+        self.max_spill_files = max_spill_files
+        self._spill_count = None  # 磁盘上的文件数，首次溢出时统计
+        self._vocab = {}     # 词 -> 编号
+        self._words = []     # 编号 -> 词
+        self._lru = OrderedDict()  # 歌词哈希 -> array('I')
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def intern(self, word):
+        """返回词的驻留编号，新词分配新编号；编号在进程内不变，词表不淘汰"""
+        word_id = self._vocab.get(word)
+        if word_id is None:
+            word_id = len(self._words)
+            self._vocab[word] = word_id
+            self._words.append(word)
+        return word_id
+
+    def intern_all(self, words):
+        """批量驻留，返回编号列表；与分词写入缓存互斥，可在多线程中调用"""
+        with self._lock:
+            return [self.intern(word) for word in words]
+
+    def word(self, word_id):
+        return self._words[word_id]
+
+    @property
+    def vocabulary_size(self):
+        return len(self._words)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, key[:2], key + '.txt')
+
+    def _load_spilled(self, key):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            # 更新修改时间，清理时按最近使用的先后淘汰
+            os.utime(path)
+        except OSError:
+            return None
+        return content.split(_SEPARATOR) if content else []
+
+    def _spill_files(self):
+        files = []
+        for root, _, names in os.walk(self.spill_dir):
+            files.extend(os.path.join(root, name) for name in names if name.endswith('.txt'))
+        return files
+
+    def _prune_spill(self):
+        """磁盘文件数超过上限时，删除最久未用的文件，保留上限的90%"""
+        files = []
+        for path in self._spill_files():
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        files.sort()
+        excess = len(files) - int(self.max_spill_files * 0.9)
+        for _, path in files[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._spill_count = len(files) - max(excess, 0)
+
+    def _spill(self, key, ids):
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(_SEPARATOR.join(self._words[i] for i in ids))
+        except OSError as e:
+            print(f"分词缓存写入磁盘失败：{e}")
+            return
+        if self._spill_count is None:
+            self._spill_count = len(self._spill_files())
+        else:
+            self._spill_count += 1
+        if self._spill_count > self.max_spill_files:
+            self._prune_spill()
+
+    def _store(self, key, words):
+        ids = array('I', (self.intern(w) for w in words))
+        self._lru[key] = ids
+        while len(self._lru) > self.max_items:
+            old_key, old_ids = self._lru.popitem(last=False)
+            self._spill(old_key, old_ids)
+        return ids
+
+    def put(self, text, words):
+        """写入已分好的词（例如由并行分词得到的结果）"""
+        key = lyric_hash(text)
+        with self._lock:
+            if key not in self._lru:
+                self._store(key, words)
+
+    def __contains__(self, text):
+        key = lyric_hash(text)
+        return key in self._lru or (bool(self.spill_dir) and os.path.exists(self._spill_path(key)))
+
+    def token_ids(self, text):
+        """返回歌词的分词编号序列 array('I')"""
+        key = lyric_hash(text)
+        with self._lock:
+            ids = self._lru.get(key)
+            if ids is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return ids
+            words = self._load_spilled(key)
+        if words is None:
+            # 分词在锁外进行，避免阻塞其他会话
+            words = load_jieba().lcut(text or '')
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+        with self._lock:
+            ids = self._lru.get(key)
+            if ids is None:
+                ids = self._store(key, words)
+            return ids
+
+    def tokens(self, text):
+        """返回歌词的分词结果列表，与 jieba.lcut(text) 一致"""
+        words = self._words
+        return [words[i] for i in self.token_ids(text)]
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_token_cache():
+    """获取进程内共享的分词缓存，容量可通过 LYRICS_TOKEN_CACHE_SIZE、LYRICS_TOKEN_SPILL_FILES 设置"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TokenCache(
+                    max_items=int(os.environ.get('LYRICS_TOKEN_CACHE_SIZE', 4096)),
+                    spill_dir=cache_path('tokens'),
+                    max_spill_files=int(os.environ.get('LYRICS_TOKEN_SPILL_FILES', 200000)),
+                )
+    return _cache
+
+# 并行分词的默认进程数，可通过 LYRICS_SEG_WORKERS 设置
+def default_workers():
+    return int(os.environ.get('LYRICS_SEG_WORKERS', os.cpu_count() or 1))
+
+def _init_worker():
+    # 子进程启动时加载jieba前缀词典（读取缓存文件），之后每个任务直接分词
+    load_jieba().initialize()
+
+def _segment_chunk(texts):
+    jieba = load_jieba()
+    return [jieba.lcut(text or '') for text in texts]
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def _get_pool(workers):
+    """
+    获取进程内共享的分词进程池，进程数不足时重建
+
+    使用 forkserver（不支持时用 spawn）启动子进程：Streamlit 服务是多线程的，
+    直接 fork 可能复制其他线程持有的锁（jieba、分词缓存、logging）导致子进程死锁。
+    子进程由 initializer 各自预先加载jieba词典，进程池在多次调用间复用，只加载一次。
+    """
+    global _pool, _pool_workers
+    import atexit
+    import multiprocessing
+
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            if _pool is not None:
+                _pool.terminate()
+            else:
+                atexit.register(_shutdown_pool)
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = multiprocessing.get_context(method).Pool(workers, initializer=_init_worker)
+            _pool_workers = workers
+        return _pool
+
+def _shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool = None
+
+def parallel_segment(texts, workers=None, chunk_size=64):
+    """
+    多进程分词，按输入顺序逐条产出分词结果
+
+    参数:
+    - texts: 歌词文本列表
+    - workers: 进程数，默认取 LYRICS_SEG_WORKERS 或CPU核数
+    - chunk_size: 每个任务包含的歌词数
+
+    进程数为1或歌词不足两个任务时退化为单进程分词。
+    """
+    workers = default_workers() if workers is None else workers
+    if workers <= 1 or len(texts) <= chunk_size:
+        yield from _segment_chunk(texts)
+        return
+
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    pool = _get_pool(workers)
+    for result in pool.imap(_segment_chunk, chunks):
+        yield from result
+
+def warm_tokens(texts, workers=None, chunk_size=64):
+    """对尚未缓存的歌词并行分词并写入共享分词缓存，返回新分词的歌词数"""
+    cache = get_token_cache()
+    missing = list(dict.fromkeys(text for text in texts if text not in cache))
+    for text, words in zip(missing, parallel_segment(missing, workers, chunk_size)):
+        cache.put(text, words)
+    return len(missing)
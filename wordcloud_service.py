@@ -0,0 +1,166 @@
+import os
+import io
+import platform
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from cache_utils import cache_path, lyric_hash
+
+# 词云默认参数，与页面原先的设置保持一致
+WORDCLOUD_OPTIONS = {
+    'width': 800,
+    'height': 400,
+    'background_color': 'white',
+    'max_words': 200,
+    'max_font_size': 150,
+    'random_state': 42,
+}
+
+@lru_cache(maxsize=1)
+def find_chinese_font():
+    """根据不同操作系统探测可用的中文字体，只探测一次"""
+    if platform.system() == "Windows":
+        font_paths = [
+            'C:/Windows/Fonts/simhei.ttf',  # 黑体
+            'C:/Windows/Fonts/msyh.ttc',    # 微软雅黑
+            'C:/Windows/Fonts/simsun.ttc'   # 宋体
+        ]
+    elif platform.system() == "Darwin":
+        font_paths = [
+            '/System/Library/Fonts/PingFang.ttc',
+            '/System/Library/Fonts/STHeiti Light.ttc'
+        ]
+    else:
+        font_paths = [
+            '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+            '/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf'
+        ]
+    for path in font_paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+def filter_frequencies(word_freq):
+    """过滤掉单字词、纯数字和停用词"""
+    from wordcloud import STOPWORDS
+
+    return {
+        word: freq for word, freq in word_freq.items()
+        if len(word.strip()) > 1 and not word.isdigit() and word.lower() not in STOPWORDS
+    }
+
+def render_wordcloud_png(word_freq, font_path=None):
+    """根据词频直接渲染词云PNG字节，不经过matplotlib图像"""
+    from wordcloud import WordCloud
+
+    words = filter_frequencies(word_freq)
+    if not words:
+        raise ValueError("分词结果为空，无法生成词云")
+    wordcloud = WordCloud(font_path=font_path, **WORDCLOUD_OPTIONS)
+    wordcloud.generate_from_frequencies(words)
+    buffer = io.BytesIO()
+    wordcloud.to_image().save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class WordCloudCache:
+    """词云PNG缓存
+    - 以 (范围, 歌手, 语料版本, 字体) 为键
+    - 内存中为有上限的LRU，同时持久化到磁盘，进程内所有会话共享
+    - 磁盘文件超过 max_disk_items 时删除最久未用的（从磁盘读取时会更新修改时间）
+    """
+
+    def __init__(self, max_items=64, disk_dir=None, max_disk_items=512):
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.max_disk_items = max_disk_items
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(scope, artist, corpus_version, font_path):
+        return lyric_hash(repr((scope, artist, corpus_version, font_path)))
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.png')
+
+    def get(self, key):
+        with self._lock:
+            png = self._lru.get(key)
+            if png is not None:
+                self._lru.move_to_end(key)
+                return png
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+            # 更新修改时间，清理磁盘时按最近使用的先后淘汰
+            os.utime(path)
+        except OSError:
+            return None
+        self._remember(key, png)
+        return png
+
+    def put(self, key, png):
+        self._remember(key, png)
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                with open(self._disk_path(key), 'wb') as f:
+                    f.write(png)
+                self._prune_disk()
+            except OSError as e:
+                print(f"词云缓存写入磁盘失败：{e}")
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._lru[key] = png
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
+
+    def _prune_disk(self):
+        files = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith('.png')]
+        if len(files) <= self.max_disk_items:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_disk_items]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_wordcloud_cache():
+    """获取进程内共享的词云缓存"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = WordCloudCache(disk_dir=cache_path('wordclouds'))
+    return _cache
+
+def get_wordcloud_png(scope, artist, corpus_version, word_freq, font_path=None):
+    """
+    获取词云PNG字节，命中缓存时不重新分词和排版
+
+    参数:
+    - scope: 词云范围，如 "所有歌词"、"按歌手生成"
+    - artist: 歌手名，范围为全部歌词时为 None
+    - corpus_version: 语料版本号，歌词变化时随之变化
+    - word_freq: 词频字典，或返回词频字典的函数（仅在未命中缓存时调用）
+    - font_path: 字体路径，默认自动探测中文字体
+    """
+    font_path = font_path or find_chinese_font()
+    cache = get_wordcloud_cache()
+    key = cache.make_key(scope, artist, corpus_version, font_path)
+    png = cache.get(key)
+    if png is None:
+        if callable(word_freq):
+            word_freq = word_freq()
+        png = render_wordcloud_png(word_freq, font_path)
+        cache.put(key, png)
+    return png